@@ -7,120 +7,930 @@ Sistema de gestión de pedidos y menú
 
 import json
 import sqlite3
-from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta, timezone
+from flask import Flask, Response, request, jsonify, render_template
 from flask_cors import CORS
+import base64
+import bisect
+import gzip
+import hashlib
+import heapq
+import math
+import mimetypes
 import os
+import queue
+import re
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import Future, InvalidStateError, TimeoutError as FutureTimeoutError
 import threading
 import time
 import atexit
 import signal
 
+try:
+    import brotli
+except ImportError:  # Opcional: sin brotli solo se precomprime con gzip
+    brotli = None
+
 # Configuración de la aplicación
-app = Flask(__name__, static_folder='static', template_folder='.')
+# Los estáticos los sirve StaticAssets (con hash y precomprimidos), no Flask
+app = Flask(__name__, static_folder=None, template_folder='.')
 CORS(app)  # Habilitar CORS para requests desde el frontend
 
+# Recursos estáticos servidos desde memoria
+STATIC_DIR = os.path.join(app.root_path, 'static')
+STATIC_MAX_AGE = 365 * 24 * 3600  # Las URLs con hash nunca cambian de contenido
+STATIC_COMPRESS_MIN_SIZE = 512    # Bytes; archivos más chicos no ganan nada comprimidos
+STATIC_COMPRESSIBLE = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+PUBLIC_PAGES = ('index.html', 'chef_panel.html')  # Únicos archivos de la raíz accesibles
+
 # Configuración de la base de datos
-DB_NAME = 'pizza_deprizza.db'
+DB_NAME = os.environ.get('PIZZA_DB', 'pizza_deprizza.db')
+
+# Configuración del pool de conexiones
+DB_POOL_SIZE = 8             # Máximo de conexiones abiertas simultáneamente
+DB_POOL_TIMEOUT = 20.0       # Segundos de espera por una conexión libre
+DB_POOL_HEALTH_CHECK = 30.0  # Segundos de inactividad antes de verificar una conexión
+
+# Recetas: ingredientes del inventario que consume cada pizza del menú (1 unidad por pizza)
+RECIPES_DATA = {
+    1: ["Salsa de tomate", "Mozzarella", "Albahaca"],
+    2: ["Salsa de tomate", "Mozzarella", "Pepperoni"],
+    3: ["Mozzarella", "Queso parmesano", "Gorgonzola", "Queso cabra"],
+    4: ["Salsa de tomate", "Mozzarella", "Jamón", "Piña"],
+    5: ["Salsa de tomate", "Mozzarella", "Pimientos", "Champiñones", "Aceitunas"],
+    6: ["Mozzarella", "Pepperoni", "Jamón"],
+    7: ["Mozzarella", "Aceitunas"],
+    8: ["Salsa de tomate"],
+}
+
+def _recipes_seed_sql():
+    """INSERT que relaciona pizzas e ingredientes por nombre a partir de RECIPES_DATA"""
+    values = ', '.join(
+        "({}, '{}')".format(pizza_id, name.replace("'", "''"))
+        for pizza_id, names in RECIPES_DATA.items() for name in names
+    )
+    return f'''
+        INSERT OR IGNORE INTO pizza_ingredients (pizza_id, ingredient_id, quantity)
+        SELECT r.column1, i.id, 1
+        FROM (VALUES {values}) AS r
+        JOIN ingredients i ON i.name = r.column2
+        JOIN pizzas p ON p.id = r.column1
+    '''
+
+# Migraciones de esquema: (versión, sentencias), aplicadas en orden según PRAGMA user_version
+SCHEMA_MIGRATIONS = [
+    (1, [
+        # Listado del panel de chef: orden cronológico inverso y filtros con desempate por id
+        'CREATE INDEX IF NOT EXISTS idx_orders_created ON orders (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders (status, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_orders_customer_created ON orders (customer_name, created_at, id)',
+    ]),
+    (2, [
+        # Líneas de cada orden normalizadas (antes solo existían dentro de orders.order_data)
+        '''CREATE TABLE IF NOT EXISTS order_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL REFERENCES orders (id),
+            line_no INTEGER NOT NULL,
+            pizza_id INTEGER,
+            name TEXT,
+            size TEXT,
+            size_label TEXT,
+            quantity INTEGER NOT NULL DEFAULT 1,
+            unit_price REAL NOT NULL DEFAULT 0,
+            extra TEXT
+        )''',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_order_items_order ON order_items (order_id, line_no)',
+        'CREATE INDEX IF NOT EXISTS idx_order_items_pizza ON order_items (pizza_id, quantity)',
+        # Estado de procesos de migración en línea (p. ej. el backfill de order_items)
+        '''CREATE TABLE IF NOT EXISTS migration_state (
+            name TEXT PRIMARY KEY,
+            value TEXT
+        )''',
+    ]),
+    (3, [
+        # Rollups de ventas por hora ('YYYY-MM-DD HH') y por día ('YYYY-MM-DD'), en UTC
+        '''CREATE TABLE IF NOT EXISTS sales_rollups (
+            granularity TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            orders_count INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            items_count INTEGER NOT NULL DEFAULT 0,
+            completed_count INTEGER NOT NULL DEFAULT 0,
+            prep_seconds REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (granularity, bucket)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS sales_pizza_rollups (
+            granularity TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            pizza_key TEXT NOT NULL,
+            name TEXT,
+            category TEXT,
+            quantity INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (granularity, bucket, pizza_key)
+        )''',
+        # Histograma de tiempo real de preparación por minuto, para percentiles
+        '''CREATE TABLE IF NOT EXISTS prep_time_histogram (
+            granularity TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            minute INTEGER NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (granularity, bucket, minute)
+        )''',
+    ]),
+    (4, [
+        # Recetas normalizadas (antes solo existía el texto libre pizzas.ingredients)
+        '''CREATE TABLE IF NOT EXISTS pizza_ingredients (
+            pizza_id INTEGER NOT NULL REFERENCES pizzas (id),
+            ingredient_id INTEGER NOT NULL REFERENCES ingredients (id),
+            quantity INTEGER NOT NULL DEFAULT 1,
+            PRIMARY KEY (pizza_id, ingredient_id)
+        ) WITHOUT ROWID''',
+        'CREATE INDEX IF NOT EXISTS idx_pizza_ingredients_ingredient ON pizza_ingredients (ingredient_id, pizza_id)',
+        _recipes_seed_sql(),
+        # Pizzas desactivadas automáticamente por falta de stock (se reactivan al reabastecer)
+        'ALTER TABLE pizzas ADD COLUMN auto_disabled INTEGER NOT NULL DEFAULT 0',
+    ]),
+    (5, [
+        # Registro de cambios de órdenes: su id es el contador de versión que
+        # siguen los workers para mantener sincronizado su estado en memoria
+        '''CREATE TABLE IF NOT EXISTS order_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL,
+            status TEXT,
+            created INTEGER NOT NULL DEFAULT 0
+        )''',
+        '''CREATE TRIGGER IF NOT EXISTS orders_change_insert
+        AFTER INSERT ON orders
+        BEGIN
+            INSERT INTO order_changes (order_id, status, created) VALUES (NEW.id, NEW.status, 1);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS orders_change_status
+        AFTER UPDATE OF status ON orders
+        WHEN NEW.status IS NOT OLD.status
+        BEGIN
+            INSERT INTO order_changes (order_id, status) VALUES (NEW.id, NEW.status);
+        END''',
+        # Concesiones con vencimiento para elegir un único worker líder
+        '''CREATE TABLE IF NOT EXISTS worker_leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )''',
+    ]),
+    (6, [
+        # Conteo de órdenes de la base viva mantenido por triggers (COUNT(*) recorre la tabla)
+        '''CREATE TABLE IF NOT EXISTS order_counts (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            live INTEGER NOT NULL DEFAULT 0
+        )''',
+        'INSERT OR REPLACE INTO order_counts (id, live) SELECT 1, COUNT(*) FROM orders',
+        '''CREATE TRIGGER IF NOT EXISTS orders_count_insert
+        AFTER INSERT ON orders
+        BEGIN
+            UPDATE order_counts SET live = live + 1 WHERE id = 1;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS orders_count_delete
+        AFTER DELETE ON orders
+        BEGIN
+            UPDATE order_counts SET live = live - 1 WHERE id = 1;
+        END''',
+        # Meses movidos a archivos SQLite separados (ver OrderArchive)
+        '''CREATE TABLE IF NOT EXISTS order_archives (
+            month TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            orders_count INTEGER NOT NULL DEFAULT 0,
+            min_id INTEGER,
+            max_id INTEGER,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+    ]),
+]
+
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]  # PRAGMA user_version de una base al día
+
+# Backfill en línea de order_items desde orders.order_data
+ORDER_ITEMS_BACKFILL_BATCH = 500
+ORDER_ITEMS_BACKFILL_PAUSE = 0.05  # Segundos entre lotes para dejar pasar a los escritores
+
+# Analítica de ventas: longitud del prefijo de created_at que define cada bucket
+ANALYTICS_GRANULARITIES = {'hour': 13, 'day': 10}
+PREP_TIME_HISTOGRAM_MAX = 180      # Minutos; tiempos mayores se acumulan en el último bucket
+
+# Archivo de órdenes terminadas antiguas en bases SQLite mensuales
+ARCHIVE_DIR = os.environ.get('PIZZA_ARCHIVE_DIR') or os.path.join(os.path.dirname(os.path.abspath(DB_NAME)), 'archive')
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 90))
+ARCHIVE_WINDOW = os.environ.get('ARCHIVE_WINDOW', '3-6')  # Horas locales de baja demanda (inicio-fin)
+ARCHIVE_CHECK_INTERVAL = 900.0  # Segundos entre verificaciones de la ventana de mantenimiento
+ARCHIVE_BATCH_SIZE = 500        # Órdenes movidas por transacción
+ARCHIVE_BATCH_PAUSE = 0.05      # Segundos entre lotes para dejar pasar a los escritores
+ARCHIVE_MAX_ATTACHED = 8        # Meses adjuntos a la vez (SQLite admite 10 bases por conexión)
+ARCHIVE_VACUUM_PAGES = 2000     # Páginas libres devueltas al sistema por pasada
+
+# Columnas copiadas al archivo (los ids se conservan)
+ARCHIVE_ORDER_COLUMNS = 'id, order_data, total_price, estimated_time, customer_name, payment_method, status, created_at, completed_at'
+ARCHIVE_ITEM_COLUMNS = 'id, order_id, line_no, pizza_id, name, size, size_label, quantity, unit_price, extra'
+ARCHIVE_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS {alias}.orders (
+        id INTEGER PRIMARY KEY,
+        order_data TEXT NOT NULL,
+        total_price REAL NOT NULL,
+        estimated_time INTEGER,
+        customer_name TEXT,
+        payment_method TEXT,
+        status TEXT,
+        created_at TIMESTAMP,
+        completed_at TIMESTAMP
+    )''',
+    '''CREATE TABLE IF NOT EXISTS {alias}.order_items (
+        id INTEGER PRIMARY KEY,
+        order_id INTEGER NOT NULL,
+        line_no INTEGER NOT NULL,
+        pizza_id INTEGER,
+        name TEXT,
+        size TEXT,
+        size_label TEXT,
+        quantity INTEGER NOT NULL DEFAULT 1,
+        unit_price REAL NOT NULL DEFAULT 0,
+        extra TEXT
+    )''',
+    'CREATE UNIQUE INDEX IF NOT EXISTS {alias}.idx_order_items_order ON order_items (order_id, line_no)',
+    'CREATE INDEX IF NOT EXISTS {alias}.idx_orders_created ON orders (created_at, id)',
+    'CREATE INDEX IF NOT EXISTS {alias}.idx_orders_status_created ON orders (status, created_at, id)',
+    'CREATE INDEX IF NOT EXISTS {alias}.idx_orders_customer_created ON orders (customer_name, created_at, id)',
+]
+
+# Configuración del cache del menú
+MENU_CACHE_MAX_AGE = 60       # Segundos que el navegador puede reutilizar el menú
+MENU_CACHE_REVALIDATE = 5.0   # Segundos entre verificaciones de cambios externos en `pizzas`
+
+# Configuración del stream de eventos del panel de chef
+EVENT_BUFFER_SIZE = 1000      # Eventos recientes que se conservan para reconexiones
+EVENT_KEEPALIVE = 15.0        # Segundos entre comentarios keep-alive del stream SSE
+
+# Seguimiento de órdenes por el cliente (/api/orders/<id>/status)
+ORDER_STATUS_MAX_WAIT = 30.0      # Segundos máximos de espera larga con ?wait=
+ORDER_STATUS_CACHE_SIZE = 10000   # Órdenes terminadas cuyo estado se sirve desde memoria
+
+# Transiciones automáticas de estado según el porcentaje del tiempo estimado
+STATUS_TRANSITIONS = ((25, 'preparing'), (50, 'cooking'), (75, 'ready'), (100, 'completed'))
+STATUS_SEQUENCE = ('received', 'preparing', 'cooking', 'ready', 'completed', 'delivered')
+TERMINAL_STATUSES = ('completed', 'delivered')
+PROCESSOR_MAX_SLEEP = 60.0    # Segundos máximos de espera sin transiciones pendientes
+ACTIVE_STATUSES = ('received', 'preparing', 'cooking', 'ready')
+
+# Capacidad de la cocina usada por el planificador para calcular tiempos estimados
+KITCHEN_PREP_STATIONS = int(os.environ.get('KITCHEN_PREP_STATIONS', 2))
+KITCHEN_OVEN_SLOTS = int(os.environ.get('KITCHEN_OVEN_SLOTS', 4))
+KITCHEN_PREP_MINUTES = 4.0        # Preparar la primera pizza de un trabajo
+KITCHEN_PREP_BATCH_MINUTES = 1.0  # Cada pizza idéntica adicional del mismo trabajo
+KITCHEN_BAKE_MINUTES = 10.0       # Hornear una pizza en una ranura del horno
+KITCHEN_HANDOFF_MINUTES = 1.0     # Cortar y empacar después del horno
+KITCHEN_RELEASE_SLACK = 60.0      # Segundos liberados antes de tiempo que justifican replanificar
+KITCHEN_DONE_STATUSES = ('ready',) + TERMINAL_STATUSES
+RECOVERY_BATCH_SIZE = 500     # Órdenes por sentencia al recuperar el estado tras un reinicio
+
+# Paginación del listado de administración
+ADMIN_ORDERS_PAGE_SIZE = 50
+ADMIN_ORDERS_MAX_PAGE_SIZE = 200
+
+# Configuración del escritor de órdenes (group commit)
+ORDER_BATCH_MAX_SIZE = int(os.environ.get('ORDER_BATCH_MAX_SIZE', 64))
+ORDER_BATCH_MAX_WAIT_MS = float(os.environ.get('ORDER_BATCH_MAX_WAIT_MS', 2))
+ORDER_WRITE_TIMEOUT = 30.0    # Segundos que una petición espera a que su lote se confirme
+ORDER_BULK_MAX_SIZE = 200     # Órdenes aceptadas por petición en /api/orders/batch
+
+# Control de admisión: concurrencia acotada por carril antes de llegar a SQLite
+ADMISSION_READ_LIMIT = int(os.environ.get('ADMISSION_READ_LIMIT', DB_POOL_SIZE - 2))
+ADMISSION_WRITE_LIMIT = int(os.environ.get('ADMISSION_WRITE_LIMIT', 16))
+ADMISSION_READ_QUEUE = 64       # Peticiones que pueden esperar turno en cada carril
+ADMISSION_WRITE_QUEUE = 128
+ADMISSION_READ_BUDGET_MS = float(os.environ.get('ADMISSION_READ_BUDGET_MS', 1000))
+ADMISSION_WRITE_BUDGET_MS = float(os.environ.get('ADMISSION_WRITE_BUDGET_MS', 2000))
+ADMISSION_RETRY_AFTER_MAX = 30  # Segundos máximos sugeridos en Retry-After
+ADMISSION_PRIORITIES = ('high', 'normal', 'low')
+# Carril y prioridad por endpoint; los que no figuran (páginas, estáticos,
+# /metrics y el stream SSE) no pasan por el control de admisión
+ADMISSION_ROUTES = {
+    # Escrituras: las órdenes de clientes y los cambios del chef van primero
+    'create_order': ('write', 'high'),
+    'create_orders_batch': ('write', 'high'),
+    'update_order_status': ('write', 'high'),
+    'update_orders_status_batch': ('write', 'high'),
+    'update_pizza_availability': ('write', 'normal'),
+    'admin_update_ingredient_stock': ('write', 'normal'),
+    'analytics_rebuild': ('write', 'low'),
+    'admin_archive_run': ('write', 'low'),
+    # Lecturas de clientes
+    'get_menu': ('read', 'normal'),
+    'get_orders_status': ('read', 'normal'),
+    'get_order_status': ('read', 'normal'),
+    'check_ingredients': ('read', 'normal'),
+    # Listados de administración y depuración
+    'admin_get_orders': ('read', 'low'),
+    'admin_get_ingredients': ('read', 'low'),
+    'admin_kitchen_queue': ('read', 'low'),
+    'analytics_summary': ('read', 'low'),
+    'analytics_pizzas': ('read', 'low'),
+    'admin_archive': ('read', 'low'),
+    'admin_slow_queries': ('read', 'low'),
+    'debug_orders': ('read', 'low'),
+}
+
+# Persistencia del estado del restaurante (se sirve desde memoria)
+STATUS_PERSIST_INTERVAL = 30.0  # Segundos entre escrituras de la instantánea a la tabla
+
+# Métricas (/metrics): límites de los buckets de los histogramas
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LAG_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+QUERY_LABEL_CACHE_SIZE = 1000  # Consultas distintas cuyo label se recuerda
+
+# Log de consultas lentas (/api/admin/slow-queries)
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_MS', 50))
+SLOW_QUERY_LOG_SIZE = 200      # Entradas recientes que se conservan en memoria
+SLOW_QUERY_LOG_FILE = os.environ.get('SLOW_QUERY_LOG')  # Archivo JSON Lines opcional
+
+# Modo multi-worker (ver serve.py): SQLite es la fuente de verdad del estado de órdenes
+SHARED_STATE = os.environ.get('PIZZA_SHARED_STATE') == '1'
+SHARED_STATE_POLL_INTERVAL = 0.25  # Segundos entre lecturas del registro de cambios
+SHARED_STATE_BATCH = 500           # Cambios aplicados por lectura
+ORDER_CHANGES_RETENTION = 10000    # Cambios que se conservan en order_changes
+LEADER_LEASE_TTL = 15.0            # Segundos que dura la concesión del procesador sin renovarse
+LEADER_LEASE_RENEW = 5.0           # Segundos entre renovaciones de la concesión
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=''):
+    """Labels en formato de exposición de Prometheus"""
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class Counter:
+    """Contador monótono por combinación de labels"""
+    
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+    
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in sorted(values):
+            lines.append(f'{self.name}{_format_labels(self.labels, labels)} {value}')
+        return lines
+
+class Histogram:
+    """Histograma acumulativo con buckets fijos por combinación de labels
+    
+    observe() es una búsqueda binaria y tres sumas bajo un lock, así que se
+    puede dejar activo en producción.
+    """
+    
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # labels -> [conteo por bucket (+Inf al final), suma, total]
+        self._series = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value, labels=()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+    
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+        for labels, counts, total, count in sorted(series, key=lambda entry: entry[0]):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labels, labels, f'le="{bound}"')
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            plain = _format_labels(self.labels, labels)
+            lines.append(f'{self.name}_sum{plain} {total}')
+            lines.append(f'{self.name}_count{plain} {count}')
+        return lines
+
+class Gauge:
+    """Valor instantáneo calculado al momento de la consulta"""
+    
+    def __init__(self, name, help_text, read):
+        self.name = name
+        self.help_text = help_text
+        self.read = read
+    
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} gauge']
+        try:
+            lines.append(f'{self.name} {self.read()}')
+        except Exception as e:
+            print(f"Error al leer la métrica {self.name}: {e}")
+        return lines
+
+class MetricsRegistry:
+    """Métricas del proceso expuestas en /metrics (formato de texto de Prometheus)"""
+    
+    def __init__(self):
+        self._metrics = []
+    
+    def counter(self, name, help_text, labels=()):
+        metric = Counter(name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+    
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help_text, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+    
+    def gauge(self, name, help_text, read):
+        metric = Gauge(name, help_text, read)
+        self._metrics.append(metric)
+        return metric
+    
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+HTTP_REQUESTS = metrics.counter(
+    'pizza_http_requests_total', 'Peticiones HTTP atendidas', ('method', 'route', 'status'))
+HTTP_LATENCY = metrics.histogram(
+    'pizza_http_request_duration_seconds', 'Latencia de las peticiones HTTP', ('method', 'route'))
+DB_QUERY_LATENCY = metrics.histogram(
+    'pizza_db_query_duration_seconds', 'Duración de las consultas de execute_with_retry', ('operation', 'table'))
+DB_QUERY_RETRIES = metrics.counter(
+    'pizza_db_query_retries_total', 'Reintentos de execute_with_retry', ('operation', 'table'))
+DB_QUERY_ERRORS = metrics.counter(
+    'pizza_db_query_errors_total', 'Consultas de execute_with_retry que terminaron en error', ('operation', 'table'))
+DB_LOCK_WAIT = metrics.histogram(
+    'pizza_sqlite_lock_wait_seconds', 'Espera por el lock de escritura de SQLite (BEGIN IMMEDIATE)', ('site',))
+DB_BUSY_ERRORS = metrics.counter(
+    'pizza_sqlite_busy_errors_total', 'Errores "database is locked" tras agotar el busy timeout')
+DB_POOL_WAIT = metrics.histogram(
+    'pizza_db_pool_wait_seconds', 'Espera por una conexión libre del pool')
+ORDER_WRITE_BATCH = metrics.histogram(
+    'pizza_order_write_batch_size', 'Órdenes confirmadas por transacción del escritor', buckets=BATCH_SIZE_BUCKETS)
+SLOW_QUERIES = metrics.counter(
+    'pizza_slow_queries_total', 'Sentencias que superaron el umbral del log de consultas lentas')
+TRANSITION_LAG = metrics.histogram(
+    'pizza_order_transition_lag_seconds', 'Retraso de las transiciones de estado respecto a su hora prevista',
+    buckets=LAG_BUCKETS)
+ADMISSION_WAIT = metrics.histogram(
+    'pizza_admission_wait_seconds', 'Espera en la cola del control de admisión', ('lane',))
+REQUESTS_SHED = metrics.counter(
+    'pizza_admission_shed_total', 'Peticiones rechazadas con 503 por el control de admisión',
+    ('lane', 'priority', 'reason'))
+
+_query_labels = {}
+
+def query_label(query):
+    """(operación, tabla principal) de una consulta, cacheado por texto"""
+    label = _query_labels.get(query)
+    if label is None:
+        operation = query.split(None, 1)[0].upper() if query.strip() else ''
+        match = re.search(r'\b(?:FROM|INTO|UPDATE)\s+(\w+)', query, re.IGNORECASE)
+        label = (operation, match.group(1) if match else '')
+        if len(_query_labels) < QUERY_LABEL_CACHE_SIZE:
+            _query_labels[query] = label
+    return label
+
+def normalize_sql(sql):
+    """SQL sin literales ni espacios redundantes; las listas IN (?, ?, ...) se colapsan"""
+    text = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    text = re.sub(r'\b\d+(?:\.\d+)?\b', '?', text)
+    text = re.sub(r'\(\s*\?(?:\s*,\s*\?)+\s*\)', '(?, ...)', text)
+    return ' '.join(text.split())
+
+def params_shape(params):
+    """Tipos de los parámetros sin sus valores (p. ej. 'int, str' o '500 x int')"""
+    if not params:
+        return ''
+    if isinstance(params, dict):
+        return ', '.join(f'{key}: {type(value).__name__}' for key, value in params.items())
+    types = [type(value).__name__ for value in params]
+    if len(types) > 10:
+        return ', '.join(f'{types.count(name)} x {name}' for name in sorted(set(types)))
+    return ', '.join(types)
+
+class SlowQueryLog:
+    """Registro circular de sentencias que superan el umbral
+    
+    La primera vez que aparece una huella (SQL normalizado) lenta se guarda su
+    EXPLAIN QUERY PLAN, con las tablas recorridas completas (`full_scan`) y si
+    ordena o agrupa en un B-tree temporal (`temp_btree`).
+    """
+    
+    PLANNABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH')
+    
+    def __init__(self, threshold_ms=SLOW_QUERY_THRESHOLD_MS, size=SLOW_QUERY_LOG_SIZE,
+                 path=SLOW_QUERY_LOG_FILE):
+        self.threshold = threshold_ms / 1000.0
+        self.path = path
+        self._entries = deque(maxlen=size)
+        self._fingerprints = {}
+        self._normalized = {}
+        self._lock = threading.Lock()
+    
+    def _normalize(self, sql):
+        normalized = self._normalized.get(sql)
+        if normalized is None:
+            normalized = normalize_sql(sql)
+            if len(self._normalized) < QUERY_LABEL_CACHE_SIZE:
+                self._normalized[sql] = normalized
+        return normalized
+    
+    def _explain(self, conn, sql, params):
+        """Plan de ejecución y tablas recorridas completas, sin pasar por el cursor instrumentado"""
+        cursor = sqlite3.Cursor(conn)
+        try:
+            plan = [row[3] for row in cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params or ())]
+            # 'SCAN x' sin índice; x puede ser una subconsulta materializada, no una tabla
+            scanned = {
+                match.group(1) for match in (re.match(r'SCAN (\w+)$', step) for step in plan) if match
+            }
+            tables = [
+                name for name in scanned
+                if cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone()
+            ]
+        except sqlite3.Error as e:
+            return [f'(sin plan: {e})'], []
+        return plan, sorted(tables)
+    
+    def record(self, conn, sql, params, elapsed, rows=None):
+        """Registrar una sentencia ya ejecutada si superó el umbral"""
+        if elapsed < self.threshold:
+            return
+        SLOW_QUERIES.inc()
+        normalized = self._normalize(sql)
+        fingerprint = hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:12]
+        
+        with self._lock:
+            stats = self._fingerprints.get(fingerprint)
+            new_fingerprint = stats is None
+            if new_fingerprint:
+                stats = self._fingerprints[fingerprint] = {
+                    'fingerprint': fingerprint, 'sql': normalized, 'count': 0,
+                    'total_ms': 0.0, 'max_ms': 0.0, 'plan': None,
+                    'full_scan': [], 'temp_btree': False
+                }
+        
+        if new_fingerprint and normalized.split(' ', 1)[0].upper() in self.PLANNABLE:
+            plan, full_scans = self._explain(conn, sql, params)
+            stats['plan'] = plan
+            stats['full_scan'] = full_scans
+            stats['temp_btree'] = any('TEMP B-TREE' in step for step in plan)
+        
+        elapsed_ms = round(elapsed * 1000, 2)
+        entry = {
+            'timestamp': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+            'fingerprint': fingerprint,
+            'sql': normalized,
+            'params': params_shape(params),
+            'duration_ms': elapsed_ms,
+            'rows': rows
+        }
+        with self._lock:
+            stats['count'] += 1
+            stats['total_ms'] = round(stats['total_ms'] + elapsed_ms, 2)
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            self._entries.append(entry)
+            if self.path:
+                try:
+                    with open(self.path, 'a') as f:
+                        f.write(json.dumps(dict(entry, plan=stats['plan'])) + '\n')
+                except OSError as e:
+                    print(f"Error al escribir el log de consultas lentas: {e}")
+    
+    def report(self, limit=50):
+        """Entradas recientes y huellas ordenadas por tiempo acumulado"""
+        with self._lock:
+            entries = list(self._entries)[-limit:][::-1]
+            fingerprints = sorted(
+                (dict(stats) for stats in self._fingerprints.values()),
+                key=lambda stats: stats['total_ms'], reverse=True
+            )
+        return {
+            'threshold_ms': round(self.threshold * 1000, 2),
+            'entries': entries,
+            'fingerprints': fingerprints
+        }
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._fingerprints.clear()
+
+slow_queries = SlowQueryLog()
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor que mide cada sentencia y reporta las lentas a slow_queries
+    
+    Los SELECT se miden hasta fetchall() cuando se usa; si se recorren de otra
+    forma solo cuenta la ejecución inicial (que incluye ordenar sin índice).
+    """
+    
+    _pending = None
+    
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        elapsed = time.perf_counter() - started
+        
+        if self.description is None or elapsed >= slow_queries.threshold:
+            rows = self.rowcount if self.description is None else None
+            slow_queries.record(self.connection, sql, parameters, elapsed, rows)
+            self._pending = None
+        else:
+            self._pending = (sql, parameters, elapsed)
+        return self
+    
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        slow_queries.record(self.connection, sql, None, time.perf_counter() - started, self.rowcount)
+        return self
+    
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        if self._pending is not None:
+            sql, parameters, elapsed = self._pending
+            self._pending = None
+            slow_queries.record(self.connection, sql, parameters,
+                                elapsed + time.perf_counter() - started, len(rows))
+        return rows
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Conexión cuyos atajos execute/executemany usan InstrumentedCursor"""
+    
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+    
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+class ConnectionPool:
+    """Pool acotado de conexiones SQLite reutilizables"""
+    
+    def __init__(self, db_name, max_size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT,
+                 health_check_interval=DB_POOL_HEALTH_CHECK):
+        self.db_name = db_name
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        # Conexiones libres como (conexión, instante en que se devolvió)
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._all = set()
+        self._closed = False
+    
+    def _create_connection(self):
+        """Abrir una conexión nueva y configurarla una sola vez"""
+        conn = sqlite3.connect(
+            self.db_name,
+            timeout=20.0,  # Timeout de 20 segundos
+            check_same_thread=False,
+            factory=InstrumentedConnection
+        )
+        
+        # Solo tiene efecto en una base nueva y antes de activar WAL; en bases
+        # existentes OrderArchive.compact() hace un VACUUM completo una única vez
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL;')
+        
+        # Configurar WAL mode para mejor concurrencia
+        conn.execute('PRAGMA journal_mode=WAL;')
+        conn.execute('PRAGMA synchronous=NORMAL;')
+        conn.execute('PRAGMA cache_size=1000;')
+        conn.execute('PRAGMA temp_store=memory;')
+        
+        with self._lock:
+            self._all.add(conn)
+        return conn
+    
+    def _discard(self, conn):
+        """Cerrar y olvidar una conexión"""
+        with self._lock:
+            self._all.discard(conn)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+    
+    def _is_healthy(self, conn):
+        """Verificar que una conexión inactiva siga respondiendo"""
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+    
+    def acquire(self):
+        """Tomar una conexión del pool (o crear una si hay cupo)"""
+        if self._closed:
+            raise sqlite3.OperationalError("El pool de conexiones está cerrado")
+        started = time.perf_counter()
+        acquired = self._slots.acquire(timeout=self.timeout)
+        DB_POOL_WAIT.observe(time.perf_counter() - started)
+        if not acquired:
+            raise sqlite3.OperationalError("Tiempo de espera agotado por una conexión libre")
+        
+        try:
+            while True:
+                try:
+                    conn, released_at = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._create_connection()
+                
+                # Solo verificar conexiones que estuvieron inactivas un tiempo
+                if time.monotonic() - released_at < self.health_check_interval or self._is_healthy(conn):
+                    return conn
+                self._discard(conn)
+        except Exception:
+            self._slots.release()
+            raise
+    
+    def release(self, conn, discard=False):
+        """Devolver una conexión al pool"""
+        try:
+            if not discard and conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            discard = True
+        
+        if discard or self._closed:
+            self._discard(conn)
+        else:
+            self._idle.put((conn, time.monotonic()))
+        self._slots.release()
+    
+    @contextmanager
+    def connection(self):
+        """Context manager que presta una conexión y la devuelve al terminar"""
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except sqlite3.DatabaseError as e:
+            # Una conexión con errores de disco no se reutiliza
+            broken = "disk I/O error" in str(e) or "malformed" in str(e)
+            raise
+        finally:
+            self.release(conn, discard=broken)
+    
+    def open_connections(self):
+        """Conexiones abiertas (prestadas o libres)"""
+        with self._lock:
+            return len(self._all)
+    
+    def close_all(self):
+        """Cerrar todas las conexiones abiertas"""
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+        with self._lock:
+            remaining = list(self._all)
+            self._all.clear()
+        for conn in remaining:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+    
+    def reset(self):
+        """Cerrar todas las conexiones y volver a aceptar préstamos"""
+        self.close_all()
+        self._closed = False
+
+# Campos de un item del carrito que tienen columna propia en order_items
+ORDER_ITEM_COLUMNS = ('id', 'name', 'size', 'sizeLabel', 'quantity', 'price')
+
+def order_item_rows(order_id, items):
+    """Convertir los items de una orden en filas de order_items"""
+    rows = []
+    for line_no, item in enumerate(items):
+        pizza_id = item.get('id')
+        extra = {key: value for key, value in item.items() if key not in ORDER_ITEM_COLUMNS}
+        # Las pizzas personalizadas usan ids de texto: se conservan en `extra`
+        if not isinstance(pizza_id, int) or isinstance(pizza_id, bool):
+            if pizza_id is not None:
+                extra['id'] = pizza_id
+            pizza_id = None
+        rows.append((
+            order_id,
+            line_no,
+            pizza_id,
+            item.get('name'),
+            item.get('size'),
+            item.get('sizeLabel'),
+            item.get('quantity', 1),
+            item.get('price', 0),
+            json.dumps(extra) if extra else None
+        ))
+    return rows
+
+def order_item_from_row(row):
+    """Reconstruir el item del carrito a partir de (pizza_id, name, size, size_label, quantity, unit_price, extra)"""
+    pizza_id, name, size, size_label, quantity, unit_price, extra = row
+    item = {
+        key: value for key, value in (
+            ('id', pizza_id),
+            ('name', name),
+            ('size', size),
+            ('sizeLabel', size_label),
+            ('quantity', quantity),
+            ('price', unit_price)
+        ) if value is not None
+    }
+    if extra:
+        item.update(json.loads(extra))
+    return item
 
 class PizzaDePrizzaDB:
     """Manejador de base de datos para Pizza Deprizza"""
     
     def __init__(self, db_name):
         self.db_name = db_name
-        self.connection_pool = []
+        self.ensure_directory()
+        self.connection_pool = ConnectionPool(db_name)
         self.init_database()
     
-    def get_connection(self):
-        """Obtener conexión con manejo de errores mejorado"""
-        try:
-            # Verificar que el directorio existe
-            db_dir = os.path.dirname(os.path.abspath(self.db_name))
-            if not os.path.exists(db_dir):
-                os.makedirs(db_dir)
-            
-            # Crear conexión con configuración mejorada
-            conn = sqlite3.connect(
-                self.db_name,
-                timeout=20.0,  # Timeout de 20 segundos
-                check_same_thread=False
-            )
-            
-            # Configurar WAL mode para mejor concurrencia
-            conn.execute('PRAGMA journal_mode=WAL;')
-            conn.execute('PRAGMA synchronous=NORMAL;')
-            conn.execute('PRAGMA cache_size=1000;')
-            conn.execute('PRAGMA temp_store=memory;')
-            
-            return conn
-        except sqlite3.Error as e:
-            print(f"Error al conectar con la base de datos: {e}")
-            raise
+    def ensure_directory(self):
+        """Verificar que el directorio de la base de datos existe"""
+        db_dir = os.path.dirname(os.path.abspath(self.db_name))
+        if not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+    
+    @contextmanager
+    def connection(self):
+        """Prestar una conexión del pool; confirma al salir o revierte si hay error"""
+        with self.connection_pool.connection() as conn:
+            try:
+                yield conn
+                if conn.in_transaction:
+                    conn.commit()
+            except Exception:
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
     
     def init_database(self):
-        """Inicializar tablas de la base de datos con manejo de errores"""
+        """Inicializar tablas de la base de datos con manejo de errores
+        
+        Una base con PRAGMA user_version en la última migración ya tiene el
+        esquema y los datos iniciales: se abre sin ejecutar ningún DDL.
+        """
         max_retries = 3
         for attempt in range(max_retries):
             try:
-                conn = self.get_connection()
-                cursor = conn.cursor()
-                
-                # Tabla de pizzas del menú
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS pizzas (
-                        id INTEGER PRIMARY KEY,
-                        name TEXT NOT NULL,
-                        category TEXT NOT NULL,
-                        emoji TEXT,
-                        ingredients TEXT,
-                        price REAL NOT NULL,
-                        time_range TEXT,
-                        available INTEGER DEFAULT 1
-                    )
-                ''')
-                
-                # Tabla de órdenes
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS orders (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        order_data TEXT NOT NULL,
-                        total_price REAL NOT NULL,
-                        estimated_time INTEGER,
-                        customer_name TEXT,
-                        payment_method TEXT,
-                        status TEXT DEFAULT 'received',
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        completed_at TIMESTAMP NULL
-                    )
-                ''')
-                
-                # Tabla de ingredientes
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS ingredients (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT UNIQUE NOT NULL,
-                        stock INTEGER DEFAULT 100,
-                        min_stock INTEGER DEFAULT 10,
-                        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                
-                # Tabla de estado del restaurante
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS restaurant_status (
-                        id INTEGER PRIMARY KEY,
-                        current_orders INTEGER DEFAULT 0,
-                        average_wait_time INTEGER DEFAULT 25,
-                        status TEXT DEFAULT 'Operando normalmente',
-                        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                
-                conn.commit()
-                conn.close()
-                
-                # Insertar datos iniciales si no existen
-                self.populate_initial_data()
+                with self.connection() as conn:
+                    if conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+                        return
+                    
+                    # Tablas base y datos iniciales en una sola transacción; con
+                    # varios workers arrancando a la vez el resto espera y no repite nada
+                    self.begin_immediate(conn, 'bootstrap')
+                    self.create_tables(conn.cursor())
+                    
+                    # Insertar datos iniciales si no existen (antes de las migraciones,
+                    # que pueden derivar datos de ellos, como las recetas)
+                    self.populate_initial_data(conn)
+                    conn.commit()
+                    
+                    self.apply_migrations(conn)
                 print("Base de datos inicializada correctamente")
                 return
                 
@@ -132,11 +942,185 @@ class PizzaDePrizzaDB:
                 else:
                     time.sleep(1)  # Esperar antes del siguiente intento
     
+    def create_tables(self, cursor):
+        """Crear las tablas de la base de datos si no existen"""
+        # Tabla de pizzas del menú
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS pizzas (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                category TEXT NOT NULL,
+                emoji TEXT,
+                ingredients TEXT,
+                price REAL NOT NULL,
+                time_range TEXT,
+                available INTEGER DEFAULT 1
+            )
+        ''')
+        
+        # Tabla de órdenes
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS orders (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                order_data TEXT NOT NULL,
+                total_price REAL NOT NULL,
+                estimated_time INTEGER,
+                customer_name TEXT,
+                payment_method TEXT,
+                status TEXT DEFAULT 'received',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                completed_at TIMESTAMP NULL
+            )
+        ''')
+        
+        # Tabla de ingredientes
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ingredients (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT UNIQUE NOT NULL,
+                stock INTEGER DEFAULT 100,
+                min_stock INTEGER DEFAULT 10,
+                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Tabla de estado del restaurante
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS restaurant_status (
+                id INTEGER PRIMARY KEY,
+                current_orders INTEGER DEFAULT 0,
+                average_wait_time INTEGER DEFAULT 25,
+                status TEXT DEFAULT 'Operando normalmente',
+                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Versión del menú: los triggers la incrementan con cualquier cambio en `pizzas`
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS menu_version (
+                id INTEGER PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute('INSERT OR IGNORE INTO menu_version (id, version) VALUES (1, 0)')
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS pizzas_menu_version_{event.lower()}
+                AFTER {event} ON pizzas
+                BEGIN
+                    UPDATE menu_version SET version = version + 1 WHERE id = 1;
+                END
+            ''')
+    
+    def apply_migrations(self, conn):
+        """Aplicar las migraciones pendientes, cada una en su propia transacción"""
+        current = conn.execute('PRAGMA user_version').fetchone()[0]
+        for version, statements in SCHEMA_MIGRATIONS:
+            if version <= current:
+                continue
+            
+            # Con varios workers arrancando a la vez solo uno aplica cada migración
+            self.begin_immediate(conn, 'migrations')
+            try:
+                if conn.execute('PRAGMA user_version').fetchone()[0] >= version:
+                    conn.rollback()
+                    continue
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {version}')
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                raise
+            print(f"Migración de esquema {version} aplicada")
+    
+    def backfill_order_items(self, batch_size=ORDER_ITEMS_BACKFILL_BATCH):
+        """Poblar order_items desde orders.order_data en lotes cortos
+        
+        Cada lote es una transacción independiente y el avance se guarda en
+        migration_state, así que se puede interrumpir y reanudar sin bloquear
+        a los escritores. Devuelve el número de órdenes migradas.
+        """
+        migrated = 0
+        while True:
+            with self.connection() as conn:
+                state = conn.execute(
+                    "SELECT value FROM migration_state WHERE name = 'order_items_backfill'"
+                ).fetchone()
+                if state and state[0] == 'done':
+                    return migrated
+                last_id = int(state[0]) if state else 0
+                
+                rows = conn.execute('''
+                    SELECT id, order_data FROM orders
+                    WHERE id > ? AND NOT EXISTS (SELECT 1 FROM order_items WHERE order_id = orders.id)
+                    ORDER BY id
+                    LIMIT ?
+                ''', (last_id, batch_size)).fetchall()
+                
+                item_rows = []
+                for order_id, order_data in rows:
+                    try:
+                        items = json.loads(order_data) if order_data else []
+                    except ValueError:
+                        items = []
+                    item_rows.extend(order_item_rows(order_id, items))
+                
+                conn.executemany('''
+                    INSERT OR IGNORE INTO order_items
+                        (order_id, line_no, pizza_id, name, size, size_label, quantity, unit_price, extra)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', item_rows)
+                
+                value = str(rows[-1][0]) if len(rows) == batch_size else 'done'
+                conn.execute('''
+                    INSERT OR REPLACE INTO migration_state (name, value) VALUES ('order_items_backfill', ?)
+                ''', (value,))
+                migrated += len(rows)
+            
+            if value == 'done':
+                if migrated:
+                    print(f"Backfill de order_items completado: {migrated} órdenes")
+                return migrated
+            time.sleep(ORDER_ITEMS_BACKFILL_PAUSE)
+    
+    def start_order_items_backfill(self):
+        """Ejecutar el backfill de order_items en hilo separado"""
+        def run_backfill():
+            try:
+                self.backfill_order_items()
+            except Exception as e:
+                print(f"Error en backfill de order_items: {e}")
+        
+        thread = threading.Thread(target=run_backfill, daemon=True)
+        thread.start()
+        return thread
+    
+    def fetch_order_items(self, order_ids):
+        """Items de varias órdenes en una sola consulta: {order_id: [items]}"""
+        items = {}
+        if not order_ids:
+            return items
+        
+        result = self.execute_with_retry(f'''
+            SELECT order_id, pizza_id, name, size, size_label, quantity, unit_price, extra
+            FROM order_items
+            WHERE order_id IN ({', '.join('?' * len(order_ids))})
+            ORDER BY order_id, line_no
+        ''', list(order_ids), fetch=True)
+        
+        for row in result:
+            items.setdefault(row[0], []).append(order_item_from_row(row[1:]))
+        return items
+    
     def recover_database(self):
         """Intentar recuperar base de datos corrupta"""
         try:
             print("Intentando recuperar base de datos...")
             
+            # Cerrar las conexiones del pool antes de mover el archivo
+            self.connection_pool.reset()
+            
             # Hacer backup del archivo corrupto
             if os.path.exists(self.db_name):
                 backup_name = f"{self.db_name}.backup_{int(time.time())}"
@@ -144,8 +1128,8 @@ class PizzaDePrizzaDB:
                 print(f"Backup creado: {backup_name}")
             
             # Crear nueva base de datos
-            conn = self.get_connection()
-            conn.close()
+            with self.connection():
+                pass
             print("Nueva base de datos creada")
             
             # Reintentar inicialización
@@ -155,167 +1139,1701 @@ class PizzaDePrizzaDB:
             print(f"Error en recuperación de base de datos: {e}")
             raise
     
-    def execute_with_retry(self, query, params=None, fetch=False):
-        """Ejecutar query con reintentos automáticos"""
-        max_retries = 3
+    def execute_with_retry(self, query, params=None, fetch=False, max_retries=3):
+        """Ejecutar query con reintentos automáticos
         
+        Con max_retries=1 no hay backoff: el llamador decide cómo reintentar
+        (p. ej. el modo asíncrono, que espera sin bloquear un hilo).
+        """
+        labels = query_label(query)
         for attempt in range(max_retries):
+            started = time.perf_counter()
             try:
-                conn = self.get_connection()
-                cursor = conn.cursor()
-                
-                if params:
-                    cursor.execute(query, params)
-                else:
-                    cursor.execute(query)
-                
-                if fetch:
-                    result = cursor.fetchall()
-                    conn.close()
-                    return result
-                else:
-                    result = cursor.lastrowid if cursor.lastrowid else cursor.rowcount
-                    conn.commit()
-                    conn.close()
-                    return result
+                with self.connection() as conn:
+                    cursor = conn.cursor()
+                    
+                    if params:
+                        cursor.execute(query, params)
+                    else:
+                        cursor.execute(query)
+                    
+                    if fetch:
+                        return cursor.fetchall()
+                    
+                    # En conexiones reutilizadas lastrowid conserva el valor del
+                    # último INSERT, así que solo se usa para inserciones reales
+                    is_insert = query.lstrip().upper().startswith(('INSERT', 'REPLACE'))
+                    if is_insert and cursor.rowcount > 0:
+                        return cursor.lastrowid
+                    return cursor.rowcount
                     
             except sqlite3.Error as e:
-                if conn:
-                    conn.close()
-                
+                if "database is locked" in str(e):
+                    DB_BUSY_ERRORS.inc()
                 if "disk I/O error" in str(e):
                     print(f"Error de I/O en intento {attempt + 1}: {e}")
                     if attempt < max_retries - 1:
+                        DB_QUERY_RETRIES.inc(labels)
                         time.sleep(2 ** attempt)  # Backoff exponencial
                         continue
                 
+                DB_QUERY_ERRORS.inc(labels)
                 print(f"Error en base de datos: {e}")
                 raise
+            finally:
+                DB_QUERY_LATENCY.observe(time.perf_counter() - started, labels)
     
-    def populate_initial_data(self):
-        """Poblar la base de datos con datos iniciales"""
+    def begin_immediate(self, conn, site):
+        """Abrir una transacción de escritura midiendo la espera por el lock"""
+        started = time.perf_counter()
         try:
-            # Verificar si ya hay datos de pizzas
-            result = self.execute_with_retry("SELECT COUNT(*) FROM pizzas", fetch=True)
-            if result[0][0] > 0:
-                return
-                
-            # Datos del menú
-            pizzas_data = [
-                (1, "Margherita Clásica", "clasica", "🍕", "Salsa de tomate, mozzarella fresca, albahaca, aceite de oliva", 189.00, "15-20 min"),
-                (2, "Pepperoni Supreme", "clasica", "🍕", "Salsa de tomate, mozzarella, pepperoni extra, orégano", 219.00, "18-23 min"),
-                (3, "Cuatro Quesos", "premium", "🧀", "Salsa blanca, mozzarella, parmesano, gorgonzola, queso cabra", 269.00, "20-25 min"),
-                (4, "Hawaiana Tropical", "clasica", "🍍", "Salsa de tomate, mozzarella, jamón, piña natural", 239.00, "16-21 min"),
-                (5, "Vegetariana Garden", "veggie", "🥬", "Salsa de tomate, mozzarella, pimientos, champiñones, cebolla, aceitunas", 229.00, "17-22 min"),
-                (6, "Meat Lovers", "premium", "🥩", "Salsa BBQ, mozzarella, pepperoni, salchicha, jamón, tocino", 299.00, "22-27 min"),
-                (7, "Mediterránea", "premium", "🫒", "Salsa pesto, mozzarella, tomates cherry, aceitunas, rúcula, queso feta", 279.00, "19-24 min"),
-                (8, "Vegana Delight", "veggie", "🌱", "Salsa de tomate, queso vegano, vegetales asados, espinacas", 259.00, "20-25 min")
-            ]
-            
-            for pizza_data in pizzas_data:
-                self.execute_with_retry('''
-                    INSERT OR IGNORE INTO pizzas (id, name, category, emoji, ingredients, price, time_range)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', pizza_data)
-            
-            # Datos de ingredientes iniciales
-            ingredients_data = [
-                ("Salsa de tomate", 150),
-                ("Mozzarella", 120),
-                ("Pepperoni", 80),
-                ("Jamón", 90),
-                ("Piña", 60),
-                ("Champiñones", 70),
-                ("Pimientos", 85),
-                ("Aceitunas", 55),
-                ("Albahaca", 40),
-                ("Queso parmesano", 45),
-                ("Gorgonzola", 35),
-                ("Queso cabra", 30)
-            ]
-            
-            for ingredient_data in ingredients_data:
-                self.execute_with_retry('''
-                    INSERT OR IGNORE INTO ingredients (name, stock) VALUES (?, ?)
-                ''', ingredient_data)
-            
-            # Estado del restaurante
-            self.execute_with_retry('''
-                INSERT OR IGNORE INTO restaurant_status (id, current_orders, average_wait_time, status)
-                VALUES (1, 0, 25, 'Recibiendo órdenes')
-            ''')
+            conn.execute('BEGIN IMMEDIATE')
+        except sqlite3.OperationalError as e:
+            if "database is locked" in str(e):
+                DB_BUSY_ERRORS.inc()
+            raise
+        finally:
+            DB_LOCK_WAIT.observe(time.perf_counter() - started, (site,))
+    
+    def close(self):
+        """Cerrar todas las conexiones del pool"""
+        self.connection_pool.close_all()
+    
+    def populate_initial_data(self, conn):
+        """Poblar la base de datos con datos iniciales dentro de la transacción del llamador"""
+        # Verificar si ya hay datos de pizzas
+        if conn.execute("SELECT COUNT(*) FROM pizzas").fetchone()[0] > 0:
+            return
+        
+        # Datos del menú
+        pizzas_data = [
+            (1, "Margherita Clásica", "clasica", "🍕", "Salsa de tomate, mozzarella fresca, albahaca, aceite de oliva", 189.00, "15-20 min"),
+            (2, "Pepperoni Supreme", "clasica", "🍕", "Salsa de tomate, mozzarella, pepperoni extra, orégano", 219.00, "18-23 min"),
+            (3, "Cuatro Quesos", "premium", "🧀", "Salsa blanca, mozzarella, parmesano, gorgonzola, queso cabra", 269.00, "20-25 min"),
+            (4, "Hawaiana Tropical", "clasica", "🍍", "Salsa de tomate, mozzarella, jamón, piña natural", 239.00, "16-21 min"),
+            (5, "Vegetariana Garden", "veggie", "🥬", "Salsa de tomate, mozzarella, pimientos, champiñones, cebolla, aceitunas", 229.00, "17-22 min"),
+            (6, "Meat Lovers", "premium", "🥩", "Salsa BBQ, mozzarella, pepperoni, salchicha, jamón, tocino", 299.00, "22-27 min"),
+            (7, "Mediterránea", "premium", "🫒", "Salsa pesto, mozzarella, tomates cherry, aceitunas, rúcula, queso feta", 279.00, "19-24 min"),
+            (8, "Vegana Delight", "veggie", "🌱", "Salsa de tomate, queso vegano, vegetales asados, espinacas", 259.00, "20-25 min")
+        ]
+        
+        # Datos de ingredientes iniciales
+        ingredients_data = [
+            ("Salsa de tomate", 150),
+            ("Mozzarella", 120),
+            ("Pepperoni", 80),
+            ("Jamón", 90),
+            ("Piña", 60),
+            ("Champiñones", 70),
+            ("Pimientos", 85),
+            ("Aceitunas", 55),
+            ("Albahaca", 40),
+            ("Queso parmesano", 45),
+            ("Gorgonzola", 35),
+            ("Queso cabra", 30)
+        ]
+        
+        conn.executemany('''
+            INSERT OR IGNORE INTO pizzas (id, name, category, emoji, ingredients, price, time_range)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', pizzas_data)
+        conn.executemany('''
+            INSERT OR IGNORE INTO ingredients (name, stock) VALUES (?, ?)
+        ''', ingredients_data)
+        
+        # Estado del restaurante
+        conn.execute('''
+            INSERT OR IGNORE INTO restaurant_status (id, current_orders, average_wait_time, status)
+            VALUES (1, 0, 25, 'Recibiendo órdenes')
+        ''')
+        
+        print("Datos iniciales insertados correctamente")
+
+class OutOfStockError(Exception):
+    """La orden pide pizzas sin ingredientes suficientes o no disponibles"""
+
+class OrderPendingError(Exception):
+    """El escritor no confirmó la orden a tiempo; se anunciará cuando la confirme"""
+
+class InvalidTransitionError(Exception):
+    """El estado pedido no existe o retrocede en el flujo de la orden"""
+
+class RecipeIndex:
+    """Índice en memoria de recetas: pizza -> ((ingrediente, cantidad), ...)"""
+    
+    def __init__(self, db):
+        self.db = db
+        self._recipes = {}
+        self._ingredient_ids = {}
+        self.reload()
+    
+    def reload(self):
+        """Volver a cargar recetas e ingredientes desde la base de datos"""
+        recipes = {}
+        for pizza_id, ingredient_id, quantity in self.db.execute_with_retry(
+            'SELECT pizza_id, ingredient_id, quantity FROM pizza_ingredients', fetch=True
+        ):
+            recipes.setdefault(pizza_id, []).append((ingredient_id, quantity))
+        
+        ingredient_ids = {
+            name.lower(): ingredient_id
+            for ingredient_id, name in self.db.execute_with_retry(
+                'SELECT id, name FROM ingredients', fetch=True
+            )
+        }
+        
+        # Reemplazo atómico de ambos índices
+        self._recipes = {pizza_id: tuple(items) for pizza_id, items in recipes.items()}
+        self._ingredient_ids = ingredient_ids
+    
+    def requirements(self, items):
+        """Totales por ingrediente que consume una lista de items del carrito
+        
+        Devuelve ({ingredient_id: cantidad}, {pizza_ids del menú pedidos}).
+        Las pizzas personalizadas no tienen receta y no descuentan stock.
+        """
+        needed = {}
+        pizza_ids = set()
+        for item in items:
+            pizza_id = item.get('id')
+            if not isinstance(pizza_id, int) or isinstance(pizza_id, bool):
+                continue
+            quantity = item.get('quantity', 1)
+            pizza_ids.add(pizza_id)
             
-            print("Datos iniciales insertados correctamente")
+            for ingredient_id, per_pizza in self._recipes.get(pizza_id, ()):
+                needed[ingredient_id] = needed.get(ingredient_id, 0) + per_pizza * quantity
             
-        except Exception as e:
-            print(f"Error al poblar datos iniciales: {e}")
+            # La porción doble consume una unidad extra del ingrediente elegido
+            double = item.get('doubleIngredient')
+            if double:
+                ingredient_id = self._ingredient_ids.get(str(double).lower())
+                if ingredient_id is not None:
+                    needed[ingredient_id] = needed.get(ingredient_id, 0) + quantity
+        return needed, pizza_ids
 
-class OrderManager:
-    """Gestor de órdenes y tiempos de espera"""
+class OrderArchive:
+    """Archivo de órdenes terminadas antiguas en una base SQLite por mes
     
-    def __init__(self, db):
+    Cada lote se mueve en dos transacciones: primero se copia al archivo
+    `orders_YYYY_MM.db` y después se borra de la base viva solo lo que ya está
+    copiado con el mismo estado. Si el proceso se corta entre ambas, la orden
+    queda en los dos lados y el siguiente lote la vuelve a copiar antes de
+    borrarla. Las consultas históricas adjuntan (ATTACH) los meses necesarios.
+    """
+    
+    def __init__(self, db, directory=ARCHIVE_DIR, after_days=ARCHIVE_AFTER_DAYS, window=ARCHIVE_WINDOW):
         self.db = db
-        self.active_orders = []
-        self.start_order_processor()
+        self.directory = directory
+        self.after_days = after_days
+        self.window = tuple(int(hour) for hour in window.split('-', 1))
+        # Serializa el movimiento de órdenes con las lecturas que combinan base viva y archivo
+        self.lock = threading.RLock()
     
-    def add_order(self, order_data):
-        """Agregar nueva orden"""
+    @staticmethod
+    def _placeholders(values):
+        return ', '.join('?' * len(values))
+    
+    def months(self):
+        """Meses archivados, del más reciente al más antiguo"""
+        return self.db.execute_with_retry('''
+            SELECT month, filename, orders_count, min_id, max_id, archived_at
+            FROM order_archives ORDER BY month DESC
+        ''', fetch=True)
+    
+    @contextmanager
+    def attached(self, conn, months):
+        """Adjuntar archivos mensuales [(month, filename)] como archive_0, archive_1, ..."""
+        aliases = []
         try:
-            order_json = json.dumps(order_data['items'])
-            estimated_time = self.calculate_estimated_time(order_data['items'])
-            
-            order_id = self.db.execute_with_retry('''
-                INSERT INTO orders (order_data, total_price, estimated_time, customer_name, payment_method, status)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                order_json,
-                order_data['total'],
-                estimated_time,
-                order_data.get('customer', 'Cliente'),
-                order_data.get('payment', 'efectivo'),
-                'received'
-            ))
-            
-            # Actualizar estado del restaurante
-            self.update_restaurant_status()
+            for index, (month, filename) in enumerate(months):
+                alias = f'archive_{index}'
+                conn.execute(f'ATTACH DATABASE ? AS {alias}', (os.path.join(self.directory, filename),))
+                aliases.append(alias)
+            yield aliases
+        finally:
+            # DETACH no se permite con una transacción abierta
+            if conn.in_transaction:
+                conn.rollback()
+            for alias in aliases:
+                conn.execute(f'DETACH DATABASE {alias}')
+    
+    def archive_batch(self, cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+        """Archivar un lote de órdenes terminadas creadas antes de `cutoff`
+        
+        Devuelve cuántas órdenes se seleccionaron (0 cuando no queda nada).
+        """
+        with self.lock, self.db.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT id, substr(created_at, 1, 7) FROM orders
+                WHERE status IN ({self._placeholders(TERMINAL_STATUSES)}) AND created_at < ?
+                ORDER BY created_at, id
+                LIMIT ?
+            ''', TERMINAL_STATUSES + (cutoff, batch_size)).fetchall()
             
-            # Agregar a órdenes activas
-            new_order = {
-                'id': order_id,
-                'items': order_data['items'],
-                'total': order_data['total'],
-                'estimated_time': estimated_time,
-                'customer': order_data.get('customer', 'Cliente'),
-                'payment': order_data.get('payment', 'efectivo'),
-                'status': 'received',
-                'created_at': datetime.now(),
-                'progress': 0
-            }
-            self.active_orders.append(new_order)
+            by_month = {}
+            for order_id, month in rows:
+                by_month.setdefault(month, []).append(order_id)
+            for month, order_ids in sorted(by_month.items()):
+                self._archive_month(conn, month, order_ids)
+        return len(rows)
+    
+    def _archive_month(self, conn, month, order_ids):
+        """Copiar órdenes de un mismo mes a su archivo y borrarlas de la base viva"""
+        filename = f"orders_{month.replace('-', '_')}.db"
+        marks = self._placeholders(order_ids)
+        os.makedirs(self.directory, exist_ok=True)
+        
+        with self.attached(conn, [(month, filename)]) as (alias,):
+            for statement in ARCHIVE_SCHEMA:
+                conn.execute(statement.format(alias=alias))
             
-            print(f"Nueva orden agregada: #{order_id}")
-            return order_id
+            # 1) Copiar: solo escribe en el archivo, la base viva no se bloquea
+            conn.execute(f'''
+                INSERT OR REPLACE INTO {alias}.orders ({ARCHIVE_ORDER_COLUMNS})
+                SELECT {ARCHIVE_ORDER_COLUMNS} FROM main.orders WHERE id IN ({marks})
+            ''', order_ids)
+            conn.execute(f'''
+                INSERT OR REPLACE INTO {alias}.order_items ({ARCHIVE_ITEM_COLUMNS})
+                SELECT {ARCHIVE_ITEM_COLUMNS} FROM main.order_items WHERE order_id IN ({marks})
+            ''', order_ids)
+            conn.commit()
             
-        except Exception as e:
-            print(f"Error al agregar orden: {e}")
-            return None
+            # 2) Borrar solo lo copiado con el mismo estado (el chef pudo cambiarlo entre medio)
+            self.db.begin_immediate(conn, 'archive')
+            moved = [row[0] for row in conn.execute(f'''
+                SELECT id FROM main.orders
+                WHERE id IN ({marks}) AND (id, status) IN (SELECT id, status FROM {alias}.orders)
+            ''', order_ids)]
+            if moved:
+                moved_marks = self._placeholders(moved)
+                conn.execute(f'DELETE FROM main.order_items WHERE order_id IN ({moved_marks})', moved)
+                conn.execute(f'DELETE FROM main.orders WHERE id IN ({moved_marks})', moved)
+                conn.execute('''
+                    INSERT INTO order_archives (month, filename, orders_count, min_id, max_id)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (month) DO UPDATE SET
+                        orders_count = orders_count + excluded.orders_count,
+                        min_id = MIN(min_id, excluded.min_id),
+                        max_id = MAX(max_id, excluded.max_id),
+                        archived_at = CURRENT_TIMESTAMP
+                ''', (month, filename, len(moved), min(moved), max(moved)))
+            conn.commit()
     
-    def calculate_estimated_time(self, items):
-        """Calcular tiempo estimado basado en los items"""
-        base_time = 15
-        total_items = sum(item.get('quantity', 1) for item in items)
+    def archive_old_orders(self):
+        """Archivar, en lotes cortos, las órdenes terminadas más antiguas que after_days"""
+        cutoff = (datetime.utcnow() - timedelta(days=self.after_days)).strftime('%Y-%m-%d %H:%M:%S')
+        archived = 0
+        while True:
+            selected = self.archive_batch(cutoff)
+            archived += selected
+            if selected < ARCHIVE_BATCH_SIZE:
+                break
+            time.sleep(ARCHIVE_BATCH_PAUSE)
+        if archived:
+            print(f"Órdenes archivadas: {archived}")
+        return archived
+    
+    def compact(self):
+        """Devolver al sistema las páginas libres y truncar el WAL"""
+        with self.db.connection() as conn:
+            freed = None
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                # Base creada sin auto_vacuum incremental: un VACUUM completo una sola vez
+                conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+                conn.execute('VACUUM')
+            else:
+                free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+                conn.execute(f'PRAGMA incremental_vacuum({ARCHIVE_VACUUM_PAGES})').fetchall()
+                freed = free_pages - conn.execute('PRAGMA freelist_count').fetchone()[0]
+            busy, wal_pages, checkpointed = conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+        return {
+            'freed_pages': freed,
+            'wal_checkpoint_busy': bool(busy),
+            'wal_pages': wal_pages,
+            'checkpointed_pages': checkpointed
+        }
+    
+    def find_order(self, order_id, columns='status, estimated_time, created_at, completed_at'):
+        """Buscar una orden archivada por id en los meses cuyo rango de ids la incluye"""
+        months = self.db.execute_with_retry('''
+            SELECT month, filename FROM order_archives
+            WHERE ? BETWEEN min_id AND max_id
+            ORDER BY month DESC
+        ''', (order_id,), fetch=True)
+        if not months:
+            return None
         
-        # Tiempo base + tiempo extra por cantidad
-        extra_time = max(0, (total_items - 1) * 3)
+        with self.db.connection() as conn, self.attached(conn, months[:ARCHIVE_MAX_ATTACHED]) as aliases:
+            for alias in aliases:
+                row = conn.execute(f'SELECT {columns} FROM {alias}.orders WHERE id = ?', (order_id,)).fetchone()
+                if row:
+                    return row
+        return None
+    
+    def list_orders(self, where, params, limit, first_month=None, last_month=None):
+        """Listado de órdenes combinando la base viva con los meses archivados
         
-        # Agregar tiempo por carga actual
-        current_load = len(self.active_orders)
-        load_time = current_load * 2
+        Los meses se adjuntan en grupos de ARCHIVE_MAX_ATTACHED, del más
+        reciente al más antiguo; cada grupo se acota a su rango de fechas para
+        que la concatenación conserve el orden (created_at DESC, id DESC).
+        Devuelve ([(id, order_data, total_price, estimated_time, customer_name,
+        payment_method, status, created_at, completed_at)], {order_id: [items]}).
+        """
+        months = [
+            (month, filename) for month, filename, *_ in self.months()
+            if (first_month is None or month >= first_month) and (last_month is None or month <= last_month)
+        ]
+        groups = [months[start:start + ARCHIVE_MAX_ATTACHED] for start in range(0, len(months), ARCHIVE_MAX_ATTACHED)]
         
-        return min(base_time + extra_time + load_time, 60)
+        rows = []
+        items = {}
+        upper = None
+        with self.lock, self.db.connection() as conn:
+            for index, group in enumerate(groups or [[]]):
+                # El último grupo no tiene cota inferior: incluye lo más antiguo de la base viva
+                lower = f'{group[-1][0]}-01' if index < len(groups) - 1 else None
+                bounds = [('created_at >= ?', lower), ('created_at < ?', upper)]
+                conditions = [condition for condition, value in bounds if value is not None]
+                clause = ' AND '.join(filter(None, [where[len('WHERE '):] if where else '', *conditions]))
+                
+                with self.attached(conn, group) as aliases:
+                    sources = ['main'] + aliases
+                    union = ' UNION ALL '.join(
+                        f"SELECT {ARCHIVE_ORDER_COLUMNS}, '{source}' AS source FROM {source}.orders"
+                        for source in sources
+                    )
+                    batch = conn.execute(f'''
+                        SELECT * FROM ({union})
+                        {'WHERE ' + clause if clause else ''}
+                        ORDER BY created_at DESC, id DESC
+                        LIMIT ?
+                    ''', list(params) + [value for _, value in bounds if value is not None] + [limit - len(rows)]).fetchall()
+                    
+                    for source in sources:
+                        order_ids = [row[0] for row in batch if row[-1] == source]
+                        if not order_ids:
+                            continue
+                        for row in conn.execute(f'''
+                            SELECT order_id, pizza_id, name, size, size_label, quantity, unit_price, extra
+                            FROM {source}.order_items
+                            WHERE order_id IN ({self._placeholders(order_ids)})
+                            ORDER BY order_id, line_no
+                        ''', order_ids):
+                            items.setdefault(row[0], []).append(order_item_from_row(row[1:]))
+                
+                rows.extend(row[:-1] for row in batch)
+                upper = lower
+                if len(rows) >= limit:
+                    break
+        return rows, items
+    
+    def in_window(self, now=None):
+        """¿La hora local actual está dentro de la ventana de mantenimiento?"""
+        start, end = self.window
+        hour = (now or datetime.now()).hour
+        if start <= end:
+            return start <= hour < end
+        return hour >= start or hour < end
+    
+    def start(self, should_run=lambda: True):
+        """Archivar y compactar periódicamente en hilo separado, solo en horas de baja demanda"""
+        def maintain():
+            while True:
+                time.sleep(ARCHIVE_CHECK_INTERVAL)
+                if not self.in_window() or not should_run():
+                    continue
+                try:
+                    self.archive_old_orders()
+                    self.compact()
+                except Exception as e:
+                    print(f"Error en mantenimiento del archivo de órdenes: {e}")
+        
+        thread = threading.Thread(target=maintain, daemon=True)
+        thread.start()
+        return thread
+
+class SalesAnalytics:
+    """Rollups de ventas por hora y día mantenidos de forma incremental
+    
+    Los métodos record_* se ejecutan dentro de la transacción del llamador,
+    así que los rollups nunca divergen de las órdenes que los originan.
+    """
+    
+    def __init__(self, db, archive=None):
+        self.db = db
+        # OrderArchive opcional: rebuild() incluye también los meses archivados
+        self.archive = archive
+    
+    @staticmethod
+    def _placeholders(values):
+        return ', '.join('?' * len(values))
+    
+    def record_orders(self, conn, order_ids):
+        """Sumar órdenes recién creadas a los rollups"""
+        if not order_ids:
+            return
+        marks = self._placeholders(order_ids)
+        for granularity, length in ANALYTICS_GRANULARITIES.items():
+            conn.execute(f'''
+                INSERT INTO sales_rollups (granularity, bucket, orders_count, revenue, items_count)
+                SELECT ?, substr(o.created_at, 1, {length}), COUNT(*), SUM(o.total_price),
+                       SUM((SELECT COALESCE(SUM(quantity), 0) FROM order_items WHERE order_id = o.id))
+                FROM orders o WHERE o.id IN ({marks})
+                GROUP BY 2
+                ON CONFLICT (granularity, bucket) DO UPDATE SET
+                    orders_count = orders_count + excluded.orders_count,
+                    revenue = revenue + excluded.revenue,
+                    items_count = items_count + excluded.items_count
+            ''', [granularity] + list(order_ids))
+            
+            conn.execute(f'''
+                INSERT INTO sales_pizza_rollups (granularity, bucket, pizza_key, name, category, quantity, revenue)
+                SELECT ?, substr(o.created_at, 1, {length}),
+                       COALESCE(CAST(oi.pizza_id AS TEXT), 'custom'),
+                       COALESCE(p.name, CASE WHEN oi.pizza_id IS NULL THEN 'Pizza Personalizada' ELSE oi.name END),
+                       COALESCE(p.category, 'personalizada'),
+                       SUM(oi.quantity), SUM(oi.quantity * oi.unit_price)
+                FROM order_items oi
+                JOIN orders o ON o.id = oi.order_id
+                LEFT JOIN pizzas p ON p.id = oi.pizza_id
+                WHERE oi.order_id IN ({marks})
+                GROUP BY 2, 3
+                ON CONFLICT (granularity, bucket, pizza_key) DO UPDATE SET
+                    quantity = quantity + excluded.quantity,
+                    revenue = revenue + excluded.revenue
+            ''', [granularity] + list(order_ids))
+    
+    def record_completions(self, conn, order_ids):
+        """Sumar el tiempo real de preparación de órdenes recién completadas"""
+        if not order_ids:
+            return
+        marks = self._placeholders(order_ids)
+        prep_seconds = '(julianday(completed_at) - julianday(created_at)) * 86400'
+        for granularity, length in ANALYTICS_GRANULARITIES.items():
+            conn.execute(f'''
+                INSERT INTO sales_rollups (granularity, bucket, completed_count, prep_seconds)
+                SELECT ?, substr(created_at, 1, {length}), COUNT(*), SUM(MAX(0, {prep_seconds}))
+                FROM orders WHERE id IN ({marks}) AND completed_at IS NOT NULL
+                GROUP BY 2
+                ON CONFLICT (granularity, bucket) DO UPDATE SET
+                    completed_count = completed_count + excluded.completed_count,
+                    prep_seconds = prep_seconds + excluded.prep_seconds
+            ''', [granularity] + list(order_ids))
+            
+            conn.execute(f'''
+                INSERT INTO prep_time_histogram (granularity, bucket, minute, count)
+                SELECT ?, substr(created_at, 1, {length}),
+                       MIN(MAX(0, CAST({prep_seconds} / 60 AS INTEGER)), {PREP_TIME_HISTOGRAM_MAX}),
+                       COUNT(*)
+                FROM orders WHERE id IN ({marks}) AND completed_at IS NOT NULL
+                GROUP BY 2, 3
+                ON CONFLICT (granularity, bucket, minute) DO UPDATE SET
+                    count = count + excluded.count
+            ''', [granularity] + list(order_ids))
+    
+    def rebuild(self):
+        """Regenerar todos los rollups desde las órdenes en una sola pasada
+        
+        Se ejecuta en una transacción IMMEDIATE: los escritores esperan a que
+        termine y los lectores siguen viendo los rollups anteriores hasta el commit.
+        Los meses archivados se leen antes, adjuntándolos de a grupos.
+        """
+        # Las órdenes antiguas necesitan sus líneas normalizadas
+        self.db.backfill_order_items()
+        
+        totals = {}
+        pizzas = {}
+        histogram = {}
+        
+        def accumulate(rows, catalog):
+            last_order = None
+            for order_id, created_at, total, prep, pizza_id, name, quantity, unit_price in rows:
+                for granularity, length in ANALYTICS_GRANULARITIES.items():
+                    key = (granularity, created_at[:length])
+                    entry = totals.setdefault(key, [0, 0.0, 0, 0, 0.0])
+                    
+                    if order_id != last_order:
+                        entry[0] += 1
+                        entry[1] += total or 0
+                        if prep is not None:
+                            entry[3] += 1
+                            entry[4] += max(0.0, prep)
+                            minute = min(max(0, int(prep // 60)), PREP_TIME_HISTOGRAM_MAX)
+                            histogram[key + (minute,)] = histogram.get(key + (minute,), 0) + 1
+                    
+                    if quantity is not None:
+                        entry[2] += quantity
+                        pizza_key = str(pizza_id) if pizza_id is not None else 'custom'
+                        if pizza_key in catalog:
+                            pizza_name, category = catalog[pizza_key]
+                        elif pizza_id is None:
+                            pizza_name, category = 'Pizza Personalizada', 'personalizada'
+                        else:
+                            pizza_name, category = name, 'personalizada'
+                        pizza_entry = pizzas.setdefault(key + (pizza_key,), [pizza_name, category, 0, 0.0])
+                        pizza_entry[2] += quantity
+                        pizza_entry[3] += quantity * (unit_price or 0)
+                last_order = order_id
+        
+        query = '''
+            SELECT o.id, o.created_at, o.total_price,
+                   (julianday(o.completed_at) - julianday(o.created_at)) * 86400,
+                   oi.pizza_id, oi.name, oi.quantity, oi.unit_price
+            FROM {schema}.orders o
+            LEFT JOIN {schema}.order_items oi ON oi.order_id = o.id
+            {where}
+            ORDER BY o.id, oi.line_no
+        '''
+        
+        # El lock del archivo evita que una orden se mueva a mitad de la pasada
+        archive_lock = self.archive.lock if self.archive is not None else nullcontext()
+        with archive_lock, self.db.connection() as conn:
+            # Meses archivados primero: no cambian, así que no hace falta el lock de escritura.
+            # Una orden copiada pero aún no borrada de la base viva se cuenta solo desde ahí.
+            if self.archive is not None:
+                catalog = self._catalog(conn)
+                months = [(month, filename) for month, filename, *_ in self.archive.months()]
+                for start in range(0, len(months), ARCHIVE_MAX_ATTACHED):
+                    with self.archive.attached(conn, months[start:start + ARCHIVE_MAX_ATTACHED]) as aliases:
+                        for alias in aliases:
+                            accumulate(conn.execute(query.format(
+                                schema=alias, where='WHERE o.id NOT IN (SELECT id FROM main.orders)'
+                            )), catalog)
+            
+            self.db.begin_immediate(conn, 'analytics_rebuild')
+            catalog = self._catalog(conn)
+            accumulate(conn.execute(query.format(schema='main', where='')), catalog)
+            
+            conn.execute('DELETE FROM sales_rollups')
+            conn.execute('DELETE FROM sales_pizza_rollups')
+            conn.execute('DELETE FROM prep_time_histogram')
+            conn.executemany('''
+                INSERT INTO sales_rollups
+                    (granularity, bucket, orders_count, revenue, items_count, completed_count, prep_seconds)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', [key + tuple(values) for key, values in totals.items()])
+            conn.executemany('''
+                INSERT INTO sales_pizza_rollups
+                    (granularity, bucket, pizza_key, name, category, quantity, revenue)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', [key + tuple(values) for key, values in pizzas.items()])
+            conn.executemany('''
+                INSERT INTO prep_time_histogram (granularity, bucket, minute, count)
+                VALUES (?, ?, ?, ?)
+            ''', [key + (count,) for key, count in histogram.items()])
+        
+        return {'buckets': len(totals), 'pizza_rows': len(pizzas)}
+    
+    @staticmethod
+    def _catalog(conn):
+        """Nombre y categoría actuales de cada pizza del menú: {id: (name, category)}"""
+        return {
+            str(row[0]): (row[1], row[2])
+            for row in conn.execute('SELECT id, name, category FROM pizzas')
+        }
+    
+    @staticmethod
+    def _percentile(histogram, fraction):
+        """Percentil aproximado (en minutos) a partir de un histograma {minuto: conteo}"""
+        total = sum(histogram.values())
+        if not total:
+            return None
+        threshold = total * fraction
+        seen = 0
+        for minute in sorted(histogram):
+            seen += histogram[minute]
+            if seen >= threshold:
+                return minute + 1  # Límite superior del bucket
+        return None
+    
+    def summary(self, granularity, start, end):
+        """Totales por bucket en [start, end) leídos solo de los rollups"""
+        rows = self.db.execute_with_retry('''
+            SELECT bucket, orders_count, revenue, items_count, completed_count, prep_seconds
+            FROM sales_rollups
+            WHERE granularity = ? AND bucket >= ? AND bucket < ?
+            ORDER BY bucket
+        ''', (granularity, start, end), fetch=True)
+        
+        histograms = {}
+        for bucket, minute, count in self.db.execute_with_retry('''
+            SELECT bucket, minute, count FROM prep_time_histogram
+            WHERE granularity = ? AND bucket >= ? AND bucket < ?
+        ''', (granularity, start, end), fetch=True):
+            histograms.setdefault(bucket, {})[minute] = count
+        
+        buckets = []
+        for bucket, orders_count, revenue, items_count, completed_count, prep_seconds in rows:
+            buckets.append({
+                'bucket': bucket,
+                'orders': orders_count,
+                'revenue': round(revenue, 2),
+                'items': items_count,
+                'average_ticket': round(revenue / orders_count, 2) if orders_count else None,
+                'completed': completed_count,
+                'average_prep_minutes': round(prep_seconds / completed_count / 60, 1) if completed_count else None,
+                'p90_prep_minutes': self._percentile(histograms.get(bucket, {}), 0.9)
+            })
+        
+        # Totales del rango: el p90 se combina sumando los histogramas
+        combined = {}
+        for histogram in histograms.values():
+            for minute, count in histogram.items():
+                combined[minute] = combined.get(minute, 0) + count
+        orders_total = sum(b['orders'] for b in buckets)
+        revenue_total = sum(row[2] for row in rows)
+        completed_total = sum(row[4] for row in rows)
+        prep_total = sum(row[5] for row in rows)
+        
+        return {
+            'granularity': granularity,
+            'from': start,
+            'to': end,
+            'buckets': buckets,
+            'totals': {
+                'orders': orders_total,
+                'revenue': round(revenue_total, 2),
+                'items': sum(b['items'] for b in buckets),
+                'average_ticket': round(revenue_total / orders_total, 2) if orders_total else None,
+                'completed': completed_total,
+                'average_prep_minutes': round(prep_total / completed_total / 60, 1) if completed_total else None,
+                'p90_prep_minutes': self._percentile(combined, 0.9)
+            }
+        }
+    
+    def pizza_sales(self, granularity, start, end):
+        """Unidades e ingresos por pizza y por categoría en [start, end)"""
+        rows = self.db.execute_with_retry('''
+            SELECT pizza_key, MAX(name), MAX(category), SUM(quantity), SUM(revenue)
+            FROM sales_pizza_rollups
+            WHERE granularity = ? AND bucket >= ? AND bucket < ?
+            GROUP BY pizza_key
+            ORDER BY SUM(quantity) DESC
+        ''', (granularity, start, end), fetch=True)
+        
+        pizzas = []
+        categories = {}
+        for pizza_key, name, category, quantity, revenue in rows:
+            pizzas.append({
+                'pizza_id': int(pizza_key) if pizza_key.isdigit() else pizza_key,
+                'name': name,
+                'category': category,
+                'quantity': quantity,
+                'revenue': round(revenue, 2)
+            })
+            entry = categories.setdefault(category, {'category': category, 'quantity': 0, 'revenue': 0.0})
+            entry['quantity'] += quantity
+            entry['revenue'] = round(entry['revenue'] + revenue, 2)
+        
+        return {
+            'granularity': granularity,
+            'from': start,
+            'to': end,
+            'pizzas': pizzas,
+            'categories': sorted(categories.values(), key=lambda c: -c['quantity'])
+        }
+
+class OrderEventBus:
+    """Bus de eventos de órdenes con cursor para reanudar streams"""
+    
+    def __init__(self, max_events=EVENT_BUFFER_SIZE):
+        self._events = deque(maxlen=max_events)
+        self._condition = threading.Condition()
+        self._listeners = set()
+        self.last_id = 0
+    
+    def publish(self, event_type, data, event_id=None):
+        """Registrar un evento y despertar a los streams en espera
+        
+        Por defecto los ids se numeran localmente; en modo multi-worker se usa
+        el id del registro de cambios, igual en todos los procesos.
+        """
+        with self._condition:
+            self.last_id = self.last_id + 1 if event_id is None else event_id
+            event_id = self.last_id
+            self._events.append((event_id, event_type, data))
+            self._condition.notify_all()
+            listeners = list(self._listeners)
+        
+        for listener in listeners:
+            try:
+                listener(event_id)
+            except Exception as e:
+                print(f"Error en listener de eventos: {e}")
+        return event_id
+    
+    def add_listener(self, listener):
+        """Registrar un callback(event_id) que se invoca en cada publicación
+        
+        Permite esperar eventos sin bloquear un hilo (p. ej. desde asyncio).
+        """
+        with self._condition:
+            self._listeners.add(listener)
+    
+    def remove_listener(self, listener):
+        with self._condition:
+            self._listeners.discard(listener)
+    
+    def start_at(self, event_id):
+        """Fijar el último id conocido antes de publicar el primer evento"""
+        with self._condition:
+            if not self._events:
+                self.last_id = event_id
+    
+    def events_since(self, cursor):
+        """Eventos posteriores al cursor; None si el cursor ya salió del buffer"""
+        with self._condition:
+            return self._events_since(cursor)
+    
+    def _events_since(self, cursor):
+        if cursor >= self.last_id:
+            return []
+        if not self._events or cursor < self._events[0][0] - 1:
+            return None
+        # Los ids crecen pero pueden tener huecos; el cursor suele estar cerca del final
+        start = len(self._events)
+        while start > 0 and self._events[start - 1][0] > cursor:
+            start -= 1
+        return [self._events[i] for i in range(start, len(self._events))]
+    
+    def wait_for_events(self, cursor, timeout):
+        """Esperar hasta que haya eventos posteriores al cursor (o timeout)"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.last_id > cursor, timeout=timeout)
+            return self._events_since(cursor)
+
+class OrderTracker:
+    """Versiones, espera larga y cache de órdenes terminadas para el seguimiento
+    
+    La versión de una orden es su paso en STATUS_SEQUENCE (los estados solo
+    avanzan): es la misma en todos los workers y tras un reinicio sin
+    guardarla en ningún lado. El ETag resume además los demás campos de la
+    respuesta, que cambian sin cambiar el estado. Las peticiones en espera
+    registran un callback por orden que publish_status dispara en cada cambio.
+    """
+    
+    def __init__(self, cache_size=ORDER_STATUS_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._terminal = OrderedDict()  # id -> estado de una orden terminada (LRU)
+        self._watchers = {}             # id -> [callback()]
+        # Cuenta los cambios: un estado leído de la base mientras cambiaba no se cachea
+        self.generation = 0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def version(status):
+        return STATUS_SEQUENCE.index(status) + 1 if status in STATUS_SEQUENCE else 0
+    
+    @staticmethod
+    def etag(payload):
+        """Valor del ETag (sin comillas) de un estado de orden: cambia con cualquier campo"""
+        digest = hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+        return f"{payload['order_id']}-{payload['version']}-{digest}"
+    
+    def cached(self, order_id):
+        """Estado de una orden terminada recordado en memoria, o None"""
+        with self._lock:
+            payload = self._terminal.get(order_id)
+            if payload is not None:
+                self._terminal.move_to_end(order_id)
+            return payload
+    
+    def remember(self, payload, generation):
+        """Recordar el estado de una orden terminada leído en la generación dada"""
+        if payload['status'] not in TERMINAL_STATUSES:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._terminal[payload['order_id']] = payload
+            self._terminal.move_to_end(payload['order_id'])
+            while len(self._terminal) > self.cache_size:
+                self._terminal.popitem(last=False)
+    
+    def watch(self, order_id, callback):
+        with self._lock:
+            self._watchers.setdefault(order_id, []).append(callback)
+    
+    def unwatch(self, order_id, callback):
+        with self._lock:
+            callbacks = self._watchers.get(order_id)
+            if callbacks and callback in callbacks:
+                callbacks.remove(callback)
+                if not callbacks:
+                    del self._watchers[order_id]
+    
+    def changed(self, order_id):
+        """Olvidar el estado cacheado de una orden y despertar a quienes la esperan"""
+        with self._lock:
+            self.generation += 1
+            self._terminal.pop(order_id, None)
+            callbacks = self._watchers.pop(order_id, ())
+        for callback in callbacks:
+            callback()
+    
+    def wait(self, order_id, lookup, is_current, timeout):
+        """Esperar hasta que lookup() deje de cumplir is_current (o timeout)
+        
+        Devuelve el último estado leído (None si la orden no existe).
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            changed = threading.Event()
+            self.watch(order_id, changed.set)
+            try:
+                # Leer después de registrarse para no perder un cambio intermedio
+                payload = lookup()
+                remaining = deadline - time.monotonic()
+                if payload is None or not is_current(payload) or remaining <= 0:
+                    return payload
+                changed.wait(remaining)
+            finally:
+                self.unwatch(order_id, changed.set)
+
+class ActiveOrder:
+    """Orden en curso, con slots para mantener compacto el registro"""
+    
+    __slots__ = ('id', 'items', 'total', 'estimated_time', 'customer', 'payment',
+                 'status', 'created_at', 'due_at', 'stock', 'milestones')
+    
+    def __init__(self, order_id, items, total, estimated_time, customer, payment,
+                 status='received', created_at=None):
+        self.id = order_id
+        self.items = items
+        self.total = total
+        self.estimated_time = estimated_time
+        self.customer = customer
+        self.payment = payment
+        self.status = status
+        self.created_at = created_at or datetime.now()
+        self.due_at = self.created_at + timedelta(minutes=estimated_time)
+        # (ingredientes a descontar, pizzas del menú) calculados al recibir la orden
+        self.stock = ({}, set())
+        # Instantes (preparación, horno, lista) fijados por el planificador de cocina
+        self.milestones = None
+    
+    def set_estimated_time(self, estimated_time):
+        """Reemplazar el tiempo estimado manteniendo la hora de entrega coherente"""
+        self.estimated_time = estimated_time
+        self.due_at = self.created_at + timedelta(minutes=estimated_time)
+    
+    @property
+    def progress(self):
+        """Porcentaje de avance calculado a partir del tiempo transcurrido"""
+        elapsed = (datetime.now() - self.created_at).total_seconds() / 60
+        return min(100, (elapsed / self.estimated_time) * 100) if self.estimated_time else 100
+    
+    def transition_deadlines(self):
+        """Pares (instante, estado) en que la orden avanza automáticamente
+        
+        Siguen la agenda de cocina si la orden se planificó en este proceso;
+        si no (restauradas o de otro worker), porcentajes del tiempo estimado.
+        """
+        if self.milestones:
+            return list(self.milestones) + [(self.due_at.timestamp(), 'completed')]
+        start = self.created_at.timestamp()
+        return [
+            (start + self.estimated_time * 60 * percent / 100, status)
+            for percent, status in STATUS_TRANSITIONS
+        ]
+    
+    def summary(self):
+        """Resumen corto usado por los endpoints de administración"""
+        return {'id': self.id, 'status': self.status, 'progress': self.progress}
+
+class ActiveOrderRegistry:
+    """Registro de órdenes activas indexado por id
+    
+    Las escrituras se serializan con un lock; los lectores recorren una
+    instantánea inmutable (tupla) que solo se reconstruye tras un cambio.
+    Los vencimientos los ordena el heap de transiciones del procesador.
+    """
+    
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._orders = {}
+        self._total_estimated = 0
+        self._snapshot = ()
+    
+    def __len__(self):
+        return len(self._orders)
+    
+    def __iter__(self):
+        return iter(self.snapshot())
+    
+    def __contains__(self, order_id):
+        return order_id in self._orders
+    
+    def snapshot(self):
+        """Tupla con las órdenes activas, segura para iterar sin lock"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = tuple(self._orders.values())
+                snapshot = self._snapshot
+        return snapshot
+    
+    def get(self, order_id):
+        """Buscar una orden activa en O(1)"""
+        return self._orders.get(order_id)
+    
+    def add(self, order):
+        """Registrar una orden activa"""
+        with self._lock:
+            previous = self._orders.get(order.id)
+            if previous is not None:
+                self._total_estimated -= previous.estimated_time
+            self._orders[order.id] = order
+            self._total_estimated += order.estimated_time
+            self._snapshot = None
+    
+    def remove(self, order_id):
+        """Retirar una orden"""
+        with self._lock:
+            order = self._orders.pop(order_id, None)
+            if order is not None:
+                self._total_estimated -= order.estimated_time
+                self._snapshot = None
+            return order
+    
+    def set_status(self, order_id, status):
+        """Cambiar el estado de una orden activa; devuelve la orden o None"""
+        with self._lock:
+            order = self._orders.get(order_id)
+            if order is not None:
+                order.status = status
+            return order
+    
+    def apply_statuses(self, changes):
+        """Aplicar varios pares (id, estado) en una pasada, retirando los terminales
+        
+        Devuelve {id: orden} con las órdenes activas afectadas.
+        """
+        touched = {}
+        with self._lock:
+            for order_id, status in changes:
+                order = self._orders.get(order_id)
+                if order is None:
+                    continue
+                order.status = status
+                touched[order_id] = order
+                if status in TERMINAL_STATUSES:
+                    self.remove(order_id)
+        return touched
+    
+    def average_estimated_time(self, default=None):
+        """Promedio de tiempo estimado mantenido de forma incremental"""
+        with self._lock:
+            if not self._orders:
+                return default
+            return self._total_estimated // len(self._orders)
+
+class OrderWriter:
+    """Hilo escritor único que agrupa inserciones concurrentes en una transacción
+    
+    Cada petición encola su trabajo y espera un Future con el id asignado.
+    El hilo toma lo que haya en la cola (hasta `max_batch`, esperando como
+    mucho `max_wait_ms` por más) y confirma todo el lote con un solo commit.
+    """
+    
+    def __init__(self, db, write_batch, max_batch=ORDER_BATCH_MAX_SIZE,
+                 max_wait_ms=ORDER_BATCH_MAX_WAIT_MS):
+        self.db = db
+        # write_batch(conn, items) -> lista de resultados (o excepciones), uno por item
+        self.write_batch = write_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        # El hilo se crea con la primera orden: importar o instanciar no arranca nada
+        self._thread = None
+        self._start_lock = threading.Lock()
+    
+    def pending(self):
+        """Items encolados que aún no toma el hilo escritor"""
+        return self._queue.qsize()
+    
+    def submit(self, item):
+        """Encolar un item; el Future se resuelve cuando su lote se confirma"""
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+                    self._thread.start()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+    
+    def _collect_batch(self):
+        """Bloquear hasta el primer item y juntar los que lleguen poco después
+        
+        Los items cuyo Future ya se canceló se descartan; los demás pasan a
+        "en curso" y ya no se pueden cancelar.
+        """
+        entries = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(entries) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    entries.append(self._queue.get_nowait())
+                else:
+                    entries.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return [entry for entry in entries if entry[1].set_running_or_notify_cancel()]
+    
+    def _commit(self, batch):
+        """Escribir un lote en una transacción y devolver los resultados"""
+        ORDER_WRITE_BATCH.observe(len(batch))
+        with self.db.connection() as conn:
+            return self.write_batch(conn, [item for item, _ in batch])
+    
+    @staticmethod
+    def _resolve(future, result):
+        """Resolver un Future sin que un estado inesperado detenga al hilo"""
+        try:
+            # write_batch puede rechazar items sueltos devolviendo la excepción
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+        except InvalidStateError:
+            pass
+    
+    def _run(self):
+        while True:
+            try:
+                batch = self._collect_batch()
+                if not batch:
+                    continue
+                try:
+                    results = self._commit(batch)
+                except Exception as e:
+                    results = None
+                    error = e
+                
+                if results is not None:
+                    for (_, future), result in zip(batch, results):
+                        self._resolve(future, result)
+                elif len(batch) == 1:
+                    self._resolve(batch[0][1], error)
+                else:
+                    # Reintentar uno por uno para que un item inválido no arrastre al resto
+                    print(f"Error en lote de {len(batch)} órdenes, reintentando individualmente: {error}")
+                    for entry in batch:
+                        try:
+                            result = self._commit([entry])[0]
+                        except Exception as item_error:
+                            result = item_error
+                        self._resolve(entry[1], result)
+            except Exception as e:
+                print(f"Error en el hilo escritor de órdenes: {e}")
+
+class KitchenPlan:
+    """Copia de trabajo de la agenda de cocina
+    
+    Las órdenes agregadas al plan ven la carga de las anteriores, pero solo
+    cuentan para el resto de la aplicación cuando el plan se confirma con
+    KitchenScheduler.commit().
+    """
+    
+    def __init__(self, stations, ovens, generation=0, now=None):
+        self.stations = list(stations)
+        self.ovens = list(ovens)
+        self.generation = generation
+        self.now = now if now is not None else time.time()
+        self.orders = []  # (orden, trabajos) en el orden en que se planificaron
+    
+    def minutes_until_ready(self, baked):
+        """Minutos desde ahora hasta entregar una orden que sale del horno en `baked`"""
+        # Redondear antes del techo para que el error de punto flotante no sume un minuto
+        return max(1, math.ceil(round((baked - self.now) / 60 + KITCHEN_HANDOFF_MINUTES, 6)))
+    
+    @staticmethod
+    def group_items(items):
+        """Agrupar las pizzas idénticas (misma pizza y tamaño) en un solo trabajo"""
+        groups = {}
+        for item in items:
+            key = (item.get('id', item.get('name')), item.get('size'))
+            quantity = max(1, int(item.get('quantity', 1) or 1))
+            if key in groups:
+                groups[key]['quantity'] += quantity
+            else:
+                groups[key] = {
+                    'pizza_id': item.get('id'),
+                    'name': item.get('name', 'Pizza'),
+                    'size': item.get('size') or item.get('sizeLabel'),
+                    'quantity': quantity
+                }
+        # El trabajo más largo primero reparte mejor la carga entre estaciones
+        return sorted(groups.values(), key=lambda job: -job['quantity'])
+    
+    def _bake(self, quantity, ready_at):
+        """Repartir pizzas idénticas entre las ranuras del horno
+        
+        Con más pizzas que ranuras se ocupan todas por rondas completas, así
+        que el costo no depende de la cantidad. Devuelve (ranuras, inicio, fin).
+        """
+        bake = KITCHEN_BAKE_MINUTES * 60
+        if quantity < len(self.ovens):
+            taken = [heapq.heappop(self.ovens) for _ in range(quantity)]
+            rounds, extra = 1, 0
+        else:
+            taken = sorted(self.ovens)
+            self.ovens = []
+            rounds, extra = divmod(quantity, len(taken))
+        
+        starts = [max(ready_at, free_at) for free_at, _ in taken]
+        # Las ranuras que se liberan antes hornean la ronda incompleta
+        ends = [start + (rounds + (index < extra)) * bake for index, start in enumerate(starts)]
+        for end, (_, slot) in zip(ends, taken):
+            heapq.heappush(self.ovens, (end, slot))
+        return [slot for _, slot in taken], min(starts), max(ends)
+    
+    def schedule(self, items, prep=True):
+        """Asignar estación y horno a cada trabajo; devuelve (trabajos, fin del horneado)"""
+        jobs = self.group_items(items)
+        baked = self.now
+        for job in jobs:
+            if prep:
+                free_at, station = heapq.heappop(self.stations)
+                prep_start = max(self.now, free_at)
+                prep_end = prep_start + (
+                    KITCHEN_PREP_MINUTES + (job['quantity'] - 1) * KITCHEN_PREP_BATCH_MINUTES
+                ) * 60
+                heapq.heappush(self.stations, (prep_end, station))
+            else:
+                # Ya preparada (en el horno): solo ocupa ranuras
+                station, prep_start, prep_end = None, self.now, self.now
+            
+            slots, bake_start, bake_end = self._bake(job['quantity'], prep_end)
+            job.update(station=station, prep_start=prep_start, prep_end=prep_end,
+                       ovens=slots, bake_start=bake_start, bake_end=bake_end)
+            baked = max(baked, bake_end)
+        return jobs, baked
+    
+    def add(self, order):
+        """Planificar una orden nueva y fijar su tiempo estimado y sus hitos"""
+        jobs, baked = self.schedule(order.items)
+        order.set_estimated_time(self.minutes_until_ready(baked))
+        if jobs:
+            order.milestones = (
+                (min(job['prep_start'] for job in jobs), 'preparing'),
+                (min(job['bake_start'] for job in jobs), 'cooking'),
+                (baked, 'ready')
+            )
+        self.orders.append((order, jobs))
+        return order.estimated_time
+
+class KitchenScheduler:
+    """Agenda de la cocina: estaciones de preparación y ranuras del horno
+    
+    Cada recurso se guarda como (libre desde, número) en un heap de tamaño
+    fijo, así que planificar una orden cuesta O(k log S) para sus k trabajos,
+    sin recorrer las órdenes activas. Si una orden deja la cocina bastante
+    antes de lo previsto, o aparece una que no se planificó aquí (restauradas,
+    de otro worker o reabiertas), la agenda se reconstruye desde las órdenes
+    en curso en la siguiente planificación.
+    """
+    
+    def __init__(self, active_orders, prep_stations=KITCHEN_PREP_STATIONS,
+                 oven_slots=KITCHEN_OVEN_SLOTS):
+        self.active_orders = active_orders
+        self.prep_stations = max(1, prep_stations)
+        self.oven_slots = max(1, oven_slots)
+        self._lock = threading.Lock()
+        self._stations = [(0.0, station) for station in range(self.prep_stations)]
+        self._ovens = [(0.0, slot) for slot in range(self.oven_slots)]
+        # id de orden -> (orden, trabajos) de las órdenes que siguen en cocina
+        self._jobs = {}
+        self._generation = 0
+        self._stale = False
+    
+    def begin(self):
+        """Plan de trabajo sobre una copia de la agenda vigente"""
+        with self._lock:
+            if self._stale:
+                self._rebuild()
+            return KitchenPlan(self._stations, self._ovens, self._generation)
+    
+    def commit(self, plan):
+        """Adoptar un plan cuyas órdenes ya se confirmaron (y tienen id)"""
+        with self._lock:
+            for order, jobs in plan.orders:
+                self._jobs[order.id] = (order, jobs)
+            if plan.generation == self._generation:
+                self._stations = plan.stations
+                self._ovens = plan.ovens
+                self._generation += 1
+            else:
+                # Otro plan se confirmó primero: reconstruir con ambos
+                self._stale = True
+    
+    def estimate(self, items):
+        """Minutos estimados si la orden entrara ahora a la cocina, sin reservar nada"""
+        plan = self.begin()
+        _, baked = plan.schedule(items)
+        return plan.minutes_until_ready(baked)
+    
+    def update(self, order_id, status):
+        """Reflejar un cambio de estado de una orden en la agenda"""
+        with self._lock:
+            if status in KITCHEN_DONE_STATUSES:
+                entry = self._jobs.pop(order_id, None)
+                if entry and entry[1]:
+                    # Solo vale la pena replanificar si se libera capacidad apreciable
+                    baked = max(job['bake_end'] for job in entry[1])
+                    if baked > time.time() + KITCHEN_RELEASE_SLACK:
+                        self._stale = True
+            elif order_id not in self._jobs:
+                self._stale = True
+    
+    def invalidate(self):
+        """Forzar la reconstrucción de la agenda en la próxima planificación"""
+        with self._lock:
+            self._stale = True
+    
+    def _rebuild(self):
+        """Replanificar desde ahora todas las órdenes que siguen en cocina"""
+        orders = {order.id: order for order in self.active_orders}
+        orders.update((order_id, order) for order_id, (order, _) in self._jobs.items())
+        
+        plan = KitchenPlan(
+            [(0.0, station) for station in range(self.prep_stations)],
+            [(0.0, slot) for slot in range(self.oven_slots)]
+        )
+        jobs = {}
+        for order in sorted(orders.values(), key=lambda o: (o.created_at, o.id)):
+            if order.status in KITCHEN_DONE_STATUSES:
+                continue
+            order_jobs, _ = plan.schedule(order.items, prep=order.status != 'cooking')
+            jobs[order.id] = (order, order_jobs)
+        
+        self._stations = plan.stations
+        self._ovens = plan.ovens
+        self._jobs = jobs
+        self._generation += 1
+        self._stale = False
+    
+    def work_queue(self):
+        """Trabajos planificados ordenados por inicio de preparación, y la
+        ocupación de estaciones y ranuras como (número, libre desde)"""
+        with self._lock:
+            if self._stale:
+                self._rebuild()
+            jobs = [
+                dict(job, order_id=order_id, order_status=order.status)
+                for order_id, (order, order_jobs) in self._jobs.items()
+                for job in order_jobs
+            ]
+            stations = sorted((station, free_at) for free_at, station in self._stations)
+            ovens = sorted((slot, free_at) for free_at, slot in self._ovens)
+        jobs.sort(key=lambda job: (job['prep_start'], job['order_id']))
+        return jobs, stations, ovens
+
+# Instantánea inmutable del estado del restaurante; se reemplaza completa en cada cambio
+RestaurantStatus = namedtuple(
+    'RestaurantStatus',
+    ['current_orders', 'average_wait_time', 'status', 'last_updated', 'version']
+)
+
+class OrderManager:
+    """Gestor de órdenes y tiempos de espera"""
+    
+    def __init__(self, db, events=None, analytics=None, recipes=None, menu_cache=None,
+                 shared_state=SHARED_STATE):
+        self.db = db
+        self.events = events or OrderEventBus()
+        self.analytics = analytics or SalesAnalytics(db)
+        self.recipes = recipes or RecipeIndex(db)
+        self.menu_cache = menu_cache
+        self.active_orders = ActiveOrderRegistry()
+        self.kitchen = KitchenScheduler(self.active_orders)
+        self.tracker = OrderTracker()
+        # Heap de transiciones pendientes: (instante, secuencia, id de orden, estado)
+        self._transitions = []
+        self._transition_seq = 0
+        self._wakeup = threading.Condition()
+        self.writer = OrderWriter(db, self._write_order_batch)
+        self._status_lock = threading.Lock()
+        self._persisted_version = 0
+        self.status_snapshot = RestaurantStatus(0, 25, 'Recibiendo órdenes', self._timestamp(), 0)
+        # Con varios workers solo el líder aplica transiciones y persiste el estado;
+        # los demás siguen el registro de cambios de la base de datos
+        self.shared_state = shared_state
+        self.is_leader = not shared_state
+        self.worker_id = f'{os.getpid()}-{os.urandom(4).hex()}'
+        self._change_cursor = 0
+        self._lease_expires = 0
+        self.restore_active_orders()
+        if shared_state:
+            self.events.start_at(self._change_cursor)
+    
+    def start(self):
+        """Arrancar los hilos de fondo: transiciones, persistencia del estado y,
+        con varios workers, la sincronización y la elección de líder"""
+        self.complete_overdue_orders()
+        self.start_order_processor()
+        self.start_status_persister()
+        if self.shared_state:
+            self.start_state_sync()
+            self.start_leader_election()
+    
+    def add_order(self, order_data):
+        """Agregar nueva orden; devuelve la orden confirmada o None"""
+        try:
+            new_order = self.prepare_order(order_data)
+            
+            # El escritor asigna el id al confirmar el lote que contiene la orden
+            future = self.writer.submit(new_order)
+            try:
+                future.result(timeout=ORDER_WRITE_TIMEOUT)
+            except FutureTimeoutError:
+                self.finish_when_written(future, new_order)
+                raise OrderPendingError('La orden sigue en proceso, consulte su estado antes de reintentar')
+            
+            self.finish_order(new_order)
+            return new_order
+            
+        except (OutOfStockError, OrderPendingError):
+            raise
+        except Exception as e:
+            print(f"Error al agregar orden: {e}")
+            return None
+    
+    def add_orders(self, orders_data):
+        """Agregar un lote de órdenes en una sola transacción
+        
+        Devuelve, en el mismo orden, la orden confirmada o la excepción que
+        rechazó cada entrada (datos inválidos o falta de stock).
+        """
+        results = [None] * len(orders_data)
+        prepared = []  # (posición en el lote, orden)
+        for index, order_data in enumerate(orders_data):
+            try:
+                prepared.append((index, self.prepare_order(order_data)))
+            except Exception as e:
+                results[index] = e
+        
+        if prepared:
+            # Transacción propia en lugar del escritor: el lote se confirma
+            # completo aunque supere el tamaño de grupo del escritor
+            with self.db.connection() as conn:
+                written = self._write_order_batch(conn, [order for _, order in prepared])
+            for (index, order), result in zip(prepared, written):
+                if isinstance(result, Exception):
+                    results[index] = result
+                else:
+                    self.finish_order(order)
+                    results[index] = order
+        
+        return results
+    
+    def prepare_order(self, order_data):
+        """Construir la orden activa (sin id) lista para enviarse al escritor"""
+        estimated_time = self.calculate_estimated_time(order_data['items'])
+        
+        new_order = ActiveOrder(
+            None,
+            order_data['items'],
+            order_data['total'],
+            estimated_time,
+            order_data.get('customer', 'Cliente'),
+            order_data.get('payment', 'efectivo')
+        )
+        new_order.stock = self.recipes.requirements(new_order.items)
+        return new_order
+    
+    def finish_when_written(self, future, order):
+        """Anunciar una orden cuya espera se agotó cuando el escritor la confirme
+        
+        La escritura no se cancela: reintentar tras el timeout duplicaría la orden.
+        """
+        def written(future):
+            if future.exception() is None:
+                self.finish_order(order)
+        
+        future.add_done_callback(written)
+    
+    def finish_order(self, order):
+        """Programar y anunciar una orden ya confirmada por el escritor"""
+        self.schedule_transitions(order)
+        # En modo compartido el evento lo emite la sincronización, con el id del cambio
+        if not self.shared_state:
+            self.events.publish('order_created', self.serialize_order(order))
+        print(f"Nueva orden agregada: #{order.id}")
+    
+    def _reserve_stock(self, cursor, order):
+        """Descontar los ingredientes de una orden con un único UPDATE
+        
+        Lanza OutOfStockError si alguna pizza no está disponible o algún
+        ingrediente no alcanza; el llamador revierte el savepoint de la orden.
+        Devuelve los ids de ingredientes descontados.
+        """
+        needed, pizza_ids = order.stock
+        
+        if pizza_ids:
+            unavailable = cursor.execute(f'''
+                SELECT name FROM pizzas WHERE id IN ({', '.join('?' * len(pizza_ids))}) AND available = 0
+            ''', list(pizza_ids)).fetchall()
+            if unavailable:
+                raise OutOfStockError(
+                    f"No disponible: {', '.join(row[0] for row in unavailable)}"
+                )
+        
+        if not needed:
+            return []
+        
+        # Un solo UPDATE para todos los ingredientes; la condición de stock
+        # hace que los que no alcanzan simplemente no se actualicen
+        params = [value for pair in needed.items() for value in pair]
+        cursor.execute(f'''
+            UPDATE ingredients
+            SET stock = stock - r.column2, last_updated = CURRENT_TIMESTAMP
+            FROM (VALUES {', '.join('(?, ?)' for _ in needed)}) AS r
+            WHERE ingredients.id = r.column1 AND ingredients.stock >= r.column2
+        ''', params)
+        
+        if cursor.rowcount != len(needed):
+            raise OutOfStockError("Ingredientes insuficientes para completar la orden")
+        return list(needed)
+    
+    def disable_low_stock_pizzas(self, cursor, ingredient_ids):
+        """Desactivar las pizzas que usan ingredientes por debajo del mínimo"""
+        if not ingredient_ids:
+            return 0
+        cursor.execute(f'''
+            UPDATE pizzas SET available = 0, auto_disabled = 1
+            WHERE available = 1 AND id IN (
+                SELECT pi.pizza_id
+                FROM pizza_ingredients pi
+                JOIN ingredients i ON i.id = pi.ingredient_id
+                WHERE pi.ingredient_id IN ({', '.join('?' * len(ingredient_ids))})
+                  AND i.stock < i.min_stock
+            )
+        ''', list(ingredient_ids))
+        return cursor.rowcount
+    
+    def _write_order_batch(self, conn, orders):
+        """Insertar un lote de órdenes en una sola transacción
+        
+        Cada orden va en su propio savepoint: si no hay stock solo se revierte
+        esa orden y su resultado es la excepción correspondiente. El tiempo
+        estimado sale de la agenda de cocina, que ya incluye las órdenes
+        aceptadas antes en el mismo lote.
+        """
+        cursor = conn.cursor()
+        self.db.begin_immediate(conn, 'order_batch')
+        kitchen_plan = self.kitchen.begin()
+        
+        results = []
+        accepted = []
+        touched_ingredients = set()
+        for order in orders:
+            cursor.execute('SAVEPOINT order_insert')
+            try:
+                touched_ingredients.update(self._reserve_stock(cursor, order))
+                kitchen_plan.add(order)
+                
+                cursor.execute('''
+                    INSERT INTO orders (order_data, total_price, estimated_time, customer_name, payment_method, status)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (
+                    json.dumps(order.items),
+                    order.total,
+                    order.estimated_time,
+                    order.customer,
+                    order.payment,
+                    'received'
+                ))
+                order.id = cursor.lastrowid
+                
+                cursor.executemany('''
+                    INSERT INTO order_items
+                        (order_id, line_no, pizza_id, name, size, size_label, quantity, unit_price, extra)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', order_item_rows(order.id, order.items))
+                
+                cursor.execute('RELEASE SAVEPOINT order_insert')
+                accepted.append(order)
+                results.append(order.id)
+            except OutOfStockError as e:
+                cursor.execute('ROLLBACK TO SAVEPOINT order_insert')
+                cursor.execute('RELEASE SAVEPOINT order_insert')
+                results.append(e)
+        
+        self.analytics.record_orders(conn, [order.id for order in accepted])
+        menu_changed = self.disable_low_stock_pizzas(cursor, touched_ingredients)
+        
+        conn.commit()
+        self.kitchen.commit(kitchen_plan)
+        
+        if menu_changed and self.menu_cache is not None:
+            self.menu_cache.invalidate()
+        
+        # Agregar a órdenes activas
+        for order in accepted:
+            self.active_orders.add(order)
+        
+        # Actualizar estado del restaurante
+        if accepted:
+            self.update_restaurant_status()
+        
+        return results
+    
+    def serialize_order(self, order):
+        """Representación JSON de una orden activa (mismo formato que /api/admin/orders)"""
+        return {
+            'id': order.id,
+            'items': order.items,
+            'total': order.total,
+            'estimated_time': order.estimated_time,
+            'customer': order.customer,
+            'payment': order.payment,
+            'status': order.status,
+            'progress': order.progress,
+            'created_at': order.created_at.isoformat(),
+            'completed_at': None
+        }
+    
+    @staticmethod
+    def transition_error(previous, status):
+        """Motivo por el que no se permite pasar de `previous` a `status`, o None"""
+        if status not in STATUS_SEQUENCE:
+            return f'Estado inválido: {status}'
+        if previous in STATUS_SEQUENCE and STATUS_SEQUENCE.index(status) < STATUS_SEQUENCE.index(previous):
+            return f'Transición inválida: {previous} → {status}'
+        return None
+    
+    def update_order_status(self, order_id, new_status):
+        """Actualizar el estado de una orden en la base de datos y en memoria
+        
+        Devuelve False si la orden no existe y lanza InvalidTransitionError si
+        el estado no es válido o retrocede; repetir el estado actual no hace nada.
+        """
+        with self.db.connection() as conn:
+            # Tomar el lock de escritura antes de leer el estado previo
+            self.db.begin_immediate(conn, 'order_status')
+            row = conn.execute('SELECT status FROM orders WHERE id = ?', (order_id,)).fetchone()
+            if row is None:
+                return False
+            error = self.transition_error(row[0], new_status)
+            if error:
+                raise InvalidTransitionError(error)
+            if new_status == row[0]:
+                return True
+            
+            conn.execute('''
+                UPDATE orders SET status = ?, completed_at = CASE 
+                    WHEN ? = 'completed' THEN CURRENT_TIMESTAMP 
+                    ELSE completed_at 
+                END
+                WHERE id = ?
+            ''', (new_status, new_status, order_id))
+            
+            # Solo se avanza, así que completar aquí es la primera vez
+            if new_status == 'completed':
+                self.analytics.record_completions(conn, [order_id])
+        
+        # Actualizar en órdenes activas también
+        progress = None
+        self.kitchen.update(order_id, new_status)
+        order = self.active_orders.set_status(order_id, new_status)
+        if order is not None:
+            progress = order.progress
+            print(f"Orden activa {order_id} actualizada a {new_status}")
+            
+            # Una orden cerrada por el chef deja de estar activa
+            if new_status in TERMINAL_STATUSES:
+                self.active_orders.remove(order_id)
+                self.update_restaurant_status()
+        
+        self.publish_status(order_id, new_status, progress)
+        return True
+    
+    def update_order_statuses(self, changes):
+        """Aplicar una lista de cambios (id, estado) en una sola transacción
+        
+        Solo se permite avanzar en STATUS_SEQUENCE; repetir el estado actual no
+        hace nada. Devuelve un resultado por cambio: None si es válido o el
+        mensaje de error que lo rechazó.
+        """
+        results = [None] * len(changes)
+        applied = []
+        ids = list({order_id for order_id, _ in changes})
+        
+        with self.db.connection() as conn:
+            self.db.begin_immediate(conn, 'order_status')
+            current = dict(conn.execute(f'''
+                SELECT id, status FROM orders WHERE id IN ({', '.join('?' * len(ids))})
+            ''', ids).fetchall())
+            
+            # Validar en orden, viendo el efecto de los cambios anteriores del lote
+            for index, (order_id, status) in enumerate(changes):
+                previous = current.get(order_id)
+                error = 'Orden no encontrada' if previous is None else self.transition_error(previous, status)
+                if error:
+                    results[index] = error
+                elif status != previous:
+                    current[order_id] = status
+                    applied.append((order_id, status))
+            
+            conn.executemany('''
+                UPDATE orders SET status = ?, completed_at = CASE 
+                    WHEN ? = 'completed' THEN CURRENT_TIMESTAMP 
+                    ELSE completed_at 
+                END
+                WHERE id = ?
+            ''', [(status, status, order_id) for order_id, status in applied])
+            
+            # Solo se avanza, así que cada 'completed' aplicado es la primera vez
+            completed = [order_id for order_id, status in applied if status == 'completed']
+            if completed:
+                self.analytics.record_completions(conn, completed)
+        
+        touched = self.active_orders.apply_statuses(applied)
+        for order_id, status in applied:
+            self.kitchen.update(order_id, status)
+        if any(status in TERMINAL_STATUSES for order_id, status in applied if order_id in touched):
+            self.update_restaurant_status()
+        
+        for order_id, status in applied:
+            order = touched.get(order_id)
+            self.publish_status(order_id, status, order.progress if order is not None else None)
+        
+        return results
+    
+    def publish_status(self, order_id, status, progress=None, event_id=None):
+        """Emitir el evento correspondiente a un cambio de estado"""
+        self.tracker.changed(order_id)
+        if self.shared_state and event_id is None:
+            return
+        if status == 'completed':
+            self.events.publish('order_completed', {
+                'id': order_id,
+                'status': status,
+                'completed_at': datetime.now().isoformat()
+            }, event_id)
+        else:
+            self.events.publish('order_status', {
+                'id': order_id,
+                'status': status,
+                'progress': progress
+            }, event_id)
+    
+    def calculate_estimated_time(self, items):
+        """Calcular tiempo estimado según la agenda de cocina"""
+        return self.kitchen.estimate(items)
+    
+    @staticmethod
+    def _timestamp():
+        """Marca de tiempo con el mismo formato que CURRENT_TIMESTAMP de SQLite"""
+        return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
     
     def update_restaurant_status(self):
-        """Actualizar estado general del restaurante"""
+        """Actualizar estado general del restaurante (instantánea en memoria)"""
         try:
             current_orders = len(self.active_orders)
             avg_wait = self.calculate_average_wait_time()
@@ -330,155 +2848,1054 @@ class OrderManager:
             else:
                 status = "Hora pico - Mayor demanda"
             
+            # Reemplazo atómico: los lectores ven la instantánea anterior o la nueva
+            with self._status_lock:
+                self.status_snapshot = RestaurantStatus(
+                    current_orders, avg_wait, status, self._timestamp(),
+                    self.status_snapshot.version + 1
+                )
+            
+        except Exception as e:
+            print(f"Error al actualizar estado del restaurante: {e}")
+    
+    def persist_restaurant_status(self):
+        """Guardar la instantánea en `restaurant_status` si cambió desde la última vez"""
+        snapshot = self.status_snapshot
+        if snapshot.version == self._persisted_version:
+            return
+        try:
             self.db.execute_with_retry('''
                 UPDATE restaurant_status 
-                SET current_orders = ?, average_wait_time = ?, status = ?, last_updated = CURRENT_TIMESTAMP
+                SET current_orders = ?, average_wait_time = ?, status = ?, last_updated = ?
                 WHERE id = 1
-            ''', (current_orders, avg_wait, status))
+            ''', (snapshot.current_orders, snapshot.average_wait_time, snapshot.status, snapshot.last_updated))
+            self._persisted_version = snapshot.version
             
         except Exception as e:
-            print(f"Error al actualizar estado del restaurante: {e}")
+            print(f"Error al guardar estado del restaurante: {e}")
+    
+    def prune_order_changes(self):
+        """Recortar el registro de cambios a los más recientes"""
+        try:
+            self.db.execute_with_retry('''
+                DELETE FROM order_changes
+                WHERE id <= (SELECT MAX(id) FROM order_changes) - ?
+            ''', (ORDER_CHANGES_RETENTION,))
+        except Exception as e:
+            print(f"Error al recortar order_changes: {e}")
+    
+    def start_status_persister(self):
+        """Persistir periódicamente el estado del restaurante en hilo separado"""
+        def persist_status():
+            while True:
+                time.sleep(STATUS_PERSIST_INTERVAL)
+                if self.is_leader:
+                    self.persist_restaurant_status()
+                    self.prune_order_changes()
+        
+        thread = threading.Thread(target=persist_status, daemon=True)
+        thread.start()
     
     def calculate_average_wait_time(self):
         """Calcular tiempo promedio de espera"""
-        if not self.active_orders:
+        average = self.active_orders.average_estimated_time()
+        if average is None:
             return 25
         
-        total_time = sum(order['estimated_time'] for order in self.active_orders)
-        return max(20, min(50, total_time // len(self.active_orders)))
+        return max(20, min(50, average))
+    
+    @staticmethod
+    def _local_datetime(timestamp):
+        """Convertir un CURRENT_TIMESTAMP de SQLite (UTC) a la hora local usada en memoria"""
+        utc = datetime.strptime(timestamp[:19], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+        return utc.astimezone().replace(tzinfo=None)
+    
+    def restore_active_orders(self):
+        """Reconstruir las órdenes activas desde la base de datos tras un reinicio
+        
+        Solo lee: recorre el índice por estado, así que el tiempo de arranque
+        depende de las órdenes en curso y no del historial. Las órdenes cuyo
+        tiempo estimado venció con el servidor apagado no se cargan; las cierra
+        complete_overdue_orders() al arrancar los hilos de fondo.
+        """
+        marks = ', '.join('?' * len(ACTIVE_STATUSES))
+        
+        with self.db.connection() as conn:
+            # Transacción de lectura: órdenes y cursor de cambios de la misma instantánea
+            conn.execute('BEGIN')
+            rows = conn.execute(f'''
+                SELECT {self.ACTIVE_ORDER_COLUMNS}
+                FROM orders
+                WHERE status IN ({marks}) AND {self.OVERDUE_DEADLINE} > CURRENT_TIMESTAMP
+            ''', ACTIVE_STATUSES).fetchall()
+            
+            # Los workers siguen el registro de cambios a partir de este punto
+            self._change_cursor = conn.execute(
+                'SELECT COALESCE(MAX(id), 0) FROM order_changes'
+            ).fetchone()[0]
+        
+        for order in self._build_active_orders(rows):
+            self.active_orders.add(order)
+            self.schedule_transitions(order)
+        # La agenda de cocina se arma con las órdenes recuperadas al planificar
+        self.kitchen.invalidate()
+        
+        if rows:
+            print(f"Órdenes recuperadas: {len(rows)} activas")
+        self.update_restaurant_status()
+    
+    def complete_overdue_orders(self):
+        """Completar en una transacción las órdenes que vencieron con el servidor apagado
+        
+        completed_at queda igual a su hora de entrega prevista. Las que ya están
+        en memoria las cierra el procesador de transiciones.
+        """
+        marks = ', '.join('?' * len(ACTIVE_STATUSES))
+        deadline = self.OVERDUE_DEADLINE
+        
+        with self.db.connection() as conn:
+            self.db.begin_immediate(conn, 'restore')
+            overdue = [row[0] for row in conn.execute(f'''
+                SELECT id FROM orders
+                WHERE status IN ({marks}) AND {deadline} <= CURRENT_TIMESTAMP
+            ''', ACTIVE_STATUSES) if row[0] not in self.active_orders]
+            
+            for start in range(0, len(overdue), RECOVERY_BATCH_SIZE):
+                chunk = overdue[start:start + RECOVERY_BATCH_SIZE]
+                chunk_marks = ', '.join('?' * len(chunk))
+                conn.execute(f'''
+                    UPDATE orders SET status = 'completed', completed_at = {deadline}
+                    WHERE id IN ({chunk_marks})
+                ''', chunk)
+                self.analytics.record_completions(conn, chunk)
+        
+        if overdue:
+            print(f"Órdenes completadas por vencimiento: {len(overdue)}")
+    
+    # Hora de entrega prevista de una fila de orders
+    OVERDUE_DEADLINE = "datetime(created_at, '+' || COALESCE(estimated_time, 25) || ' minutes')"
+    
+    # Columnas que espera _build_active_orders
+    ACTIVE_ORDER_COLUMNS = '''id,
+                       CASE WHEN EXISTS (SELECT 1 FROM order_items WHERE order_id = orders.id)
+                            THEN NULL ELSE order_data END,
+                       total_price, estimated_time, customer_name, payment_method, status, created_at'''
+    
+    def _build_active_orders(self, rows):
+        """Construir ActiveOrder a partir de filas con ACTIVE_ORDER_COLUMNS"""
+        order_items = {}
+        ids = [row[0] for row in rows]
+        for start in range(0, len(ids), RECOVERY_BATCH_SIZE):
+            order_items.update(self.db.fetch_order_items(ids[start:start + RECOVERY_BATCH_SIZE]))
+        
+        orders = []
+        for order_id, order_data, total, estimated_time, customer, payment, status, created_at in rows:
+            items = order_items.get(order_id)
+            if items is None:
+                try:
+                    items = json.loads(order_data) if order_data else []
+                except ValueError:
+                    items = []
+            
+            orders.append(ActiveOrder(
+                order_id,
+                items,
+                total,
+                estimated_time or 25,
+                customer or 'Cliente',
+                payment or 'efectivo',
+                status=status,
+                created_at=self._local_datetime(created_at)
+            ))
+        return orders
+    
+    def sync_shared_state(self):
+        """Aplicar los cambios de otros workers registrados en order_changes
+        
+        Es idempotente respecto a los cambios propios (ya aplicados en memoria)
+        y es el único origen de eventos en modo compartido, así que todos los
+        workers emiten los mismos ids. Devuelve el número de cambios leídos.
+        """
+        with self.db.connection() as conn:
+            changes = conn.execute('''
+                SELECT id, order_id, status, created FROM order_changes
+                WHERE id > ? ORDER BY id LIMIT ?
+            ''', (self._change_cursor, SHARED_STATE_BATCH)).fetchall()
+            if not changes:
+                return 0
+            
+            # Órdenes que pasarán a estar activas sin estar en memoria (p. ej.
+            # creadas por otro worker o reabiertas tras cerrarse en este lote)
+            present = {}
+            missing = set()
+            for _, order_id, status, _ in changes:
+                active = status in ACTIVE_STATUSES
+                if active and not present.get(order_id, order_id in self.active_orders):
+                    missing.add(order_id)
+                present[order_id] = active
+            missing = sorted(missing)
+            rows = []
+            for start in range(0, len(missing), RECOVERY_BATCH_SIZE):
+                chunk = missing[start:start + RECOVERY_BATCH_SIZE]
+                rows.extend(conn.execute(f'''
+                    SELECT {self.ACTIVE_ORDER_COLUMNS}
+                    FROM orders WHERE id IN ({', '.join('?' * len(chunk))})
+                ''', chunk).fetchall())
+        loaded = {order.id: order for order in self._build_active_orders(rows)}
+        
+        for change_id, order_id, status, created in changes:
+            order = self.active_orders.get(order_id)
+            if status in ACTIVE_STATUSES:
+                if order is None and order_id in loaded:
+                    order = loaded[order_id]
+                    self.active_orders.add(order)
+                    self.schedule_transitions(order)
+                if order is not None:
+                    order.status = status
+            else:
+                self.active_orders.remove(order_id)
+            self.kitchen.update(order_id, status)
+            
+            if created:
+                if order is not None:
+                    self.events.publish('order_created', self.serialize_order(order), change_id)
+            else:
+                progress = order.progress if order is not None else None
+                self.publish_status(order_id, status, progress, event_id=change_id)
+        
+        self._change_cursor = changes[-1][0]
+        self.update_restaurant_status()
+        return len(changes)
+    
+    def start_state_sync(self):
+        """Seguir el registro de cambios compartido en hilo separado"""
+        def sync_state():
+            while True:
+                try:
+                    # Sin pausa mientras quede un lote completo por aplicar
+                    if self.sync_shared_state() < SHARED_STATE_BATCH:
+                        time.sleep(SHARED_STATE_POLL_INTERVAL)
+                except Exception as e:
+                    print(f"Error al sincronizar estado compartido: {e}")
+                    time.sleep(1)
+        
+        thread = threading.Thread(target=sync_state, daemon=True)
+        thread.start()
+    
+    def renew_leadership(self):
+        """Tomar o renovar la concesión del procesador; devuelve si este worker es líder"""
+        now = time.time()
+        try:
+            with self.db.connection() as conn:
+                # El UPSERT no modifica nada si la concesión vigente es de otro worker
+                acquired = conn.execute('''
+                    INSERT INTO worker_leases (name, owner, expires_at) VALUES ('order_processor', ?, ?)
+                    ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                    WHERE worker_leases.owner = excluded.owner OR worker_leases.expires_at < ?
+                ''', (self.worker_id, now + LEADER_LEASE_TTL, now)).rowcount == 1
+            if acquired:
+                self._lease_expires = now + LEADER_LEASE_TTL
+        except Exception as e:
+            print(f"Error al renovar la concesión del procesador: {e}")
+            # Un fallo transitorio no cede el liderazgo mientras la concesión siga vigente
+            acquired = self.is_leader and now < self._lease_expires
+        
+        if acquired and not self.is_leader:
+            self.is_leader = True
+            print(f"Worker {self.worker_id} es el líder del procesador de órdenes")
+            # Retomar las transiciones de todas las órdenes conocidas
+            for order in self.active_orders:
+                self.schedule_transitions(order)
+        elif not acquired and self.is_leader:
+            self.is_leader = False
+            print(f"Worker {self.worker_id} dejó de ser líder")
+            with self._wakeup:
+                self._transitions.clear()
+        return self.is_leader
+    
+    def release_leadership(self):
+        """Ceder la concesión al apagar para que otro worker la tome sin esperar"""
+        if not self.shared_state:
+            return
+        self.is_leader = False
+        try:
+            self.db.execute_with_retry('''
+                DELETE FROM worker_leases WHERE name = 'order_processor' AND owner = ?
+            ''', (self.worker_id,))
+        except Exception as e:
+            print(f"Error al liberar la concesión del procesador: {e}")
+    
+    def start_leader_election(self):
+        """Competir periódicamente por la concesión del procesador"""
+        def elect():
+            while True:
+                self.renew_leadership()
+                time.sleep(LEADER_LEASE_RENEW)
+        
+        thread = threading.Thread(target=elect, daemon=True)
+        thread.start()
+    
+    def schedule_transitions(self, order):
+        """Programar las transiciones automáticas de una orden y despertar al procesador"""
+        if not self.is_leader:
+            return
+        with self._wakeup:
+            for deadline, status in order.transition_deadlines():
+                self._transition_seq += 1
+                heapq.heappush(self._transitions, (deadline, self._transition_seq, order.id, status))
+            self._wakeup.notify()
+    
+    def _next_due_transitions(self):
+        """Dormir hasta la próxima transición y devolver todas las que vencieron"""
+        with self._wakeup:
+            while True:
+                now = time.time()
+                if self._transitions and self._transitions[0][0] <= now:
+                    break
+                timeout = PROCESSOR_MAX_SLEEP
+                if self._transitions:
+                    timeout = min(timeout, self._transitions[0][0] - now)
+                self._wakeup.wait(timeout)
+            
+            due = []
+            while self._transitions and self._transitions[0][0] <= now:
+                deadline, _, order_id, status = heapq.heappop(self._transitions)
+                TRANSITION_LAG.observe(now - deadline)
+                due.append((order_id, status))
+            return due
+    
+    def apply_transitions(self, transitions):
+        """Aplicar un lote de transiciones vencidas"""
+        if not self.is_leader:
+            return
+        
+        completed = []
+        advanced = []
+        for order_id, status in transitions:
+            order = self.active_orders.get(order_id)
+            if order is None:
+                continue
+            
+            # Nunca retroceder un estado que el chef ya avanzó a mano
+            if STATUS_SEQUENCE.index(status) <= STATUS_SEQUENCE.index(order.status):
+                continue
+            
+            if status == 'completed':
+                completed.append(order)
+                continue
+            
+            self.active_orders.set_status(order_id, status)
+            self.kitchen.update(order_id, status)
+            advanced.append((status, order_id))
+            self.publish_status(order_id, status, order.progress)
+        
+        # Los demás workers solo ven los estados intermedios a través de la base de datos
+        if advanced and self.shared_state:
+            self.persist_transitions(advanced)
+        
+        if completed:
+            # Todas las órdenes que vencen juntas se cierran en una sola transacción
+            closed = set(self.complete_orders([order.id for order in completed]))
+            for order in completed:
+                self.active_orders.remove(order.id)
+                self.kitchen.update(order.id, 'completed')
+                # Las que ya estaban cerradas en la base conservan su estado
+                if order.id in closed:
+                    order.status = 'completed'
+                    self.publish_status(order.id, 'completed')
+            
+            # Actualizar estado del restaurante
+            self.update_restaurant_status()
+    
+    def persist_transitions(self, advanced):
+        """Guardar estados intermedios sin retroceder los que el chef ya avanzó"""
+        rank = 'CASE status ' + ' '.join(
+            f"WHEN '{status}' THEN {index}" for index, status in enumerate(STATUS_SEQUENCE)
+        ) + ' END'
+        try:
+            with self.db.connection() as conn:
+                self.db.begin_immediate(conn, 'transitions')
+                conn.executemany(f'''
+                    UPDATE orders SET status = ? WHERE id = ? AND {rank} < ?
+                ''', [(status, order_id, STATUS_SEQUENCE.index(status)) for status, order_id in advanced])
+        except Exception as e:
+            print(f"Error al guardar transiciones: {e}")
     
     def start_order_processor(self):
         """Iniciar procesador de órdenes en hilo separado"""
         def process_orders():
             while True:
                 try:
-                    current_time = datetime.now()
-                    orders_to_remove = []
-                    
-                    for order in self.active_orders:
-                        # Calcular progreso basado en tiempo transcurrido
-                        elapsed = (current_time - order['created_at']).total_seconds() / 60
-                        progress = min(100, (elapsed / order['estimated_time']) * 100)
-                        order['progress'] = progress
-                        
-                        # Actualizar estado de la orden
-                        if progress >= 100:
-                            order['status'] = 'completed'
-                            orders_to_remove.append(order)
-                            self.complete_order(order['id'])
-                        elif progress >= 75:
-                            order['status'] = 'ready'
-                        elif progress >= 50:
-                            order['status'] = 'cooking'
-                        elif progress >= 25:
-                            order['status'] = 'preparing'
-                    
-                    # Remover órdenes completadas
-                    for completed_order in orders_to_remove:
-                        self.active_orders.remove(completed_order)
-                    
-                    # Actualizar estado del restaurante
-                    if orders_to_remove:
-                        self.update_restaurant_status()
-                    
-                    time.sleep(30)  # Revisar cada 30 segundos
+                    self.apply_transitions(self._next_due_transitions())
                     
                 except Exception as e:
                     print(f"Error en procesador de órdenes: {e}")
-                    time.sleep(60)
+                    time.sleep(5)
+        
+        thread = threading.Thread(target=process_orders, daemon=True)
+        thread.start()
+    
+    def complete_orders(self, order_ids):
+        """Marcar un lote de órdenes como completadas en una sola transacción
+        
+        Devuelve los ids que se completaron. Las que otro worker o el chef ya
+        cerraron (completed o delivered) no retroceden ni se vuelven a contar.
+        """
+        try:
+            with self.db.connection() as conn:
+                self.db.begin_immediate(conn, 'complete_orders')
+                pending = [row[0] for row in conn.execute(f'''
+                    SELECT id FROM orders
+                    WHERE id IN ({', '.join('?' * len(order_ids))})
+                      AND status NOT IN ({', '.join('?' * len(TERMINAL_STATUSES))})
+                ''', list(order_ids) + list(TERMINAL_STATUSES))]
+                
+                conn.executemany('''
+                    UPDATE orders 
+                    SET status = 'completed', completed_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', [(order_id,) for order_id in pending])
+                
+                self.analytics.record_completions(conn, pending)
+            return pending
+            
+        except Exception as e:
+            print(f"Error al completar órdenes {order_ids}: {e}")
+            return []
+    
+    def complete_order(self, order_id):
+        """Marcar orden como completada"""
+        return order_id in self.complete_orders([order_id])
+
+class MenuCache:
+    """Cache en memoria del menú ya serializado, con ETag fuerte"""
+    
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._body = None
+        self._etag = None
+        self._version = None
+        self._checked_at = 0.0
+    
+    def _read_version(self):
+        """Leer el contador de versión que mantienen los triggers de `pizzas`"""
+        result = self.db.execute_with_retry(
+            'SELECT version FROM menu_version WHERE id = 1', fetch=True
+        )
+        return result[0][0] if result else 0
+    
+    def _build(self):
+        """Consultar el menú y serializarlo una sola vez"""
+        result = self.db.execute_with_retry('''
+            SELECT id, name, category, emoji, ingredients, price, time_range, available
+            FROM pizzas WHERE available = 1
+        ''', fetch=True)
+        
+        pizzas = []
+        for row in result:
+            pizzas.append({
+                'id': row[0],
+                'name': row[1],
+                'category': row[2],
+                'emoji': row[3],
+                'ingredients': row[4],
+                'price': row[5],
+                'time': row[6],
+                'available': bool(row[7])
+            })
+        
+        body = app.json.dumps({'menu': pizzas, 'status': 'success'}).encode('utf-8')
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        return body, etag
+    
+    def peek(self):
+        """(cuerpo, etag) si el cache está vigente sin consultar la base; si no, None"""
+        body, etag = self._body, self._etag
+        if body is not None and etag is not None and time.monotonic() - self._checked_at < MENU_CACHE_REVALIDATE:
+            return body, etag
+        return None
+    
+    def get(self):
+        """Devolver (cuerpo, etag) del menú, reconstruyéndolo solo si cambió"""
+        now = time.monotonic()
+        if self._body is not None and now - self._checked_at < MENU_CACHE_REVALIDATE:
+            return self._body, self._etag
+        
+        with self._lock:
+            if self._body is not None and now - self._checked_at < MENU_CACHE_REVALIDATE:
+                return self._body, self._etag
+            
+            # Detectar cambios hechos fuera de la API (p. ej. ediciones manuales)
+            version = self._read_version()
+            if self._body is None or version != self._version:
+                self._body, self._etag = self._build()
+                self._version = version
+            self._checked_at = time.monotonic()
+            return self._body, self._etag
+    
+    def invalidate(self):
+        """Descartar el menú cacheado tras una escritura en `pizzas`"""
+        with self._lock:
+            self._body = None
+            self._etag = None
+            self._version = None
+
+# Archivo servido desde memoria con sus variantes por codificación
+StaticAsset = namedtuple('StaticAsset', ['content_type', 'etag', 'variants', 'cache_control'])
+
+class StaticAssets:
+    """Recursos estáticos con hash en el nombre y variantes precomprimidas
+    
+    Al arrancar se lee `static/` una sola vez: cada archivo queda en memoria
+    junto con su versión gzip (y brotli si está instalado) y se publica con
+    el hash de su contenido en la URL, así que puede cachearse como inmutable.
+    Las páginas HTML se renderizan una vez con esas URLs y se revalidan por ETag.
+    """
+    
+    def __init__(self, root=STATIC_DIR):
+        self.root = root
+        self._urls = {}    # 'js/script.js' -> 'js/script.<hash>.js'
+        self._assets = {}  # ruta bajo /static/ (con o sin hash) -> StaticAsset
+        self._pages = {}   # plantilla -> StaticAsset ya renderizado
+        self.load()
+    
+    @staticmethod
+    def compress(body, content_type):
+        """Variantes del cuerpo por Content-Encoding; 'identity' siempre está"""
+        variants = {'identity': body}
+        if len(body) < STATIC_COMPRESS_MIN_SIZE or not content_type.startswith(STATIC_COMPRESSIBLE):
+            return variants
+        
+        compressed = gzip.compress(body, compresslevel=9, mtime=0)
+        if len(compressed) < len(body):
+            variants['gzip'] = compressed
+        if brotli is not None:
+            compressed = brotli.compress(body, quality=11)
+            if len(compressed) < len(body):
+                variants['br'] = compressed
+        return variants
+    
+    def load(self):
+        """Leer, fingerprintear y comprimir todos los archivos de `static/`"""
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, self.root).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    body = f.read()
+                
+                digest = hashlib.sha256(body).hexdigest()[:12]
+                stem, extension = os.path.splitext(name)
+                hashed = f'{stem}.{digest}{extension}'
+                
+                content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                if content_type.startswith(STATIC_COMPRESSIBLE):
+                    content_type += '; charset=utf-8'
+                variants = self.compress(body, content_type)
+                
+                self._urls[name] = hashed
+                self._assets[hashed] = StaticAsset(
+                    content_type, f'"{digest}"', variants, f'public, max-age={STATIC_MAX_AGE}, immutable'
+                )
+                # La ruta sin hash sigue disponible, pero el navegador la revalida
+                self._assets[name] = StaticAsset(content_type, f'"{digest}"', variants, 'no-cache')
         
-        thread = threading.Thread(target=process_orders, daemon=True)
-        thread.start()
+        print(f"Recursos estáticos cargados: {len(self._urls)}")
     
-    def complete_order(self, order_id):
-        """Marcar orden como completada"""
-        try:
-            self.db.execute_with_retry('''
-                UPDATE orders 
-                SET status = 'completed', completed_at = CURRENT_TIMESTAMP
-                WHERE id = ?
-            ''', (order_id,))
+    def url(self, name):
+        """URL con hash de un archivo de `static/` (usada desde las plantillas)"""
+        return '/static/' + self._urls.get(name, name)
+    
+    def get(self, name):
+        return self._assets.get(name)
+    
+    def page(self, template):
+        """Respuesta de una plantilla HTML renderizada una sola vez"""
+        asset = self._pages.get(template)
+        if asset is None:
+            body = render_template(template).encode('utf-8')
+            content_type = 'text/html; charset=utf-8'
+            asset = StaticAsset(
+                content_type,
+                f'"{hashlib.sha256(body).hexdigest()[:12]}"',
+                self.compress(body, content_type),
+                'no-cache'
+            )
+            self._pages[template] = asset
+        return self.response(asset)
+    
+    def response(self, asset):
+        """Elegir la variante según Accept-Encoding y responder (o 304)"""
+        encoding = 'identity'
+        for candidate in ('br', 'gzip'):
+            if candidate in asset.variants and request.accept_encodings.quality(candidate) > 0:
+                encoding = candidate
+                break
+        
+        # Cada variante tiene su propio ETag, como exige la negociación de contenido
+        etag = asset.etag if encoding == 'identity' else f'{asset.etag[:-1]}-{encoding}"'
+        headers = {
+            'ETag': etag,
+            'Cache-Control': asset.cache_control,
+            'Vary': 'Accept-Encoding'
+        }
+        if request.if_none_match.contains(etag.strip('"')):
+            return Response(status=304, headers=headers)
+        
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(asset.variants[encoding], content_type=asset.content_type, headers=headers)
+
+# Control de admisión por carriles para los endpoints del API
+class AdmissionLane:
+    """Carril con concurrencia acotada y cola de espera por prioridad
+    
+    Una petición entra si hay cupo y nadie espera; si no, espera su turno
+    hasta `budget` segundos. Con la cola llena, una petición de mayor
+    prioridad desplaza a la de menor prioridad más reciente. La desplazada y
+    las que agotan el presupuesto se rechazan sin haber tocado la base de datos.
+    """
+    
+    def __init__(self, name, limit, queue_size, budget):
+        self.name = name
+        self.limit = max(1, limit)
+        self.queue_size = queue_size
+        self.budget = budget
+        self.active = 0
+        self.queued = 0
+        # Heap de [prioridad, secuencia, evento, estado]; las entradas que ya
+        # no esperan se descartan al salir del heap
+        self._waiters = []
+        self._sequence = 0
+        # Promedio móvil de los segundos que una petición ocupa el carril
+        self._service_time = 0.05
+        self._lock = threading.Lock()
+    
+    def try_acquire(self):
+        """Tomar un cupo sin esperar; False si está lleno o hay cola"""
+        with self._lock:
+            if self.active < self.limit and not self.queued:
+                self.active += 1
+                return True
+            return False
+    
+    def acquire(self, priority):
+        """Esperar un cupo; devuelve None si la petición entra o el motivo del rechazo"""
+        with self._lock:
+            if self.active < self.limit and not self.queued:
+                self.active += 1
+                return None
             
-        except Exception as e:
-            print(f"Error al completar orden {order_id}: {e}")
+            if self.queued >= self.queue_size:
+                victim = max((waiter for waiter in self._waiters if waiter[3] == 'waiting'), default=None)
+                if victim is None or victim[0] <= priority:
+                    return 'queue_full'
+                victim[3] = 'evicted'
+                victim[2].set()
+                self.queued -= 1
+            
+            self._sequence += 1
+            waiter = [priority, self._sequence, threading.Event(), 'waiting']
+            heapq.heappush(self._waiters, waiter)
+            self.queued += 1
+        
+        waiter[2].wait(self.budget)
+        with self._lock:
+            if waiter[3] == 'waiting':
+                waiter[3] = 'timeout'
+                self.queued -= 1
+                if not self.queued:
+                    self._waiters.clear()
+            return None if waiter[3] == 'granted' else waiter[3]
+    
+    def release(self, held):
+        """Liberar un cupo; pasa directamente al siguiente en la cola si lo hay"""
+        with self._lock:
+            self._service_time += (held - self._service_time) * 0.1
+            while self._waiters:
+                waiter = heapq.heappop(self._waiters)
+                if waiter[3] == 'waiting':
+                    waiter[3] = 'granted'
+                    self.queued -= 1
+                    waiter[2].set()
+                    return
+            self.active -= 1
+    
+    def retry_after(self):
+        """Segundos sugeridos antes de reintentar: lo que tardaría en vaciarse el carril"""
+        with self._lock:
+            backlog = (self.active + self.queued) * self._service_time / self.limit
+        return min(ADMISSION_RETRY_AFTER_MAX, max(1, math.ceil(backlog)))
+
+class AdmissionController:
+    """Carriles de lectura y escritura para los endpoints del API
+    
+    Sin control de admisión, con SQLite bloqueado cada hilo espera el
+    timeout del pool y los hilos se acumulan hasta que todo el API,
+    incluido el menú, deja de responder. Con él, lo que no entra dentro del
+    presupuesto de espera recibe un 503 con Retry-After de inmediato.
+    """
+    
+    def __init__(self, routes=ADMISSION_ROUTES):
+        self.routes = routes
+        self.lanes = {
+            'read': AdmissionLane('read', ADMISSION_READ_LIMIT, ADMISSION_READ_QUEUE,
+                                  ADMISSION_READ_BUDGET_MS / 1000),
+            'write': AdmissionLane('write', ADMISSION_WRITE_LIMIT, ADMISSION_WRITE_QUEUE,
+                                   ADMISSION_WRITE_BUDGET_MS / 1000),
+        }
+    
+    def admit(self, endpoint, wait=True):
+        """(carril, motivo de rechazo) para un endpoint; carril None si no se limita
+        
+        Con wait=False no espera turno: si no hay cupo libre devuelve el motivo
+        'busy', que no cuenta como rechazo (lo usa el event loop de asgi.py).
+        """
+        route = self.routes.get(endpoint)
+        if route is None:
+            return None, None
+        
+        lane_name, priority = route
+        lane = self.lanes[lane_name]
+        if not wait:
+            if not lane.try_acquire():
+                return lane, 'busy'
+            ADMISSION_WAIT.observe(0, (lane_name,))
+            return lane, None
+        
+        started = time.perf_counter()
+        reason = lane.acquire(ADMISSION_PRIORITIES.index(priority))
+        ADMISSION_WAIT.observe(time.perf_counter() - started, (lane_name,))
+        if reason:
+            REQUESTS_SHED.inc((lane_name, priority, reason))
+        return lane, reason
 
 # Función para limpiar al cerrar la aplicación
 def cleanup():
     print("Cerrando aplicación de forma segura...")
+    if order_manager is not None:
+        if order_manager.is_leader:
+            order_manager.persist_restaurant_status()
+        order_manager.release_leadership()
+    if db is not None:
+        db.close()
 
-# Registrar función de limpieza
-atexit.register(cleanup)
-signal.signal(signal.SIGTERM, lambda s, f: cleanup())
+# Servicios de la aplicación: los crea create_app(), no la importación del módulo
+db = None
+order_events = None
+order_archive = None
+sales_analytics = None
+menu_cache = None
+recipe_index = None
+order_manager = None
+static_assets = None
+admission = None
+_background_started = False
+_init_lock = threading.Lock()
 
-# Inicializar base de datos y gestor de órdenes
-try:
-    db = PizzaDePrizzaDB(DB_NAME)
-    order_manager = OrderManager(db)
-    print("Sistema inicializado correctamente")
-except Exception as e:
-    print(f"Error al inicializar sistema: {e}")
-    exit(1)
+def create_app(db_name=None, start_background=True):
+    """Inicializar los servicios una sola vez y devolver la aplicación Flask
+    
+    Importar app.py no abre la base de datos ni arranca hilos. Las herramientas
+    de línea de comandos y los scripts usan start_background=False para no
+    arrancar el procesador de transiciones ni el mantenimiento; los servidores
+    (serve.py, asgi.py, `gunicorn "app:create_app()"`) lo llaman al arrancar, y
+    la primera petición lo llama si nadie lo hizo antes.
+    """
+    global db, order_events, order_archive, sales_analytics, menu_cache, recipe_index
+    global order_manager, static_assets, admission, _background_started
+    
+    with _init_lock:
+        if db is None:
+            started = time.perf_counter()
+            db = PizzaDePrizzaDB(db_name or DB_NAME)
+            order_events = OrderEventBus()
+            order_archive = OrderArchive(db)
+            sales_analytics = SalesAnalytics(db, order_archive)
+            menu_cache = MenuCache(db)
+            recipe_index = RecipeIndex(db)
+            order_manager = OrderManager(db, order_events, sales_analytics, recipe_index, menu_cache)
+            static_assets = StaticAssets()
+            admission = AdmissionController()
+            app.jinja_env.globals['asset_url'] = static_assets.url
+            metrics.gauge('pizza_active_orders', 'Órdenes activas en memoria', lambda: len(order_manager.active_orders))
+            metrics.gauge('pizza_order_writer_queue', 'Órdenes esperando al escritor', lambda: order_manager.writer.pending())
+            metrics.gauge('pizza_db_pool_open_connections', 'Conexiones SQLite abiertas', lambda: db.connection_pool.open_connections())
+            for lane in admission.lanes.values():
+                metrics.gauge(f'pizza_admission_{lane.name}_in_flight', f'Peticiones en curso en el carril {lane.name}',
+                              lambda lane=lane: lane.active)
+                metrics.gauge(f'pizza_admission_{lane.name}_queued', f'Peticiones esperando en el carril {lane.name}',
+                              lambda lane=lane: lane.queued)
+            print(f"Sistema inicializado correctamente en {time.perf_counter() - started:.3f}s")
+        
+        if start_background and not _background_started:
+            _background_started = True
+            db.start_order_items_backfill()
+            order_manager.start()
+            # El mantenimiento del archivo lo hace solo el líder (ver serve.py)
+            order_archive.start(lambda: order_manager.is_leader)
+            
+            # Registrar función de limpieza
+            atexit.register(cleanup)
+            if threading.current_thread() is threading.main_thread():
+                signal.signal(signal.SIGTERM, lambda s, f: cleanup())
+    return app
+
+@app.before_request
+def ensure_initialized():
+    """Inicialización perezosa para servidores que no llamaron a create_app()"""
+    if db is None:
+        create_app()
+
+@app.before_request
+def start_request_timer():
+    request.metrics_started = time.perf_counter()
+
+@app.before_request
+def admit_request():
+    """Control de admisión: 503 inmediato en lugar de encolar hilos detrás de SQLite"""
+    lane, shed = admission.admit(request.endpoint)
+    if lane is None:
+        return None
+    if shed:
+        retry_after = lane.retry_after()
+        response = jsonify({'error': 'Servidor saturado, intente de nuevo en unos segundos', 'retry_after': retry_after})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+    request.admission = (lane, time.perf_counter())
+
+def leave_admission():
+    """Devolver el cupo del control de admisión antes de terminar la petición"""
+    admitted = getattr(request, 'admission', None)
+    if admitted is not None:
+        request.admission = None
+        lane, started = admitted
+        lane.release(time.perf_counter() - started)
+
+@app.teardown_request
+def release_admission(exc):
+    leave_admission()
+
+@app.after_request
+def record_request_metrics(response):
+    """Contar y medir cada petición por su regla de ruta (no por la URL concreta)"""
+    started = getattr(request, 'metrics_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        HTTP_LATENCY.observe(time.perf_counter() - started, (request.method, route))
+        HTTP_REQUESTS.inc((request.method, route, response.status_code))
+    return response
 
 # Resto de las rutas del API sin cambios...
 @app.route('/')
 def index():
     """Servir página principal"""
-    return render_template('index.html')
+    return static_assets.page('index.html')
 
 @app.route('/chef')
 def chef_panel():
     """Servir panel de chef"""
-    return render_template('chef_panel.html')
+    return static_assets.page('chef_panel.html')
+
+@app.route('/static/<path:filename>')
+def serve_asset(filename):
+    """Servir archivos estáticos desde memoria, precomprimidos"""
+    asset = static_assets.get(filename)
+    if asset is None:
+        return jsonify({'error': 'Archivo no encontrado'}), 404
+    return static_assets.response(asset)
 
 @app.route('/<path:filename>')
 def serve_static(filename):
-    """Servir archivos estáticos"""
-    return send_from_directory('.', filename)
+    """Servir las páginas públicas por su nombre; el resto de la raíz no se expone"""
+    if filename not in PUBLIC_PAGES:
+        return jsonify({'error': 'Archivo no encontrado'}), 404
+    return static_assets.page(filename)
 
 @app.route('/api/menu', methods=['GET'])
 def get_menu():
     """Obtener menú completo"""
+    try:
+        body, etag = menu_cache.get()
+        
+        headers = {
+            'ETag': f'"{etag}"',
+            'Cache-Control': f'public, max-age={MENU_CACHE_MAX_AGE}, must-revalidate'
+        }
+        
+        # El cliente ya tiene la versión actual del menú
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers=headers)
+        
+        return Response(body, mimetype='application/json', headers=headers)
+        
+    except Exception as e:
+        return jsonify({'error': str(e), 'status': 'error'}), 500
+
+@app.route('/api/admin/pizzas/<int:pizza_id>/availability', methods=['PUT'])
+def update_pizza_availability(pizza_id):
+    """Activar o desactivar una pizza del menú"""
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        if 'available' in data:
+            available = 1 if data['available'] else 0
+            rowcount = db.execute_with_retry(
+                'UPDATE pizzas SET available = ?, auto_disabled = 0 WHERE id = ?',
+                (available, pizza_id)
+            )
+        else:
+            # Sin valor explícito se alterna la disponibilidad actual
+            rowcount = db.execute_with_retry(
+                'UPDATE pizzas SET available = 1 - available, auto_disabled = 0 WHERE id = ?',
+                (pizza_id,)
+            )
+        
+        if rowcount == 0:
+            return jsonify({'error': 'Pizza no encontrada'}), 404
+        
+        menu_cache.invalidate()
+        
+        result = db.execute_with_retry(
+            'SELECT available FROM pizzas WHERE id = ?', (pizza_id,), fetch=True
+        )
+        
+        return jsonify({
+            'success': True,
+            'pizza_id': pizza_id,
+            'available': bool(result[0][0]) if result else False
+        })
+        
+    except Exception as e:
+        print(f"Error en update_pizza_availability: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/ingredients', methods=['GET'])
+def admin_get_ingredients():
+    """Inventario de ingredientes"""
     try:
         result = db.execute_with_retry('''
-            SELECT id, name, category, emoji, ingredients, price, time_range, available
-            FROM pizzas WHERE available = 1
+            SELECT id, name, stock, min_stock, last_updated FROM ingredients ORDER BY name
         ''', fetch=True)
         
-        pizzas = []
-        for row in result:
-            pizzas.append({
+        return jsonify({'ingredients': [
+            {
                 'id': row[0],
                 'name': row[1],
-                'category': row[2],
-                'emoji': row[3],
-                'ingredients': row[4],
-                'price': row[5],
-                'time': row[6],
-                'available': bool(row[7])
-            })
+                'stock': row[2],
+                'min_stock': row[3],
+                'low_stock': row[2] < row[3],
+                'last_updated': row[4]
+            }
+            for row in result
+        ]})
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/ingredients/<int:ingredient_id>/stock', methods=['PUT'])
+def admin_update_ingredient_stock(ingredient_id):
+    """Reabastecer o corregir un ingrediente (`stock` absoluto o `add` relativo)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        if 'stock' in data:
+            query, value = 'UPDATE ingredients SET stock = ?, last_updated = CURRENT_TIMESTAMP WHERE id = ?', data['stock']
+        elif 'add' in data:
+            query, value = 'UPDATE ingredients SET stock = stock + ?, last_updated = CURRENT_TIMESTAMP WHERE id = ?', data['add']
+        else:
+            return jsonify({'error': 'Se requiere stock o add'}), 400
         
-        return jsonify({'menu': pizzas, 'status': 'success'})
+        if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+            return jsonify({'error': 'La cantidad debe ser un entero no negativo'}), 400
+        
+        with db.connection() as conn:
+            if conn.execute(query, (value, ingredient_id)).rowcount == 0:
+                return jsonify({'error': 'Ingrediente no encontrado'}), 404
+            
+            # Un stock absoluto puede bajar del mínimo: desactivar como al reservar
+            disabled = order_manager.disable_low_stock_pizzas(conn.cursor(), [ingredient_id])
+            # Reactivar las pizzas desactivadas por stock que ya tienen todo lo necesario
+            reenabled = conn.execute('''
+                UPDATE pizzas SET available = 1, auto_disabled = 0
+                WHERE auto_disabled = 1 AND NOT EXISTS (
+                    SELECT 1 FROM pizza_ingredients pi
+                    JOIN ingredients i ON i.id = pi.ingredient_id
+                    WHERE pi.pizza_id = pizzas.id AND i.stock < i.min_stock
+                )
+            ''').rowcount
+            stock = conn.execute('SELECT stock FROM ingredients WHERE id = ?', (ingredient_id,)).fetchone()[0]
+        
+        if disabled or reenabled:
+            menu_cache.invalidate()
+        
+        return jsonify({
+            'success': True,
+            'ingredient_id': ingredient_id,
+            'stock': stock,
+            'pizzas_disabled': disabled,
+            'pizzas_reenabled': reenabled
+        })
         
     except Exception as e:
-        return jsonify({'error': str(e), 'status': 'error'}), 500
+        print(f"Error en admin_update_ingredient_stock: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/ingredients/check/<int:pizza_id>', methods=['GET'])
+def check_ingredients(pizza_id):
+    """Verificar si hay ingredientes para preparar una pizza"""
+    try:
+        quantity = max(1, request.args.get('quantity', 1, type=int))
+        needed, _ = recipe_index.requirements([{'id': pizza_id, 'quantity': quantity}])
+        
+        pizza = db.execute_with_retry(
+            'SELECT available FROM pizzas WHERE id = ?', (pizza_id,), fetch=True
+        )
+        if not pizza:
+            return jsonify({'error': 'Pizza no encontrada'}), 404
+        
+        missing = []
+        if needed:
+            result = db.execute_with_retry(f'''
+                SELECT id, name, stock FROM ingredients WHERE id IN ({', '.join('?' * len(needed))})
+            ''', list(needed), fetch=True)
+            missing = [
+                {'id': row[0], 'name': row[1], 'stock': row[2], 'required': needed[row[0]]}
+                for row in result if row[2] < needed[row[0]]
+            ]
+        
+        return jsonify({
+            'pizza_id': pizza_id,
+            'available': bool(pizza[0][0]) and not missing,
+            'missing': missing
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/api/orders', methods=['POST'])
 def create_order():
     """Crear nueva orden"""
     try:
-        order_data = request.get_json()
+        order_data = request.get_json(silent=True)
         
-        if not order_data or 'items' not in order_data:
-            return jsonify({'error': 'Datos de orden inválidos'}), 400
+        error = validate_order_data(order_data)
+        if error:
+            return jsonify({'error': error}), 400
         
         print(f"Creando orden: {order_data}")
-        order_id = order_manager.add_order(order_data)
+        try:
+            order = order_manager.add_order(order_data)
+        except OutOfStockError as e:
+            return jsonify({'error': str(e), 'status': 'out_of_stock'}), 409
+        except OrderPendingError as e:
+            return jsonify({'error': str(e), 'status': 'pending'}), 503, {'Retry-After': '1'}
         
-        if order_id:
-            estimated_time = order_manager.calculate_estimated_time(order_data['items'])
+        if order:
             return jsonify({
-                'order_id': order_id,
-                'estimated_time': estimated_time,
+                'order_id': order.id,
+                'estimated_time': order.estimated_time,
                 'status': 'success',
                 'message': 'Orden creada exitosamente',
                 'customer': order_data.get('customer'),
@@ -491,46 +3908,119 @@ def create_order():
         print(f"Error en create_order: {e}")
         return jsonify({'error': str(e)}), 500
 
+def validate_order_data(order_data):
+    """Mensaje de error para una orden mal formada, o None si es válida"""
+    if not isinstance(order_data, dict):
+        return 'La orden debe ser un objeto'
+    items = order_data.get('items')
+    if not isinstance(items, list) or not items:
+        return 'La orden debe incluir al menos un item'
+    if not all(isinstance(item, dict) for item in items):
+        return 'Items de orden inválidos'
+    # Una cantidad negativa sumaría stock al descontar los ingredientes
+    for item in items:
+        quantity = item.get('quantity', 1)
+        if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity < 1:
+            return 'La cantidad de cada item debe ser un entero mayor o igual a 1'
+    total = order_data.get('total')
+    if isinstance(total, bool) or not isinstance(total, (int, float)) or total < 0:
+        return 'Total de orden inválido'
+    return None
+
+@app.route('/api/orders/batch', methods=['POST'])
+def create_orders_batch():
+    """Crear varias órdenes en una sola transacción (integraciones de delivery)
+    
+    Acepta {"orders": [...]} o directamente la lista. Cada orden se valida y
+    se confirma por separado dentro de la transacción; la respuesta trae un
+    resultado por orden, en el mismo orden del pedido.
+    """
+    try:
+        data = request.get_json(silent=True)
+        orders_data = data.get('orders') if isinstance(data, dict) else data
+        
+        if not isinstance(orders_data, list) or not orders_data:
+            return jsonify({'error': 'Se requiere una lista de órdenes'}), 400
+        if len(orders_data) > ORDER_BULK_MAX_SIZE:
+            return jsonify({'error': f'Máximo {ORDER_BULK_MAX_SIZE} órdenes por lote'}), 400
+        
+        results = [None] * len(orders_data)
+        valid = []  # (posición, datos)
+        for index, order_data in enumerate(orders_data):
+            error = validate_order_data(order_data)
+            if error:
+                results[index] = {'index': index, 'status': 'error', 'error': error}
+            else:
+                valid.append((index, order_data))
+        
+        print(f"Creando lote de {len(valid)} órdenes ({len(orders_data) - len(valid)} inválidas)")
+        created = order_manager.add_orders([order_data for _, order_data in valid])
+        
+        for (index, _), outcome in zip(valid, created):
+            if isinstance(outcome, OutOfStockError):
+                results[index] = {'index': index, 'status': 'out_of_stock', 'error': str(outcome)}
+            elif isinstance(outcome, Exception):
+                results[index] = {'index': index, 'status': 'error', 'error': str(outcome)}
+            else:
+                results[index] = {
+                    'index': index,
+                    'status': 'success',
+                    'order_id': outcome.id,
+                    'estimated_time': outcome.estimated_time
+                }
+        
+        accepted = sum(1 for result in results if result['status'] == 'success')
+        return jsonify({
+            'accepted': accepted,
+            'rejected': len(results) - accepted,
+            'results': results
+        })
+        
+    except Exception as e:
+        print(f"Error en create_orders_batch: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/orders/status', methods=['GET'])
 def get_orders_status():
     """Obtener estado general de órdenes"""
     try:
-        result = db.execute_with_retry('''
-            SELECT current_orders, average_wait_time, status, last_updated
-            FROM restaurant_status WHERE id = 1
-        ''', fetch=True)
-        
-        if result:
-            row = result[0]
-            return jsonify({
-                'currentOrders': row[0],
-                'averageWaitTime': row[1],
-                'status': row[2],
-                'lastUpdated': row[3],
-                'activeOrders': len(order_manager.active_orders)
-            })
-        else:
-            return jsonify({'error': 'No se pudo obtener el estado'}), 500
+        # Se sirve desde memoria; la tabla restaurant_status solo es respaldo
+        snapshot = order_manager.status_snapshot
+        return jsonify({
+            'currentOrders': snapshot.current_orders,
+            'averageWaitTime': snapshot.average_wait_time,
+            'status': snapshot.status,
+            'lastUpdated': snapshot.last_updated,
+            'activeOrders': len(order_manager.active_orders)
+        })
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Métricas del proceso en formato de texto de Prometheus"""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/api/debug/orders', methods=['GET'])
 def debug_orders():
     """Debug endpoint para ver estado de órdenes - CON MANEJO DE ERRORES"""
     try:
-        # Contar órdenes en DB con manejo de errores
+        # Contar órdenes en DB con manejo de errores (conteos mantenidos por triggers)
         try:
-            result = db.execute_with_retry('SELECT COUNT(*) FROM orders', fetch=True)
-            db_count = result[0][0] if result else 0
+            result = db.execute_with_retry('''
+                SELECT (SELECT live FROM order_counts WHERE id = 1),
+                       (SELECT COALESCE(SUM(orders_count), 0) FROM order_archives)
+            ''', fetch=True)
+            db_count, archived_count = result[0] if result else (0, 0)
         except Exception as e:
             print(f"Error al contar órdenes: {e}")
-            db_count = -1  # Indicar error
+            db_count = archived_count = -1  # Indicar error
         
         # Obtener últimas 5 órdenes con manejo de errores
         try:
             result = db.execute_with_retry(
-                'SELECT id, status, created_at FROM orders ORDER BY created_at DESC LIMIT 5', 
+                'SELECT id, status, created_at FROM orders ORDER BY created_at DESC, id DESC LIMIT 5', 
                 fetch=True
             )
             recent_orders = result if result else []
@@ -540,12 +4030,10 @@ def debug_orders():
         
         return jsonify({
             'database_orders_count': db_count,
+            'archived_orders_count': archived_count,
             'active_orders_count': len(order_manager.active_orders),
             'recent_orders': recent_orders,
-            'active_orders': [
-                {'id': o['id'], 'status': o['status'], 'progress': o.get('progress', 0)}
-                for o in order_manager.active_orders
-            ],
+            'active_orders': [o.summary() for o in order_manager.active_orders],
             'database_status': 'ok' if db_count >= 0 else 'error'
         })
         
@@ -560,23 +4048,117 @@ def debug_orders():
             'database_status': 'error'
         }), 200  # Devolver 200 para que el cliente pueda ver el error
 
+def encode_orders_cursor(created_at, order_id):
+    """Cursor opaco para la paginación por clave (created_at, id)"""
+    raw = json.dumps([created_at, order_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_orders_cursor(cursor):
+    """Inverso de encode_orders_cursor; lanza ValueError si el cursor es inválido"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, order_id = json.loads(base64.urlsafe_b64decode(padded))
+        return str(created_at), int(order_id)
+    except Exception:
+        raise ValueError('Cursor inválido')
+
+def parse_timestamp_filter(value):
+    """Normalizar una fecha ISO al formato de CURRENT_TIMESTAMP para comparar en SQL"""
+    try:
+        return datetime.fromisoformat(value.replace('Z', '')).strftime('%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        raise ValueError(f'Fecha inválida: {value}')
+
+def build_orders_filter(args):
+    """Construir la cláusula WHERE del listado a partir de los parámetros de la URL"""
+    conditions = []
+    params = []
+    
+    status = args.get('status')
+    if status:
+        # `active` agrupa todos los estados no terminales
+        statuses = list(ACTIVE_STATUSES) if status == 'active' else status.split(',')
+        conditions.append(f"status IN ({', '.join('?' * len(statuses))})")
+        params.extend(statuses)
+    
+    customer = args.get('customer')
+    if customer:
+        conditions.append('customer_name = ?')
+        params.append(customer)
+    
+    if args.get('from'):
+        conditions.append('created_at >= ?')
+        params.append(parse_timestamp_filter(args['from']))
+    if args.get('to'):
+        conditions.append('created_at < ?')
+        params.append(parse_timestamp_filter(args['to']))
+    
+    if args.get('cursor'):
+        created_at, order_id = decode_orders_cursor(args['cursor'])
+        conditions.append('(created_at, id) < (?, ?)')
+        params.extend([created_at, order_id])
+    
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    return where, params
+
 @app.route('/api/admin/orders', methods=['GET'])
 def admin_get_orders():
-    """Obtener todas las órdenes (para administración) - CON MANEJO DE ERRORES"""
+    """Obtener órdenes paginadas por cursor (para administración) - CON MANEJO DE ERRORES
+    
+    Parámetros opcionales: status (lista separada por comas o `active`),
+    customer, from, to, limit, cursor (valor `next_cursor` de la página anterior)
+    y archived=1 para incluir los meses archivados.
+    """
+    archived = request.args.get('archived') in ('1', 'true')
     try:
-        result = db.execute_with_retry('''
-            SELECT id, order_data, total_price, estimated_time, customer_name, payment_method, status, created_at, completed_at
-            FROM orders
-            ORDER BY created_at DESC
-            LIMIT 50
-        ''', fetch=True)
+        where, params = build_orders_filter(request.args)
+        limit = min(max(int(request.args.get('limit', ADMIN_ORDERS_PAGE_SIZE)), 1), ADMIN_ORDERS_MAX_PAGE_SIZE)
+        
+        # Solo se adjuntan los meses que pueden tener filas de esta página
+        first_month = parse_timestamp_filter(request.args['from'])[:7] if request.args.get('from') else None
+        upper_bounds = []
+        if request.args.get('to'):
+            upper_bounds.append(parse_timestamp_filter(request.args['to']))
+        if request.args.get('cursor'):
+            upper_bounds.append(decode_orders_cursor(request.args['cursor'])[0])
+        last_month = min(upper_bounds)[:7] if upper_bounds else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        # Cursor tomado antes de leer: los eventos posteriores no se pierden
+        event_cursor = order_events.last_id
+        
+        # Se pide una fila extra solo para saber si hay otra página
+        if archived:
+            result, order_items = order_archive.list_orders(where, params, limit + 1, first_month, last_month)
+        else:
+            # order_data solo se lee para órdenes que el backfill todavía no normalizó
+            result = db.execute_with_retry(f'''
+                SELECT id,
+                       CASE WHEN EXISTS (SELECT 1 FROM order_items WHERE order_id = orders.id)
+                            THEN NULL ELSE order_data END,
+                       total_price, estimated_time, customer_name, payment_method, status, created_at, completed_at
+                FROM orders
+                {where}
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?
+            ''', params + [limit + 1], fetch=True)
+        
+        has_more = len(result) > limit
+        result = result[:limit]
+        
+        if not archived:
+            order_items = db.fetch_order_items([row[0] for row in result])
         
         orders = []
         for row in result:
-            try:
-                items = json.loads(row[1]) if row[1] else []
-            except:
-                items = []
+            items = order_items.get(row[0])
+            if items is None:
+                try:
+                    items = json.loads(row[1]) if row[1] else []
+                except:
+                    items = []
                 
             orders.append({
                 'id': row[0],
@@ -590,19 +4172,17 @@ def admin_get_orders():
                 'completed_at': row[8]
             })
         
+        next_cursor = encode_orders_cursor(result[-1][7], result[-1][0]) if has_more else None
+        
         # Combinar con órdenes activas
-        active_orders_info = []
-        for order in order_manager.active_orders:
-            active_orders_info.append({
-                'id': order['id'],
-                'status': order['status'],
-                'progress': order.get('progress', 0)
-            })
+        active_orders_info = [order.summary() for order in order_manager.active_orders]
         
         return jsonify({
             'orders': orders,
+            'next_cursor': next_cursor,
             'active_orders': active_orders_info,
-            'total_active': len(order_manager.active_orders)
+            'total_active': len(order_manager.active_orders),
+            'event_cursor': event_cursor
         })
         
     except Exception as e:
@@ -610,14 +4190,186 @@ def admin_get_orders():
         # Devolver datos básicos en caso de error
         return jsonify({
             'orders': [],
+            'next_cursor': None,
             'active_orders': [
-                {'id': o['id'], 'status': o['status'], 'progress': o.get('progress', 0)}
-                for o in order_manager.active_orders
+                o.summary() for o in order_manager.active_orders
             ] if order_manager else [],
             'total_active': len(order_manager.active_orders) if order_manager else 0,
             'error': str(e)
         })
 
+def analytics_range(args):
+    """Granularidad y rango [from, to) de buckets para los endpoints de analítica"""
+    granularity = args.get('granularity', 'day')
+    if granularity not in ANALYTICS_GRANULARITIES:
+        raise ValueError(f'Granularidad inválida: {granularity}')
+    length = ANALYTICS_GRANULARITIES[granularity]
+    
+    # Por defecto: últimos 7 días o últimas 24 horas (UTC)
+    now = datetime.utcnow()
+    default_start = now - (timedelta(days=6) if granularity == 'day' else timedelta(hours=23))
+    start = parse_timestamp_filter(args['from']) if args.get('from') else default_start.strftime('%Y-%m-%d %H:%M:%S')
+    end = parse_timestamp_filter(args['to']) if args.get('to') else (now + timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
+    return granularity, start[:length], end[:length]
+
+@app.route('/api/admin/analytics/summary', methods=['GET'])
+def analytics_summary():
+    """Órdenes, ingresos y tiempos de preparación por hora o día (desde los rollups)"""
+    try:
+        granularity, start, end = analytics_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        return jsonify(sales_analytics.summary(granularity, start, end))
+    except Exception as e:
+        print(f"Error en analytics_summary: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/analytics/pizzas', methods=['GET'])
+def analytics_pizzas():
+    """Unidades e ingresos por pizza y categoría (desde los rollups)"""
+    try:
+        granularity, start, end = analytics_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        return jsonify(sales_analytics.pizza_sales(granularity, start, end))
+    except Exception as e:
+        print(f"Error en analytics_pizzas: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/analytics/rebuild', methods=['POST'])
+def analytics_rebuild():
+    """Regenerar los rollups desde las órdenes"""
+    try:
+        result = sales_analytics.rebuild()
+        return jsonify({'success': True, **result})
+    except Exception as e:
+        print(f"Error en analytics_rebuild: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/archive', methods=['GET'])
+def admin_archive():
+    """Meses archivados y configuración del mantenimiento"""
+    try:
+        months = [
+            {
+                'month': month,
+                'orders_count': orders_count,
+                'min_id': min_id,
+                'max_id': max_id,
+                'archived_at': archived_at
+            }
+            for month, _, orders_count, min_id, max_id, archived_at in order_archive.months()
+        ]
+        live = db.execute_with_retry('SELECT live FROM order_counts WHERE id = 1', fetch=True)
+        return jsonify({
+            'months': months,
+            'live_orders': live[0][0] if live else 0,
+            'archived_orders': sum(month['orders_count'] for month in months),
+            'after_days': order_archive.after_days,
+            'window': '-'.join(str(hour) for hour in order_archive.window)
+        })
+    except Exception as e:
+        print(f"Error en admin_archive: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/archive/run', methods=['POST'])
+def admin_archive_run():
+    """Archivar y compactar ahora, sin esperar la ventana de mantenimiento"""
+    try:
+        archived = order_archive.archive_old_orders()
+        return jsonify({'success': True, 'archived': archived, **order_archive.compact()})
+    except Exception as e:
+        print(f"Error en admin_archive_run: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/slow-queries', methods=['GET'])
+def admin_slow_queries():
+    """Consultas lentas recientes y huellas con su plan de ejecución"""
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify(slow_queries.report(max(1, min(limit, SLOW_QUERY_LOG_SIZE))))
+
+@app.route('/api/admin/slow-queries', methods=['DELETE'])
+def admin_clear_slow_queries():
+    """Vaciar el log de consultas lentas"""
+    slow_queries.clear()
+    return jsonify({'success': True})
+
+@app.route('/api/admin/kitchen/queue', methods=['GET'])
+def admin_kitchen_queue():
+    """Cola de trabajo de la cocina calculada por el planificador"""
+    try:
+        jobs, stations, ovens = order_manager.kitchen.work_queue()
+        now = time.time()
+        
+        def isoformat(timestamp):
+            return datetime.fromtimestamp(timestamp).isoformat(timespec='seconds')
+        
+        # Un recurso libre desde antes de ahora está libre ya
+        return jsonify({
+            'prep_stations': [
+                {'station': station, 'free_at': isoformat(max(now, free_at))} for station, free_at in stations
+            ],
+            'oven_slots': [
+                {'slot': slot, 'free_at': isoformat(max(now, free_at))} for slot, free_at in ovens
+            ],
+            'jobs': [{
+                'order_id': job['order_id'],
+                'order_status': job['order_status'],
+                'pizza_id': job['pizza_id'],
+                'name': job['name'],
+                'size': job['size'],
+                'quantity': job['quantity'],
+                'station': job['station'],
+                'ovens': job['ovens'],
+                'prep_start': isoformat(job['prep_start']),
+                'prep_end': isoformat(job['prep_end']),
+                'bake_start': isoformat(job['bake_start']),
+                'bake_end': isoformat(job['bake_end'])
+            } for job in jobs]
+        })
+        
+    except Exception as e:
+        print(f"Error en admin_kitchen_queue: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/orders/stream', methods=['GET'])
+def admin_orders_stream():
+    """Stream SSE con eventos incrementales de órdenes para el panel de chef"""
+    # EventSource reenvía el último id recibido al reconectarse
+    cursor = request.headers.get('Last-Event-ID') or request.args.get('cursor')
+    try:
+        cursor = int(cursor) if cursor is not None else order_events.last_id
+    except ValueError:
+        return jsonify({'error': 'Cursor inválido'}), 400
+    
+    def generate(cursor):
+        yield 'retry: 3000\n\n'
+        while True:
+            events = order_events.wait_for_events(cursor, EVENT_KEEPALIVE)
+            
+            if events is None:
+                # El cursor es demasiado antiguo: el panel debe recargar la lista
+                cursor = order_events.last_id
+                yield f'id: {cursor}\nevent: reset\ndata: {{}}\n\n'
+                continue
+            
+            if not events:
+                yield ': keep-alive\n\n'
+                continue
+            
+            for event_id, event_type, data in events:
+                yield f'id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n'
+                cursor = event_id
+    
+    return Response(generate(cursor), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @app.route('/api/orders/<int:order_id>/status', methods=['PUT'])
 def update_order_status(order_id):
     """Actualizar estado de una orden específica"""
@@ -630,75 +4382,184 @@ def update_order_status(order_id):
         
         print(f"Actualizando orden {order_id} a estado: {new_status}")
         
-        rowcount = db.execute_with_retry('''
-            UPDATE orders SET status = ?, completed_at = CASE 
-                WHEN ? = 'completed' THEN CURRENT_TIMESTAMP 
-                ELSE completed_at 
-            END
-            WHERE id = ?
-        ''', (new_status, new_status, order_id))
-        
-        if rowcount == 0:
+        if not order_manager.update_order_status(order_id, new_status):
             return jsonify({'error': 'Orden no encontrada'}), 404
         
-        # Actualizar en órdenes activas también
-        for order in order_manager.active_orders:
-            if order['id'] == order_id:
-                order['status'] = new_status
-                print(f"Orden activa {order_id} actualizada a {new_status}")
-                break
-        
         return jsonify({
             'success': True,
             'order_id': order_id,
             'status': new_status
         })
-        
+    
+    except InvalidTransitionError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"Error en update_order_status: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/orders/status/batch', methods=['PUT'])
+def update_orders_status_batch():
+    """Actualizar el estado de varias órdenes en una sola transacción
+    
+    Recibe {"updates": [{"id": 1, "status": "cooking"}, ...]}; cada cambio
+    se valida por separado y la respuesta trae un resultado por cambio.
+    """
+    try:
+        data = request.get_json(silent=True)
+        updates = data.get('updates') if isinstance(data, dict) else None
+        
+        if not isinstance(updates, list) or not updates:
+            return jsonify({'error': 'Se requiere una lista de actualizaciones'}), 400
+        if len(updates) > ORDER_BULK_MAX_SIZE:
+            return jsonify({'error': f'Máximo {ORDER_BULK_MAX_SIZE} actualizaciones por lote'}), 400
+        
+        changes = []
+        for update in updates:
+            if not isinstance(update, dict) or isinstance(update.get('id'), bool) or \
+                    not isinstance(update.get('id'), int) or not isinstance(update.get('status'), str):
+                return jsonify({'error': 'Cada actualización requiere id y status'}), 400
+            changes.append((update['id'], update['status']))
+        
+        print(f"Actualizando estado de {len(changes)} órdenes")
+        errors = order_manager.update_order_statuses(changes)
+        
+        results = []
+        for (order_id, status), error in zip(changes, errors):
+            if error:
+                results.append({'order_id': order_id, 'success': False, 'error': error})
+            else:
+                results.append({'order_id': order_id, 'success': True, 'status': status})
+        
+        updated = sum(1 for result in results if result['success'])
+        return jsonify({
+            'updated': updated,
+            'rejected': len(results) - updated,
+            'results': results
+        })
+        
+    except Exception as e:
+        print(f"Error en update_orders_status_batch: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def cached_order_status(order_id):
+    """Estado de una orden desde memoria (activas y terminadas recientes), o None"""
+    order = order_manager.active_orders.get(order_id)
+    if order is not None:
+        return {
+            'order_id': order_id,
+            'status': order.status,
+            'version': OrderTracker.version(order.status),
+            # En porcentaje entero: el ETag no cambia en cada consulta
+            'progress': round(order.progress),
+            'estimated_time': order.estimated_time,
+            'created_at': order.created_at.isoformat()
+        }
+    return order_manager.tracker.cached(order_id)
+
+def order_status_payload(order_id):
+    """Estado de una orden para el seguimiento; None si no existe
+    
+    Solo consulta la base (y el archivo) si la orden no está en memoria; el
+    estado de una orden terminada se recuerda para las consultas siguientes.
+    """
+    payload = cached_order_status(order_id)
+    if payload is not None:
+        return payload
+    
+    generation = order_manager.tracker.generation
+    result = db.execute_with_retry('''
+        SELECT status, estimated_time, created_at, completed_at
+        FROM orders WHERE id = ?
+    ''', (order_id,), fetch=True)
+    
+    # Órdenes antiguas: buscar en el mes archivado que cubre su id
+    row = result[0] if result else order_archive.find_order(order_id)
+    if not row:
+        return None
+    
+    payload = {
+        'order_id': order_id,
+        'status': row[0],
+        'version': OrderTracker.version(row[0]),
+        'estimated_time': row[1],
+        'created_at': row[2],
+        'completed_at': row[3]
+    }
+    order_manager.tracker.remember(payload, generation)
+    return payload
+
 @app.route('/api/orders/<int:order_id>/status', methods=['GET'])
 def get_order_status(order_id):
-    """Obtener estado específico de una orden"""
+    """Obtener estado específico de una orden
+    
+    Responde con un ETag por versión de la orden y 304 si coincide con
+    If-None-Match. Con ?wait=N (segundos) y el ETag actual en If-None-Match,
+    la petición espera a que la orden cambie antes de responder.
+    """
     try:
-        # Buscar en órdenes activas
-        for order in order_manager.active_orders:
-            if order['id'] == order_id:
-                return jsonify({
-                    'order_id': order_id,
-                    'status': order['status'],
-                    'progress': order.get('progress', 0),
-                    'estimated_time': order['estimated_time'],
-                    'created_at': order['created_at'].isoformat()
-                })
-        
-        # Buscar en base de datos
-        result = db.execute_with_retry('''
-            SELECT status, estimated_time, created_at, completed_at
-            FROM orders WHERE id = ?
-        ''', (order_id,), fetch=True)
+        wait = min(max(request.args.get('wait', 0, type=float), 0), ORDER_STATUS_MAX_WAIT)
         
-        if result:
-            row = result[0]
-            return jsonify({
-                'order_id': order_id,
-                'status': row[0],
-                'estimated_time': row[1],
-                'created_at': row[2],
-                'completed_at': row[3]
-            })
-        else:
+        def is_current(payload):
+            return request.if_none_match.contains_weak(OrderTracker.etag(payload))
+        
+        payload = order_status_payload(order_id)
+        if payload is not None and wait and is_current(payload):
+            # La espera no ocupa un cupo del control de admisión
+            leave_admission()
+            payload = order_manager.tracker.wait(
+                order_id, lambda: order_status_payload(order_id), is_current, wait)
+        
+        if payload is None:
             return jsonify({'error': 'Orden no encontrada'}), 404
+        
+        headers = {'ETag': f'W/"{OrderTracker.etag(payload)}"', 'Cache-Control': 'no-cache'}
+        if is_current(payload):
+            return Response(status=304, headers=headers)
+        
+        response = jsonify(payload)
+        response.headers.update(headers)
+        return response
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
+    import sys
+    
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    
+    # Los comandos de mantenimiento no arrancan los hilos de fondo
+    if command in ('rebuild-analytics', 'archive-orders'):
+        create_app(start_background=False)
+    
+    # Comando de mantenimiento: python app.py rebuild-analytics
+    if command == 'rebuild-analytics':
+        start = time.time()
+        result = sales_analytics.rebuild()
+        print(f"Rollups regenerados en {time.time() - start:.2f}s: {result}")
+        sys.exit(0)
+    
+    # Comando de mantenimiento: python app.py archive-orders
+    if command == 'archive-orders':
+        start = time.time()
+        archived = order_archive.archive_old_orders()
+        result = order_archive.compact()
+        print(f"{archived} órdenes archivadas en {time.time() - start:.2f}s: {result}")
+        sys.exit(0)
+    
     print("🍕 Iniciando Pizza Deprizza Server...")
     print(f"📊 Base de datos: {DB_NAME}")
     print("🌐 Servidor ejecutándose en http://localhost:5000")
     print("👨‍🍳 Panel de chef: http://localhost:5000/chef")
     
+    # Con debug=True el proceso que vigila los archivos solo reinicia al que
+    # sirve (WERKZEUG_RUN_MAIN=true): únicamente ese inicializa los servicios
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        try:
+            create_app()
+        except Exception as e:
+            print(f"Error al inicializar sistema: {e}")
+            sys.exit(1)
+    
     # Ejecutar servidor
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
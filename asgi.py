@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pizza Deprizza - Modo de servicio asíncrono (ASGI)
+
+Las rutas calientes del API (menú, creación de órdenes, estado general,
+estado por orden y el stream del panel de chef) se atienden desde un event
+loop de asyncio. El trabajo de base de datos se despacha a un pool de hilos
+lectores y a un ejecutor escritor de un solo hilo, y los reintentos esperan
+con asyncio.sleep en lugar de bloquear un hilo. El resto de las rutas se
+delegan a la aplicación Flask de app.py.
+
+Uso:
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+    python asgi.py            (requiere uvicorn instalado)
+"""
+
+import asyncio
+import io
+import json
+import re
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import app as backend
+
+# Configuración de los ejecutores de base de datos
+ASGI_READER_THREADS = max(1, backend.DB_POOL_SIZE - 2)
+ASGI_FALLBACK_THREADS = 8      # Hilos para las rutas delegadas a Flask
+# Hilos para las peticiones que esperan turno en el control de admisión (a lo
+# sumo tantas como caben en las colas de los carriles)
+ASGI_ADMISSION_THREADS = backend.ADMISSION_READ_QUEUE + backend.ADMISSION_WRITE_QUEUE
+DB_MAX_RETRIES = 3
+DB_RETRY_BASE_DELAY = 0.25     # Segundos; se duplica en cada reintento
+
+class AsyncDatabase:
+    """Despacho de trabajo SQLite a hilos lectores y a un escritor único"""
+    
+    def __init__(self, readers=ASGI_READER_THREADS):
+        self.reader = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='db-reader')
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+    
+    @staticmethod
+    def _retryable(error):
+        message = str(error)
+        return 'disk I/O error' in message or 'database is locked' in message
+    
+    async def _run(self, executor, fn, *args):
+        loop = asyncio.get_running_loop()
+        for attempt in range(DB_MAX_RETRIES):
+            try:
+                return await loop.run_in_executor(executor, fn, *args)
+            except sqlite3.OperationalError as e:
+                if not self._retryable(e) or attempt == DB_MAX_RETRIES - 1:
+                    raise
+                print(f"Error de base de datos en intento {attempt + 1}, reintentando: {e}")
+                # Backoff sin ocupar ningún hilo
+                await asyncio.sleep(DB_RETRY_BASE_DELAY * 2 ** attempt)
+    
+    async def read(self, fn, *args):
+        return await self._run(self.reader, fn, *args)
+    
+    async def write(self, fn, *args):
+        return await self._run(self.writer, fn, *args)
+    
+    def fetch(self, query, params=()):
+        """Consulta de lectura sin backoff interno (lo maneja _run)"""
+        return backend.db.execute_with_retry(query, params, fetch=True, max_retries=1)
+    
+    def shutdown(self):
+        self.reader.shutdown(wait=False)
+        self.writer.shutdown(wait=False)
+
+class Request:
+    """Petición HTTP mínima construida a partir del scope ASGI"""
+    
+    def __init__(self, scope, receive):
+        self.scope = scope
+        self.receive = receive
+        self.method = scope['method']
+        self.path = scope['path']
+        self.query = {
+            key: values[-1]
+            for key, values in parse_qs(scope.get('query_string', b'').decode('latin-1')).items()
+        }
+        self.headers = {
+            name.decode('latin-1').lower(): value.decode('latin-1')
+            for name, value in scope.get('headers', [])
+        }
+        self._body = None
+        self.admission = None  # (carril, inicio) mientras ocupa un cupo
+    
+    async def body(self):
+        if self._body is None:
+            chunks = []
+            while True:
+                message = await self.receive()
+                if message['type'] == 'http.disconnect':
+                    break
+                chunks.append(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            self._body = b''.join(chunks)
+        return self._body
+    
+    async def json(self):
+        try:
+            return json.loads(await self.body() or b'null')
+        except ValueError:
+            return None
+
+def _encode_headers(headers):
+    return [(name.lower().encode('latin-1'), str(value).encode('latin-1')) for name, value in headers.items()]
+
+async def send_response(send, status, body=b'', headers=None, content_type='application/json'):
+    """Enviar una respuesta completa"""
+    all_headers = {'Access-Control-Allow-Origin': '*'}
+    if content_type and status != 304:
+        all_headers['Content-Type'] = content_type
+    all_headers.update(headers or {})
+    all_headers['Content-Length'] = len(body)
+    await send({'type': 'http.response.start', 'status': status, 'headers': _encode_headers(all_headers)})
+    await send({'type': 'http.response.body', 'body': body})
+
+async def send_json(send, data, status=200, headers=None):
+    # Misma serialización que jsonify en las rutas Flask
+    body = backend.app.json.dumps(data).encode('utf-8') + b'\n'
+    await send_response(send, status, body, headers)
+
+def leave_admission(request):
+    """Devolver el cupo del control de admisión antes de terminar la petición"""
+    if request.admission is not None:
+        lane, started = request.admission
+        request.admission = None
+        lane.release(time.perf_counter() - started)
+
+class AsyncAPI:
+    """Aplicación ASGI: rutas calientes nativas y el resto delegado a Flask"""
+    
+    def __init__(self, flask_app=backend.app):
+        self.flask_app = flask_app
+        self.db = AsyncDatabase()
+        self.fallback = ThreadPoolExecutor(max_workers=ASGI_FALLBACK_THREADS, thread_name_prefix='wsgi')
+        self.admission_pool = ThreadPoolExecutor(max_workers=ASGI_ADMISSION_THREADS,
+                                                 thread_name_prefix='admission')
+        # (método, patrón, regla con el mismo nombre que en Flask para las métricas, handler);
+        # el nombre del handler es el endpoint de Flask para el control de admisión
+        self.routes = [
+            ('GET', re.compile(r'^/api/menu$'), '/api/menu', self.get_menu),
+            ('POST', re.compile(r'^/api/orders$'), '/api/orders', self.create_order),
+            ('GET', re.compile(r'^/api/orders/status$'), '/api/orders/status', self.get_orders_status),
+            ('GET', re.compile(r'^/api/orders/(\d+)/status$'), '/api/orders/<int:order_id>/status',
+             self.get_order_status),
+            ('PUT', re.compile(r'^/api/orders/(\d+)/status$'), '/api/orders/<int:order_id>/status',
+             self.update_order_status),
+            ('GET', re.compile(r'^/api/admin/orders/stream$'), '/api/admin/orders/stream',
+             self.admin_orders_stream),
+        ]
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        if backend.db is None:
+            # Servidor sin eventos lifespan: inicializar con la primera petición
+            await asyncio.get_running_loop().run_in_executor(None, backend.create_app)
+        
+        for method, pattern, rule, handler in self.routes:
+            if scope['method'] != method:
+                continue
+            match = pattern.match(scope['path'])
+            if match:
+                request = Request(scope, receive)
+                started = time.perf_counter()
+                response = {'status': 500}
+                
+                async def send_and_track(message):
+                    if message['type'] == 'http.response.start':
+                        response['status'] = message['status']
+                        # El stream SSE se mide hasta que empieza a responder
+                        backend.HTTP_LATENCY.observe(time.perf_counter() - started, (method, rule))
+                    await send(message)
+                
+                try:
+                    lane, shed = await self.admit(handler.__name__)
+                    if shed:
+                        retry_after = lane.retry_after()
+                        await send_json(send_and_track, {
+                            'error': 'Servidor saturado, intente de nuevo en unos segundos',
+                            'retry_after': retry_after
+                        }, 503, {'Retry-After': str(retry_after)})
+                    else:
+                        if lane is not None:
+                            request.admission = (lane, time.perf_counter())
+                        await handler(request, send_and_track, *match.groups())
+                except Exception as e:
+                    print(f"Error en {scope['method']} {scope['path']}: {e}")
+                    await send_json(send_and_track, {'error': str(e)}, 500)
+                finally:
+                    leave_admission(request)
+                backend.HTTP_REQUESTS.inc((method, rule, response['status']))
+                return
+        
+        await self.call_flask(scope, receive, send)
+    
+    async def admit(self, endpoint):
+        """Control de admisión de app.py para las rutas nativas
+        
+        Con cupo libre se entra sin salir del loop; la espera de turno ocupa un
+        hilo del pool de admisión, no el event loop.
+        """
+        admission = backend.admission
+        lane, shed = admission.admit(endpoint, wait=False)
+        if shed == 'busy':
+            loop = asyncio.get_running_loop()
+            lane, shed = await loop.run_in_executor(self.admission_pool, admission.admit, endpoint)
+        return lane, shed
+    
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                # Inicializar antes de la primera petición y fuera del event loop
+                await asyncio.get_running_loop().run_in_executor(None, backend.create_app)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                backend.cleanup()
+                self.db.shutdown()
+                self.fallback.shutdown(wait=False)
+                self.admission_pool.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    
+    # RUTAS NATIVAS
+    
+    async def get_menu(self, request, send):
+        """Obtener menú completo"""
+        cached = backend.menu_cache.peek()
+        body, etag = cached if cached else await self.db.read(backend.menu_cache.get)
+        
+        headers = {
+            'ETag': f'"{etag}"',
+            'Cache-Control': f'public, max-age={backend.MENU_CACHE_MAX_AGE}, must-revalidate'
+        }
+        if_none_match = request.headers.get('if-none-match', '')
+        if f'"{etag}"' in if_none_match or if_none_match.strip() == '*':
+            await send_response(send, 304, headers=headers)
+            return
+        await send_response(send, 200, body, headers)
+    
+    async def create_order(self, request, send):
+        """Crear nueva orden sin bloquear el loop mientras el escritor confirma"""
+        order_data = await request.json()
+        error = backend.validate_order_data(order_data)
+        if error:
+            await send_json(send, {'error': error}, 400)
+            return
+        
+        order_manager = backend.order_manager
+        try:
+            order = order_manager.prepare_order(order_data)
+            future = order_manager.writer.submit(order)
+            # shield: vencer el plazo no debe cancelar una escritura que el escritor ya tomó
+            order_id = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)),
+                                              backend.ORDER_WRITE_TIMEOUT)
+        except backend.OutOfStockError as e:
+            await send_json(send, {'error': str(e), 'status': 'out_of_stock'}, 409)
+            return
+        except asyncio.TimeoutError:
+            # La orden se anuncia igual si el escritor la confirma más tarde
+            order_manager.finish_when_written(future, order)
+            print("Tiempo de escritura agotado; la orden sigue en la cola del escritor")
+            await send_json(send, {'error': 'La orden sigue en proceso, consulte su estado antes de reintentar',
+                                   'status': 'pending'}, 503, {'Retry-After': '1'})
+            return
+        except Exception as e:
+            print(f"Error al agregar orden: {e}")
+            await send_json(send, {'error': 'Error al crear la orden'}, 500)
+            return
+        
+        order_manager.finish_order(order)
+        await send_json(send, {
+            'order_id': order_id,
+            'estimated_time': order.estimated_time,
+            'status': 'success',
+            'message': 'Orden creada exitosamente',
+            'customer': order_data.get('customer'),
+            'payment': order_data.get('payment')
+        })
+    
+    async def get_orders_status(self, request, send):
+        """Obtener estado general de órdenes (desde memoria)"""
+        snapshot = backend.order_manager.status_snapshot
+        await send_json(send, {
+            'currentOrders': snapshot.current_orders,
+            'averageWaitTime': snapshot.average_wait_time,
+            'status': snapshot.status,
+            'lastUpdated': snapshot.last_updated,
+            'activeOrders': len(backend.order_manager.active_orders)
+        })
+    
+    async def order_status(self, order_id):
+        """Estado de una orden; solo pasa por un hilo lector si no está en memoria"""
+        payload = backend.cached_order_status(order_id)
+        if payload is None:
+            payload = await self.db.read(backend.order_status_payload, order_id)
+        return payload
+    
+    async def get_order_status(self, request, send, order_id):
+        """Obtener estado específico de una orden (ETag/304 y espera larga con ?wait=)"""
+        order_id = int(order_id)
+        try:
+            wait = min(max(float(request.query.get('wait', 0)), 0), backend.ORDER_STATUS_MAX_WAIT)
+        except ValueError:
+            wait = 0
+        if_none_match = request.headers.get('if-none-match', '')
+        
+        def is_current(payload):
+            return f'"{backend.OrderTracker.etag(payload)}"' in if_none_match
+        
+        payload = await self.order_status(order_id)
+        if payload is not None and wait and is_current(payload):
+            # Esperar en el loop un aviso de publish_status, sin ocupar hilos ni cupo
+            leave_admission(request)
+            loop = asyncio.get_running_loop()
+            tracker = backend.order_manager.tracker
+            deadline = loop.time() + wait
+            while payload is not None and is_current(payload):
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                changed = asyncio.Event()
+                
+                def notify(changed=changed):
+                    loop.call_soon_threadsafe(changed.set)
+                
+                tracker.watch(order_id, notify)
+                try:
+                    # Leer después de registrarse para no perder un cambio intermedio
+                    payload = await self.order_status(order_id)
+                    if payload is None or not is_current(payload):
+                        break
+                    await asyncio.wait_for(changed.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    tracker.unwatch(order_id, notify)
+        
+        if payload is None:
+            await send_json(send, {'error': 'Orden no encontrada'}, 404)
+            return
+        
+        headers = {'ETag': f'W/"{backend.OrderTracker.etag(payload)}"', 'Cache-Control': 'no-cache'}
+        if is_current(payload):
+            await send_response(send, 304, headers=headers)
+            return
+        await send_json(send, payload, headers=headers)
+    
+    async def update_order_status(self, request, send, order_id):
+        """Actualizar estado de una orden específica"""
+        order_id = int(order_id)
+        data = await request.json() or {}
+        new_status = data.get('status')
+        if not new_status:
+            await send_json(send, {'error': 'Status requerido'}, 400)
+            return
+        
+        try:
+            updated = await self.db.write(backend.order_manager.update_order_status, order_id, new_status)
+        except backend.InvalidTransitionError as e:
+            await send_json(send, {'error': str(e)}, 400)
+            return
+        if not updated:
+            await send_json(send, {'error': 'Orden no encontrada'}, 404)
+            return
+        
+        await send_json(send, {'success': True, 'order_id': order_id, 'status': new_status})
+    
+    async def admin_orders_stream(self, request, send):
+        """Stream SSE de eventos de órdenes; cada conexión inactiva no ocupa un hilo"""
+        events = backend.order_events
+        cursor = request.headers.get('last-event-id') or request.query.get('cursor')
+        try:
+            cursor = int(cursor) if cursor is not None else events.last_id
+        except ValueError:
+            await send_json(send, {'error': 'Cursor inválido'}, 400)
+            return
+        
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        
+        def listener(_event_id):
+            loop.call_soon_threadsafe(wakeup.set)
+        
+        async def wait_disconnect():
+            # El primer mensaje trae el cuerpo (vacío) de la petición
+            await request.body()
+            while (await request.receive())['type'] != 'http.disconnect':
+                pass
+        
+        events.add_listener(listener)
+        disconnected = asyncio.ensure_future(wait_disconnect())
+        try:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': _encode_headers({
+                'Content-Type': 'text/event-stream',
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no',
+                'Access-Control-Allow-Origin': '*'
+            })})
+            await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+            
+            while not disconnected.done():
+                wakeup.clear()
+                pending = events.events_since(cursor)
+                
+                if pending is None:
+                    # El cursor es demasiado antiguo: el panel debe recargar la lista
+                    cursor = events.last_id
+                    chunk = f'id: {cursor}\nevent: reset\ndata: {{}}\n\n'
+                elif pending:
+                    chunk = ''.join(
+                        f'id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n'
+                        for event_id, event_type, data in pending
+                    )
+                    cursor = pending[-1][0]
+                else:
+                    waiter = asyncio.ensure_future(wakeup.wait())
+                    done, _ = await asyncio.wait(
+                        {waiter, disconnected},
+                        timeout=backend.EVENT_KEEPALIVE,
+                        return_when=asyncio.FIRST_COMPLETED
+                    )
+                    waiter.cancel()
+                    if done:
+                        continue
+                    chunk = ': keep-alive\n\n'
+                
+                await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+        finally:
+            events.remove_listener(listener)
+            disconnected.cancel()
+    
+    # RUTAS DELEGADAS A FLASK
+    
+    def _build_environ(self, scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', ''),
+            'PATH_INFO': scope['path'],
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+            'CONTENT_LENGTH': str(len(body)),
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif name != 'CONTENT_LENGTH':
+                key = f'HTTP_{name}'
+                environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+    
+    def _run_wsgi(self, environ):
+        response = {}
+        chunks = []
+        
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = headers
+            return chunks.append
+        
+        result = self.flask_app.wsgi_app(environ, start_response)
+        try:
+            for chunk in result:
+                chunks.append(chunk)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response['status'], response['headers'], b''.join(chunks)
+    
+    async def call_flask(self, scope, receive, send):
+        body = await Request(scope, receive).body()
+        environ = self._build_environ(scope, body)
+        loop = asyncio.get_running_loop()
+        status, headers, content = await loop.run_in_executor(self.fallback, self._run_wsgi, environ)
+        
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+        })
+        await send({'type': 'http.response.body', 'body': content})
+
+application = AsyncAPI()
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        print("El modo asíncrono requiere un servidor ASGI: pip install uvicorn")
+        sys.exit(1)
+    
+    print("🍕 Iniciando Pizza Deprizza Server (modo asíncrono)...")
+    print(f"📊 Base de datos: {backend.DB_NAME}")
+    print("🌐 Servidor ejecutándose en http://localhost:5000")
+    uvicorn.run(application, host='0.0.0.0', port=5000)
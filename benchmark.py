@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pizza Deprizza - Benchmark de carga y latencia
+
+Levanta el servidor contra una base de datos temporal y genera tráfico mixto
+parecido al de una noche de viernes: clientes que cargan el menú, crean
+órdenes y consultan su estado, ráfagas de órdenes simultáneas y varios
+paneles de chef que recargan el listado y avanzan órdenes. Reporta
+throughput y latencias p50/p95/p99 por endpoint y guarda el resultado en
+JSON para comparar corridas entre commits.
+
+Uso:
+    python benchmark.py [--duration 30] [--customers 20] [--chefs 3]
+    python benchmark.py --server multi --workers 4
+    python benchmark.py --compare benchmark_results/anterior.json
+    python benchmark.py --url http://localhost:5000   (servidor ya en marcha)
+    python benchmark.py --cold-start   (verifica el tiempo de arranque en frío)
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(ROOT, 'benchmark_results')
+SERVER_START_TIMEOUT = 30.0   # Segundos de espera a que el servidor responda
+BENCH_STOCK = 10 ** 7         # Stock inicial para que la corrida no se quede sin ingredientes
+NEXT_STATUS = {'received': 'preparing', 'preparing': 'cooking', 'cooking': 'ready', 'ready': 'delivered'}
+SIZES = (('chica', 'Chica', 0.8), ('mediana', 'Mediana', 1.0), ('grande', 'Grande', 1.3))
+
+# Arranque en frío: importar app.py y llamar a create_app() en un proceso nuevo
+COLD_START_TARGET_MS = 500.0  # Mediana máxima con la base ya al día
+COLD_START_RUNS = 5
+COLD_START_PROBE = '''
+import json, os, sys, threading, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+db_on_import = os.path.exists(os.environ['PIZZA_DB'])
+app.create_app(start_background=False)
+ready = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'init_ms': (ready - imported) * 1000,
+    'db_on_import': db_on_import,
+    'threads': threading.active_count()
+}))
+'''
+
+class Recorder:
+    """Latencias y códigos de estado por endpoint de un hilo (se combinan al final)"""
+    
+    def __init__(self):
+        self.latencies = {}
+        self.statuses = {}
+    
+    def record(self, label, elapsed, status):
+        self.latencies.setdefault(label, []).append(elapsed)
+        counts = self.statuses.setdefault(label, {})
+        counts[status] = counts.get(status, 0) + 1
+    
+    def merge(self, other):
+        for label, values in other.latencies.items():
+            self.latencies.setdefault(label, []).extend(values)
+        for label, counts in other.statuses.items():
+            merged = self.statuses.setdefault(label, {})
+            for status, count in counts.items():
+                merged[status] = merged.get(status, 0) + count
+
+class Client:
+    """Conexión HTTP keep-alive de un usuario virtual"""
+    
+    def __init__(self, base_url, recorder):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.recorder = recorder
+        self.conn = None
+    
+    def request(self, label, method, path, body=None, headers=None):
+        """Ejecutar una petición y registrar su latencia; devuelve (status, cuerpo, headers)"""
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        
+        start = time.perf_counter()
+        for attempt in range(2):
+            try:
+                if self.conn is None:
+                    self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+                self.conn.request(method, path, body=payload, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                if response.getheader('Connection', '').lower() == 'close':
+                    self.close()
+                self.recorder.record(label, time.perf_counter() - start, response.status)
+                return response.status, data, response
+            except (http.client.HTTPException, OSError):
+                # El servidor pudo cerrar la conexión keep-alive: reintentar una vez
+                self.close()
+                if attempt == 1:
+                    self.recorder.record(label, time.perf_counter() - start, 0)
+                    return 0, b'', None
+    
+    def json(self, label, method, path, body=None, headers=None):
+        status, data, _ = self.request(label, method, path, body, headers)
+        try:
+            return status, json.loads(data) if data else None
+        except ValueError:
+            return status, None
+    
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+class LoadTest:
+    """Usuarios virtuales que generan el tráfico mixto durante `duration` segundos"""
+    
+    def __init__(self, base_url, args):
+        self.base_url = base_url
+        self.args = args
+        self.stop_at = 0
+        self.menu = []
+        self.recorders = []
+    
+    def running(self):
+        return time.monotonic() < self.stop_at
+    
+    def think(self, low, high):
+        """Pausa de usuario escalada por --think (0 = sin pausas)"""
+        if self.args.think > 0:
+            time.sleep(random.uniform(low, high) * self.args.think)
+    
+    def new_client(self):
+        recorder = Recorder()
+        self.recorders.append(recorder)
+        return Client(self.base_url, recorder)
+    
+    def prepare(self):
+        """Reabastecer ingredientes y cargar el menú (no cuenta para las métricas)"""
+        client = Client(self.base_url, Recorder())
+        _, data = client.json('setup', 'GET', '/api/admin/ingredients')
+        for ingredient in (data or {}).get('ingredients', []):
+            client.json('setup', 'PUT', f"/api/admin/ingredients/{ingredient['id']}/stock", {'stock': BENCH_STOCK})
+        _, data = client.json('setup', 'GET', '/api/menu')
+        self.menu = [pizza for pizza in (data or {}).get('menu', []) if pizza.get('available', True)]
+        client.close()
+        if not self.menu:
+            raise RuntimeError('El servidor no devolvió un menú disponible')
+    
+    def random_order(self):
+        """Carrito con el mismo formato que envía script.js"""
+        items = []
+        for _ in range(random.randint(1, 3)):
+            pizza = random.choice(self.menu)
+            size, label, factor = random.choice(SIZES)
+            items.append({
+                'cartId': f"{pizza['id']}_{size}",
+                'id': pizza['id'],
+                'name': pizza['name'],
+                'size': size,
+                'price': round(pizza['price'] * factor, 2),
+                'quantity': random.randint(1, 2),
+                'sizeLabel': label
+            })
+        return {
+            'items': items,
+            'total': round(sum(item['price'] * item['quantity'] for item in items), 2),
+            'customer': f'Cliente {random.randint(1, 9999)}',
+            'payment': random.choice(('efectivo', 'tarjeta')),
+            'timestamp': datetime.now(timezone.utc).isoformat()
+        }
+    
+    def place_order(self, client):
+        status, data = client.json('POST /api/orders', 'POST', '/api/orders', self.random_order())
+        if status == 200 and data:
+            return data.get('order_id')
+        return None
+    
+    def customer(self):
+        """Cliente: carga el menú, ordena y consulta el avance de su orden"""
+        client = self.new_client()
+        etag = None
+        while self.running():
+            headers = {'If-None-Match': etag} if etag else None
+            status, _, response = client.request('GET /api/menu', 'GET', '/api/menu', headers=headers)
+            if status == 200 and response is not None:
+                etag = response.getheader('ETag')
+            self.think(1, 4)
+            
+            order_id = self.place_order(client)
+            for _ in range(random.randint(2, 6)):
+                if not self.running():
+                    break
+                self.think(1, 3)
+                if order_id:
+                    client.request('GET /api/orders/<id>/status', 'GET', f'/api/orders/{order_id}/status')
+                client.request('GET /api/orders/status', 'GET', '/api/orders/status')
+            self.think(2, 5)
+        client.close()
+    
+    def burst(self, gate):
+        """Participante de las ráfagas: todos ordenan a la vez cada --burst-interval"""
+        client = self.new_client()
+        generation = 0
+        while True:
+            with gate:
+                gate.wait_for(lambda: gate.generation > generation or not self.running())
+                if not self.running():
+                    break
+                generation = gate.generation
+            self.place_order(client)
+        client.close()
+    
+    def chef(self):
+        """Panel de chef: recarga el listado de activas y avanza alguna orden"""
+        client = self.new_client()
+        while self.running():
+            status, data = client.json(
+                'GET /api/admin/orders', 'GET', '/api/admin/orders?status=active&limit=200'
+            )
+            orders = (data or {}).get('orders', []) if status == 200 else []
+            if orders:
+                order = random.choice(orders)
+                next_status = NEXT_STATUS.get(order.get('status'))
+                if next_status:
+                    client.request(
+                        'PUT /api/orders/<id>/status', 'PUT', f"/api/orders/{order['id']}/status",
+                        {'status': next_status}
+                    )
+            self.think(1, 3)
+        client.close()
+    
+    def run(self):
+        """Ejecutar todos los roles y devolver (recorder combinado, segundos medidos)"""
+        gate = threading.Condition()
+        gate.generation = 0
+        
+        self.stop_at = time.monotonic() + self.args.duration
+        threads = [threading.Thread(target=self.customer) for _ in range(self.args.customers)]
+        threads += [threading.Thread(target=self.chef) for _ in range(self.args.chefs)]
+        threads += [threading.Thread(target=self.burst, args=(gate,)) for _ in range(self.args.burst_size)]
+        
+        started = time.monotonic()
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        
+        while self.running():
+            time.sleep(min(self.args.burst_interval, max(0, self.stop_at - time.monotonic())))
+            with gate:
+                gate.generation += 1
+                gate.notify_all()
+        
+        # Despertar a los participantes de ráfagas para que vean el fin de la corrida
+        with gate:
+            gate.notify_all()
+        # Las peticiones ya lanzadas terminan, pero el throughput se mide sobre la ventana
+        elapsed = time.monotonic() - started
+        for thread in threads:
+            thread.join(timeout=35)
+        
+        combined = Recorder()
+        for recorder in self.recorders:
+            combined.merge(recorder)
+        return combined, elapsed
+
+def percentile(sorted_values, fraction):
+    """Percentil por rango más cercano sobre una lista ordenada"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def summarize(latencies, statuses, elapsed):
+    """Métricas de un endpoint (latencias en milisegundos)"""
+    values = sorted(latencies)
+    errors = sum(count for status, count in statuses.items() if status == 0 or status >= 500)
+    to_ms = lambda value: round(value * 1000, 2) if value is not None else None
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'rps': round(len(values) / elapsed, 2) if elapsed else 0,
+        'p50_ms': to_ms(percentile(values, 0.50)),
+        'p95_ms': to_ms(percentile(values, 0.95)),
+        'p99_ms': to_ms(percentile(values, 0.99)),
+        'max_ms': to_ms(values[-1] if values else None),
+        'status': {str(status): count for status, count in sorted(statuses.items())}
+    }
+
+def build_report(recorder, elapsed, args):
+    endpoints = {
+        label: summarize(recorder.latencies[label], recorder.statuses[label], elapsed)
+        for label in sorted(recorder.latencies)
+    }
+    all_latencies = [value for values in recorder.latencies.values() for value in values]
+    all_statuses = {}
+    for counts in recorder.statuses.values():
+        for status, count in counts.items():
+            all_statuses[status] = all_statuses.get(status, 0) + count
+    
+    return {
+        'timestamp': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'duration': round(elapsed, 2),
+        'endpoints': endpoints,
+        'total': summarize(all_latencies, all_statuses, elapsed)
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_report(report, baseline=None):
+    """Tabla por endpoint; con baseline muestra la variación de rps y p95"""
+    print(f"\nResultados ({report['duration']}s, commit {report['commit'] or '?'})")
+    header = f"{'Endpoint':34} {'req':>7} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}"
+    if baseline:
+        header += f" {'Δrps':>8} {'Δp95':>8}"
+    print(header)
+    print('-' * len(header))
+    
+    rows = list(report['endpoints'].items()) + [('TOTAL', report['total'])]
+    for label, stats in rows:
+        line = (f"{label:34} {stats['requests']:>7} {stats['errors']:>5} {stats['rps']:>8} "
+                f"{stats['p50_ms'] or '-':>8} {stats['p95_ms'] or '-':>8} "
+                f"{stats['p99_ms'] or '-':>8} {stats['max_ms'] or '-':>8}")
+        if baseline:
+            base = baseline['total'] if label == 'TOTAL' else baseline['endpoints'].get(label)
+            line += f" {change(base, stats, 'rps'):>8} {change(base, stats, 'p95_ms'):>8}"
+        print(line)
+    print("Latencias en ms")
+
+def change(base, current, key):
+    if not base or not base.get(key) or current.get(key) is None:
+        return '-'
+    return f"{(current[key] - base[key]) / base[key] * 100:+.1f}%"
+
+def measure_cold_start(runs=COLD_START_RUNS):
+    """Medir el arranque en procesos nuevos: la primera corrida crea la base, el resto la reabre"""
+    samples = []
+    with tempfile.TemporaryDirectory(prefix='pizza-cold-') as workdir:
+        env = dict(os.environ, PIZZA_DB=os.path.join(workdir, 'cold.db'))
+        for _ in range(runs + 1):
+            output = subprocess.check_output([sys.executable, '-c', COLD_START_PROBE], cwd=ROOT, env=env)
+            # Lo anterior a la última línea son los mensajes de inicialización de app.py
+            samples.append(json.loads(output.decode().strip().splitlines()[-1]))
+    return samples[0], samples[1:]
+
+def check_cold_start(args):
+    """Reportar el arranque en frío; código de salida 1 si no cumple el objetivo"""
+    fresh, warm = measure_cold_start(args.cold_start_runs)
+    totals = sorted(sample['import_ms'] + sample['init_ms'] for sample in warm)
+    median = totals[len(totals) // 2]
+    
+    print(f"{'Corrida':16} {'import':>9} {'create_app':>11} {'total':>9} {'hilos':>6}")
+    for label, sample in [('base nueva', fresh)] + [(f'base al día #{n}', s) for n, s in enumerate(warm, 1)]:
+        print(f"{label:16} {sample['import_ms']:>9.1f} {sample['init_ms']:>11.1f} "
+              f"{sample['import_ms'] + sample['init_ms']:>9.1f} {sample['threads']:>6}")
+    print(f"Mediana con la base al día: {median:.1f} ms (objetivo {args.cold_start_target:g} ms)")
+    
+    problems = []
+    if median > args.cold_start_target:
+        problems.append('el arranque supera el objetivo')
+    if fresh['db_on_import']:
+        problems.append('importar app.py creó la base de datos')
+    if any(sample['threads'] != 1 for sample in [fresh] + warm):
+        problems.append('create_app(start_background=False) arrancó hilos')
+    for problem in problems:
+        print(f"FALLA: {problem}")
+    return 1 if problems else 0
+
+def serve(port):
+    """Servidor de un solo proceso para el benchmark (sin el reloader de debug)"""
+    from werkzeug.serving import make_server
+    import app as backend
+    
+    make_server('127.0.0.1', port, backend.create_app(), threaded=True).serve_forever()
+
+def start_server(args, workdir):
+    """Arrancar el servidor elegido contra una base temporal; devuelve (proceso, url)"""
+    port = args.port
+    env = dict(os.environ, PIZZA_DB=os.path.join(workdir, 'benchmark.db'), PYTHONUNBUFFERED='1')
+    if args.server == 'multi':
+        command = [sys.executable, os.path.join(ROOT, 'serve.py'), '--workers', str(args.workers),
+                   '--host', '127.0.0.1', '--port', str(port)]
+    elif args.server == 'asgi':
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:application', '--host', '127.0.0.1',
+                   '--port', str(port), '--log-level', 'warning']
+    else:
+        command = [sys.executable, os.path.abspath(__file__), '--serve', '--port', str(port)]
+    
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f'http://127.0.0.1:{port}'
+    
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/api/orders/status')
+            if conn.getresponse().status == 200:
+                conn.close()
+                return process, url
+        except OSError:
+            time.sleep(0.2)
+    
+    stop_server(process)
+    log.close()
+    with open(os.path.join(workdir, 'server.log')) as f:
+        print(f.read()[-2000:])
+    raise RuntimeError('El servidor no respondió a tiempo')
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de carga de Pizza Deprizza')
+    parser.add_argument('--duration', type=float, default=30, help='Segundos de carga medida')
+    parser.add_argument('--customers', type=int, default=20, help='Clientes simultáneos')
+    parser.add_argument('--chefs', type=int, default=3, help='Paneles de chef simultáneos')
+    parser.add_argument('--burst-size', type=int, default=25, help='Órdenes por ráfaga')
+    parser.add_argument('--burst-interval', type=float, default=5, help='Segundos entre ráfagas')
+    parser.add_argument('--think', type=float, default=1.0, help='Escala de las pausas de usuario (0 = sin pausas)')
+    parser.add_argument('--server', choices=('flask', 'multi', 'asgi'), default='flask')
+    parser.add_argument('--workers', type=int, default=4, help='Workers para --server multi')
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--url', help='Usar un servidor ya en marcha en lugar de uno temporal')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--output', help='Archivo JSON de resultados (por defecto en benchmark_results/)')
+    parser.add_argument('--compare', help='JSON de una corrida anterior para comparar')
+    parser.add_argument('--cold-start', action='store_true', help='Medir el arranque en frío y salir')
+    parser.add_argument('--cold-start-runs', type=int, default=COLD_START_RUNS)
+    parser.add_argument('--cold-start-target', type=float, default=COLD_START_TARGET_MS,
+                        help='Mediana máxima en ms con la base al día')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.cold_start:
+        sys.exit(check_cold_start(args))
+    
+    if args.serve:
+        serve(args.port)
+        return
+    
+    random.seed(args.seed)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    
+    with tempfile.TemporaryDirectory(prefix='pizza-bench-') as workdir:
+        process = None
+        url = args.url
+        if not url:
+            process, url = start_server(args, workdir)
+        try:
+            test = LoadTest(url, args)
+            test.prepare()
+            print(f"Generando carga contra {url} durante {args.duration:g}s...")
+            recorder, elapsed = test.run()
+        finally:
+            if process is not None:
+                stop_server(process)
+    
+    report = build_report(recorder, elapsed, args)
+    print_report(report, baseline)
+    
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = report['timestamp'].replace(':', '').replace('-', '')
+        output = os.path.join(RESULTS_DIR, f"{stamp}_{report['commit'] or 'local'}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Resultados guardados en {output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pizza Deprizza - Lanzador de producción multi-worker
+
+Abre el puerto una sola vez y arranca N procesos worker que aceptan
+conexiones del mismo socket. Cada worker importa app.py después del fork en
+modo de estado compartido (PIZZA_SHARED_STATE=1): las órdenes activas se
+sincronizan a través de SQLite y un único líder, elegido con una concesión en
+la base de datos, aplica las transiciones automáticas.
+
+Uso:
+    python serve.py [--workers N] [--host 0.0.0.0] [--port 5000]
+"""
+
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+
+DEFAULT_WORKERS = os.cpu_count() or 2
+RESPAWN_DELAY = 1.0      # Segundos antes de reemplazar un worker que terminó
+SHUTDOWN_TIMEOUT = 10.0  # Segundos de gracia antes de forzar el cierre de los workers
+
+def open_listener(host, port):
+    """Socket de escucha compartido por todos los workers"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(socket.SOMAXCONN)
+    sock.set_inheritable(True)
+    return sock
+
+def run_worker(sock, host, port):
+    """Cuerpo de un proceso worker (nunca retorna)"""
+    os.environ['PIZZA_SHARED_STATE'] = '1'
+    # Ctrl+C llega a todo el grupo; el padre es quien ordena el cierre con SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    
+    from werkzeug.serving import make_server
+    import app as backend
+    
+    # Cada worker abre su propia base y arranca sus hilos después del fork
+    backend.create_app()
+    signal.signal(signal.SIGTERM, lambda s, f: sys.exit(0))
+    
+    server = make_server(host, port, backend.app, threaded=True, fd=sock.fileno())
+    print(f"Worker {os.getpid()} atendiendo en http://{host}:{port}")
+    try:
+        server.serve_forever()
+    finally:
+        # Persistir el estado y ceder la concesión de líder antes de salir
+        backend.cleanup()
+
+def spawn_worker(sock, host, port):
+    # Evitar que el hijo herede y repita la salida pendiente del padre
+    sys.stdout.flush()
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(sock, host, port)
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else 1
+        except BaseException as e:
+            print(f"Worker {os.getpid()} terminó con error: {e}")
+            code = 1
+        finally:
+            # Nunca volver al bucle del padre desde el proceso hijo
+            sys.stdout.flush()
+            os._exit(code)
+    return pid
+
+def stop_workers(workers):
+    """Enviar SIGTERM a los workers y esperarlos; SIGKILL si no terminan a tiempo"""
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    
+    deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+    while workers and time.monotonic() < deadline:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            workers.discard(pid)
+        else:
+            time.sleep(0.1)
+    
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor multi-worker de Pizza Deprizza')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('PIZZA_WORKERS', DEFAULT_WORKERS)))
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+    
+    if not hasattr(os, 'fork'):
+        print("El modo multi-worker requiere un sistema con fork(); use: python app.py")
+        sys.exit(1)
+    
+    sock = open_listener(args.host, args.port)
+    print("🍕 Iniciando Pizza Deprizza Server (multi-worker)...")
+    print(f"🌐 {args.workers} workers en http://{args.host}:{args.port}")
+    
+    stopping = False
+    
+    def request_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+    
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    
+    workers = {spawn_worker(sock, args.host, args.port) for _ in range(max(1, args.workers))}
+    
+    # Supervisar: reemplazar workers caídos hasta recibir la señal de parada
+    while not stopping:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid = 0
+        if not pid:
+            time.sleep(0.5)
+            continue
+        
+        workers.discard(pid)
+        if stopping:
+            break
+        print(f"Worker {pid} terminó (estado {status}), reemplazándolo...")
+        time.sleep(RESPAWN_DELAY)
+        workers.add(spawn_worker(sock, args.host, args.port))
+    
+    print("Deteniendo workers...")
+    stop_workers(workers)
+    sock.close()
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,14 @@
 // CONFIGURACIÓN GLOBAL
 let orders = [];
 let selectedOrder = null;
+let selectedOrderIds = new Set();
 let currentFilter = 'all';
 let currentSort = 'time';
 let chefName = 'Chef Mario';
 let lastUpdateTime = Date.now();
+let eventCursor = null;
+let eventSource = null;
+let kitchenQueue = {};
 
 // Elementos DOM
 const ordersGrid = document.getElementById('ordersGrid');
@@ -56,7 +60,11 @@ function setupEventListeners() {
             document.querySelectorAll('.sort-btn').forEach(b => b.classList.remove('active'));
             this.classList.add('active');
             currentSort = this.dataset.sort;
-            renderOrders();
+            if (currentSort === 'kitchen') {
+                loadKitchenQueue();
+            } else {
+                renderOrders();
+            }
         });
     });
     
@@ -76,7 +84,7 @@ function setupEventListeners() {
     
     // Teclas de acceso rápido
     document.addEventListener('keydown', function(e) {
-        if (selectedOrder) {
+        if (selectedOrder || selectedOrderIds.size > 0) {
             switch(e.key) {
                 case '1':
                     updateOrderStatus('preparing');
@@ -100,7 +108,8 @@ async function loadOrders() {
     try {
         console.log('Cargando órdenes...');
         // Asegurarse de que la URL sea correcta y completa
-        const apiUrl = window.location.origin + '/api/admin/orders';
+        // Solo órdenes en curso: el servidor filtra con índice y no envía el historial
+        const apiUrl = window.location.origin + '/api/admin/orders?status=active&limit=200';
         console.log('Conectando a:', apiUrl);
         
         const response = await fetch(apiUrl, {
@@ -155,8 +164,17 @@ async function loadOrders() {
             orders = processedOrders;
             console.log(`Órdenes procesadas: ${orders.length}`);
             
+            // Cursor para recibir solo los eventos posteriores a esta carga
+            if (typeof data.event_cursor === 'number') {
+                eventCursor = data.event_cursor;
+                connectOrderStream();
+            }
+            
             renderOrders();
             updateStatistics();
+            if (currentSort === 'kitchen') {
+                loadKitchenQueue();
+            }
             
             if (orders.length > 0) {
                 showNotification(`${orders.length} órdenes activas cargadas`, 'success');
@@ -176,6 +194,53 @@ async function loadOrders() {
     }
 }
 
+async function loadKitchenQueue() {
+    try {
+        // Agenda calculada por el planificador: estación y horno de cada pizza
+        const apiUrl = window.location.origin + '/api/admin/kitchen/queue';
+        const response = await fetch(apiUrl, {
+            method: 'GET',
+            headers: { 'Accept': 'application/json' },
+            cache: 'no-cache'
+        });
+        
+        if (!response.ok) {
+            throw new Error('Error en la respuesta del servidor');
+        }
+        
+        const data = await response.json();
+        
+        // Primer trabajo de cada orden (la cola ya viene ordenada por inicio)
+        kitchenQueue = {};
+        data.jobs.forEach((job, position) => {
+            if (!(job.order_id in kitchenQueue)) {
+                kitchenQueue[job.order_id] = {
+                    position: position,
+                    prepStart: job.prep_start,
+                    bakeEnd: job.bake_end,
+                    station: job.station,
+                    ovens: job.ovens
+                };
+            } else {
+                // La orden sale del horno con su último trabajo
+                const entry = kitchenQueue[job.order_id];
+                if (job.bake_end > entry.bakeEnd) {
+                    entry.bakeEnd = job.bake_end;
+                }
+            }
+        });
+        
+        renderOrders();
+    } catch (error) {
+        console.error('Error loading kitchen queue:', error);
+        showNotification('No se pudo cargar la cola de cocina', 'warning');
+    }
+}
+
+function formatClock(isoString) {
+    return new Date(isoString).toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
+}
+
 function loadMockData() {
     console.log('Cargando datos de ejemplo...');
     orders = [
@@ -249,7 +314,15 @@ function renderOrders() {
     
     // Agregar event listeners a las tarjetas
     document.querySelectorAll('.order-card').forEach(card => {
-        card.addEventListener('click', () => selectOrder(parseInt(card.dataset.orderId)));
+        card.addEventListener('click', (e) => {
+            const orderId = parseInt(card.dataset.orderId);
+            // Ctrl/Cmd/Shift + clic agrega o quita la orden de la selección múltiple
+            if (e.ctrlKey || e.metaKey || e.shiftKey) {
+                toggleOrderSelection(orderId);
+            } else {
+                selectOrder(orderId);
+            }
+        });
     });
 }
 
@@ -265,7 +338,7 @@ function createOrderCard(order) {
     const items = Array.isArray(order.items) ? order.items : [];
     
     return `
-        <div class="order-card ${order.status} ${selectedOrder?.id === order.id ? 'selected' : ''}" 
+        <div class="order-card ${order.status} ${selectedOrder?.id === order.id || selectedOrderIds.has(order.id) ? 'selected' : ''}" 
              data-order-id="${order.id}">
             <div class="order-header">
                 <div>
@@ -275,6 +348,9 @@ function createOrderCard(order) {
                 <div class="order-time">
                     <div>Hace ${timeElapsed} min</div>
                     <div class="estimated-time">Est: ${order.estimated_time || 25} min</div>
+                    ${currentSort === 'kitchen' && kitchenQueue[order.id] ? `
+                        <div class="estimated-time">Prep ${formatClock(kitchenQueue[order.id].prepStart)} · Horno hasta ${formatClock(kitchenQueue[order.id].bakeEnd)}</div>
+                    ` : ''}
                 </div>
             </div>
             
@@ -326,6 +402,10 @@ function sortOrders(orders) {
         case 'priority':
             const priorityWeight = { high: 3, medium: 2, low: 1 };
             return sortedOrders.sort((a, b) => priorityWeight[b.priority || 'medium'] - priorityWeight[a.priority || 'medium']);
+        case 'kitchen':
+            // Orden de la agenda de cocina; las que ya salieron del horno al final
+            const queuePosition = order => kitchenQueue[order.id]?.position ?? Infinity;
+            return sortedOrders.sort((a, b) => queuePosition(a) - queuePosition(b));
         default:
             return sortedOrders;
     }
@@ -334,6 +414,7 @@ function sortOrders(orders) {
 // GESTIÓN DE ÓRDENES - MEJORADO
 function selectOrder(orderId) {
     selectedOrder = orders.find(order => order.id === orderId);
+    selectedOrderIds.clear();
     
     if (selectedOrder) {
         // Mostrar botones de acción
@@ -351,8 +432,33 @@ function selectOrder(orderId) {
     }
 }
 
+function toggleOrderSelection(orderId) {
+    // Al empezar la selección múltiple se incluye la orden ya seleccionada
+    if (selectedOrder && selectedOrderIds.size === 0) {
+        selectedOrderIds.add(selectedOrder.id);
+    }
+    
+    if (selectedOrderIds.has(orderId)) {
+        selectedOrderIds.delete(orderId);
+    } else {
+        selectedOrderIds.add(orderId);
+    }
+    
+    selectedOrder = null;
+    if (modal) {
+        modal.style.display = 'none';
+    }
+    if (orderActions) {
+        orderActions.classList.toggle('show', selectedOrderIds.size > 0);
+    }
+    
+    renderOrders();
+    showNotification(`${selectedOrderIds.size} órdenes seleccionadas`, 'success');
+}
+
 function deselectOrder() {
     selectedOrder = null;
+    selectedOrderIds.clear();
     if (orderActions) {
         orderActions.classList.remove('show');
     }
@@ -363,6 +469,11 @@ function deselectOrder() {
 }
 
 async function updateOrderStatus(newStatus) {
+    if (selectedOrderIds.size > 0) {
+        await updateSelectedOrdersStatus(newStatus);
+        return;
+    }
+    
     if (!selectedOrder) {
         showNotification('No hay orden seleccionada', 'warning');
         return;
@@ -438,6 +549,66 @@ async function updateOrderStatus(newStatus) {
     }
 }
 
+async function updateSelectedOrdersStatus(newStatus) {
+    const orderIds = [...selectedOrderIds];
+    
+    try {
+        // Un solo PUT para todas las órdenes seleccionadas
+        const apiUrl = window.location.origin + '/api/orders/status/batch';
+        console.log(`Actualizando ${orderIds.length} órdenes:`, apiUrl);
+        
+        const response = await fetch(apiUrl, {
+            method: 'PUT',
+            headers: {
+                'Accept': 'application/json',
+                'Content-Type': 'application/json'
+            },
+            cache: 'no-cache',
+            body: JSON.stringify({
+                updates: orderIds.map(id => ({ id: id, status: newStatus }))
+            })
+        });
+        
+        if (!response.ok) {
+            throw new Error('Error en la respuesta del servidor');
+        }
+        
+        const data = await response.json();
+        
+        // Actualizar localmente solo las que el servidor aceptó
+        data.results.forEach(result => {
+            if (!result.success) {
+                console.warn(`Orden #${result.order_id} rechazada:`, result.error);
+                return;
+            }
+            const order = orders.find(o => o.id === result.order_id);
+            if (order) {
+                order.status = newStatus;
+                order.progress = calculateProgress(order);
+            }
+        });
+        
+        deselectOrder();
+        updateStatistics();
+        
+        if (data.rejected > 0) {
+            showNotification(
+                `${data.updated} órdenes actualizadas, ${data.rejected} rechazadas`, 
+                'warning'
+            );
+        } else {
+            showNotification(
+                `${data.updated} órdenes actualizadas a ${getStatusText(newStatus)}`, 
+                'success'
+            );
+        }
+        
+    } catch (error) {
+        console.error('Error updating orders status:', error);
+        showNotification('Error al actualizar las órdenes seleccionadas', 'error');
+    }
+}
+
 // MODAL Y DETALLES
 function showOrderDetails(order) {
     const orderDetails = document.getElementById('orderDetails');
@@ -624,16 +795,18 @@ function startRealTimeUpdates() {
         loadOrders();
     }, 500);
     
-    // Actualizar órdenes cada 10 segundos
-    setInterval(() => {
-        const now = Date.now();
-        // Solo actualizar si han pasado al menos 5 segundos desde la última actualización
-        if (now - lastUpdateTime > 5000) {
-            console.log('Actualizando órdenes automáticamente...');
-            loadOrders();
-            lastUpdateTime = now;
-        }
-    }, 10000);
+    // Sin soporte de EventSource se mantiene el sondeo cada 10 segundos
+    if (!window.EventSource) {
+        setInterval(() => {
+            const now = Date.now();
+            // Solo actualizar si han pasado al menos 5 segundos desde la última actualización
+            if (now - lastUpdateTime > 5000) {
+                console.log('Actualizando órdenes automáticamente...');
+                loadOrders();
+                lastUpdateTime = now;
+            }
+        }, 10000);
+    }
     
     // Actualizar tiempos cada minuto
     setInterval(() => {
@@ -652,6 +825,77 @@ function startRealTimeUpdates() {
     console.log('Actualizaciones en tiempo real iniciadas');
 }
 
+function connectOrderStream() {
+    // Una sola conexión; EventSource se reconecta solo enviando Last-Event-ID
+    if (!window.EventSource || eventSource) return;
+    
+    const streamUrl = window.location.origin + `/api/admin/orders/stream?cursor=${eventCursor}`;
+    eventSource = new EventSource(streamUrl);
+    
+    eventSource.addEventListener('order_created', (e) => {
+        const order = JSON.parse(e.data);
+        if (orders.some(o => o.id === order.id)) return;
+        
+        order.progress = calculateProgress(order);
+        order.priority = calculatePriority(order);
+        orders.unshift(order);
+        
+        renderOrders();
+        updateStatistics();
+        if (currentSort === 'kitchen') {
+            loadKitchenQueue();
+        }
+        showNotification(`Nueva orden #${order.id} recibida`, 'success');
+    });
+    
+    eventSource.addEventListener('order_status', (e) => {
+        const change = JSON.parse(e.data);
+        const order = orders.find(o => o.id === change.id);
+        if (!order || order.status === change.status) return;
+        
+        // Las órdenes entregadas salen del panel igual que las completadas
+        if (change.status === 'delivered') {
+            orders = orders.filter(o => o.id !== change.id);
+            if (selectedOrder?.id === change.id) {
+                deselectOrder();
+            }
+            renderOrders();
+            updateStatistics();
+            return;
+        }
+        
+        order.status = change.status;
+        order.progress = calculateProgress(order);
+        order.priority = calculatePriority(order);
+        
+        renderOrders();
+        updateStatistics();
+    });
+    
+    eventSource.addEventListener('order_completed', (e) => {
+        const change = JSON.parse(e.data);
+        const before = orders.length;
+        orders = orders.filter(o => o.id !== change.id);
+        if (orders.length === before) return;
+        
+        if (selectedOrder?.id === change.id) {
+            deselectOrder();
+        }
+        renderOrders();
+        updateStatistics();
+    });
+    
+    // El servidor ya no tiene los eventos perdidos: recargar la lista completa
+    eventSource.addEventListener('reset', () => {
+        console.log('Stream reiniciado, recargando órdenes...');
+        loadOrders();
+    });
+    
+    eventSource.onerror = () => {
+        console.warn('Conexión del stream interrumpida, reintentando...');
+    };
+}
+
 // TESTING Y DEBUG
 function simulateNewOrder() {
     const newOrder = {
@@ -691,11 +935,14 @@ if (window.location.hostname === 'localhost' || window.location.hostname === '12
 window.chefPanel = {
     orders,
     selectOrder,
+    toggleOrderSelection,
     updateOrderStatus,
+    updateSelectedOrdersStatus,
     calculateProgress,
     calculatePriority,
     getStatusText,
     getPriorityText,
     simulateNewOrder,
-    loadOrders
+    loadOrders,
+    loadKitchenQueue
 };
\ No newline at end of file
@@ -274,12 +274,16 @@ paymentForm.addEventListener('submit', async function(e) {
     const method = paymentMethod.value;
 
     generateTicket(name, method);
-    await sendOrderToBackend(name, method);
+    const order = await sendOrderToBackend(name, method);
 
     paymentModal.style.display = 'none';
     cart = [];
     updateCartDisplay();
-    alert("✅ Pedido confirmado. Ticket generado.");
+    if (order && order.order_id) {
+        showOrderTracking(order);
+    } else {
+        alert("✅ Pedido confirmado. Ticket generado.");
+    }
 });
 
 // TICKET EN TXT
@@ -316,11 +320,80 @@ async function sendOrderToBackend(name, method) {
         });
         const data = await res.json();
         console.log("Orden creada:", data);
+        return res.ok ? data : null;
     } catch (err) {
         console.error("Error al enviar orden:", err);
+        return null;
+    }
+}
+
+// SEGUIMIENTO DEL PEDIDO
+const TRACKING_WAIT = 25;  // Segundos que el servidor retiene cada consulta
+const TRACKING_RETRY_MS = 5000;
+const TRACKING_STEPS = { received: 0, preparing: 1, cooking: 2, ready: 3, completed: 3, delivered: 3 };
+const FINISHED_STATUSES = ['completed', 'delivered'];
+let trackingController = null;
+
+function showOrderTracking(order) {
+    document.getElementById('orderTime').textContent = `${order.estimated_time} minutos`;
+    renderTrackingStep('received');
+    orderModal.style.display = 'block';
+    trackOrder(order.order_id);
+}
+
+function renderTrackingStep(status) {
+    const current = TRACKING_STEPS[status] ?? 0;
+    orderModal.querySelectorAll('.tracking-step').forEach((step, index) => {
+        step.classList.toggle('active', index <= current);
+    });
+}
+
+function stopTracking() {
+    if (trackingController) trackingController.abort();
+    trackingController = null;
+}
+
+const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+
+// Espera larga: el servidor responde cuando cambia el estado (o 304 al vencer la espera)
+async function trackOrder(orderId) {
+    stopTracking();
+    const controller = new AbortController();
+    trackingController = controller;
+    let etag = null;
+
+    while (!controller.signal.aborted) {
+        try {
+            const res = await fetch(`/api/orders/${orderId}/status?wait=${TRACKING_WAIT}`, {
+                headers: etag ? { 'If-None-Match': etag } : {},
+                cache: 'no-store',
+                signal: controller.signal
+            });
+            if (res.status === 304) continue;
+            if (res.status === 503) {
+                const retryAfter = parseInt(res.headers.get('Retry-After'), 10) || TRACKING_RETRY_MS / 1000;
+                await sleep(retryAfter * 1000);
+                continue;
+            }
+            if (!res.ok) break;
+
+            etag = res.headers.get('ETag');
+            const data = await res.json();
+            renderTrackingStep(data.status);
+            if (FINISHED_STATUSES.includes(data.status)) break;
+        } catch (err) {
+            if (controller.signal.aborted) break;
+            console.error("Error al consultar el pedido:", err);
+            await sleep(TRACKING_RETRY_MS);
+        }
     }
 }
 
+orderModal.querySelector('.close').addEventListener('click', () => {
+    orderModal.style.display = 'none';
+    stopTracking();
+});
+
 // Funciones del personalizador
 function showCustomizer() {
     document.getElementById('pizzaCustomizer').style.display = 'block';
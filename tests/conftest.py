@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+"""Configuración común: cada corrida usa una base de datos temporal"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Las constantes de app.py se leen al importar: fijar las rutas antes
+TEST_DIR = tempfile.mkdtemp(prefix='pizza-tests-')
+os.environ.setdefault('PIZZA_DB', os.path.join(TEST_DIR, 'pizza_deprizza.db'))
+os.environ.setdefault('PIZZA_ARCHIVE_DIR', os.path.join(TEST_DIR, 'archive'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as backend  # noqa: E402
+
+@pytest.fixture(scope='session')
+def client():
+    """Cliente de pruebas Flask sin hilos de fondo"""
+    backend.create_app(start_background=False)
+    return backend.app.test_client()
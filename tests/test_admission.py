@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""Control de admisión: carriles saturados, 503 con Retry-After y liberación de cupos"""
+
+import threading
+import time
+
+import pytest
+
+import app as backend
+
+HIGH, NORMAL, LOW = range(3)
+
+def test_lane_admits_up_to_limit_then_times_out():
+    lane = backend.AdmissionLane('read', limit=1, queue_size=4, budget=0.05)
+    
+    assert lane.acquire(NORMAL) is None
+    assert lane.acquire(NORMAL) == 'timeout'
+    assert (lane.active, lane.queued) == (1, 0)
+    
+    lane.release(0.01)
+    assert lane.acquire(NORMAL) is None
+
+def test_release_hands_slot_to_waiter():
+    lane = backend.AdmissionLane('write', limit=1, queue_size=4, budget=5)
+    lane.acquire(NORMAL)
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(lane.acquire(NORMAL)))
+    waiter.start()
+    while not lane.queued:
+        time.sleep(0.001)
+    
+    lane.release(0.01)
+    waiter.join()
+    
+    assert results == [None]
+    assert (lane.active, lane.queued) == (1, 0)
+
+def test_full_queue_rejects_or_evicts_lower_priority():
+    lane = backend.AdmissionLane('read', limit=1, queue_size=1, budget=5)
+    lane.acquire(NORMAL)
+    results = {}
+    waiter = threading.Thread(target=lambda: results.setdefault('low', lane.acquire(LOW)))
+    waiter.start()
+    while not lane.queued:
+        time.sleep(0.001)
+    
+    # Misma prioridad o menor que la que espera: cola llena
+    assert lane.acquire(LOW) == 'queue_full'
+    # Mayor prioridad: desplaza a la que espera y ocupa su lugar hasta agotar el presupuesto
+    lane.budget = 0.05
+    assert lane.acquire(HIGH) == 'timeout'
+    waiter.join()
+    assert results['low'] == 'evicted'
+
+@pytest.fixture
+def saturated_read_lane(client, monkeypatch):
+    controller = backend.AdmissionController()
+    lane = backend.AdmissionLane('read', limit=1, queue_size=1, budget=0.05)
+    controller.lanes['read'] = lane
+    monkeypatch.setattr(backend, 'admission', controller)
+    lane.try_acquire()
+    yield lane
+    lane.release(0)
+
+def test_saturated_lane_answers_503_with_retry_after(client, saturated_read_lane):
+    shed = backend.REQUESTS_SHED._values
+    before = shed.get(('read', 'normal', 'timeout'), 0)
+    
+    response = client.get('/api/menu')
+    
+    assert response.status_code == 503
+    retry_after = int(response.headers['Retry-After'])
+    assert 1 <= retry_after <= backend.ADMISSION_RETRY_AFTER_MAX
+    assert response.get_json()['retry_after'] == retry_after
+    # Las rutas sin carril no se limitan
+    assert client.get('/metrics').status_code == 200
+    assert shed[('read', 'normal', 'timeout')] == before + 1
+
+def test_slot_is_released_when_view_raises(client, monkeypatch):
+    lane = backend.admission.lanes['read']
+    
+    def failing_view():
+        raise RuntimeError('falla inesperada')
+    
+    monkeypatch.setitem(backend.app.view_functions, 'get_orders_status', failing_view)
+    response = client.get('/api/orders/status')
+    
+    assert response.status_code == 500
+    assert lane.active == 0
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""Pool de conexiones: préstamo, devolución y descarte de conexiones rotas"""
+
+import sqlite3
+
+import pytest
+
+import app as backend
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = backend.ConnectionPool(str(tmp_path / 'pool.db'), max_size=2, timeout=0.05)
+    yield pool
+    pool.close_all()
+
+def test_connection_is_returned_and_reused(pool):
+    with pool.connection() as first:
+        first.execute('CREATE TABLE t (x INTEGER)')
+    with pool.connection() as second:
+        assert second is first
+    assert pool.open_connections() == 1
+
+def test_exhausted_pool_times_out_and_recovers(pool):
+    with pool.connection(), pool.connection():
+        with pytest.raises(sqlite3.OperationalError, match='Tiempo de espera'):
+            pool.acquire()
+    # Los cupos vuelven al salir de los bloques
+    with pool.connection(), pool.connection():
+        pass
+
+def test_open_transaction_is_rolled_back_on_return(pool):
+    with pool.connection() as conn:
+        conn.execute('CREATE TABLE t (x INTEGER)')
+        conn.commit()
+        conn.execute('INSERT INTO t VALUES (1)')
+    with pool.connection() as conn:
+        assert not conn.in_transaction
+        assert conn.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 0
+
+def test_broken_connection_is_discarded(pool):
+    with pytest.raises(sqlite3.OperationalError):
+        with pool.connection() as broken:
+            raise sqlite3.OperationalError('disk I/O error')
+    assert pool.open_connections() == 0
+    
+    with pool.connection() as conn:
+        assert conn is not broken
+        assert conn.execute('SELECT 1').fetchone() == (1,)
+
+def test_other_errors_keep_the_connection(pool):
+    with pytest.raises(ValueError):
+        with pool.connection() as kept:
+            raise ValueError('error de la aplicación')
+    with pool.connection() as conn:
+        assert conn is kept
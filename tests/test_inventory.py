@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""Ajuste de stock desde administración y disponibilidad de pizzas"""
+
+import pytest
+
+import app as backend
+
+def pizza_ingredient():
+    """(pizza, ingrediente, stock mínimo, stock actual) de la primera receta"""
+    with backend.db.connection() as conn:
+        return conn.execute('''
+            SELECT pi.pizza_id, i.id, i.min_stock, i.stock
+            FROM pizza_ingredients pi JOIN ingredients i ON i.id = pi.ingredient_id
+            WHERE i.min_stock > 0
+            ORDER BY pi.pizza_id, i.id LIMIT 1
+        ''').fetchone()
+
+def menu_ids(client):
+    return {pizza['id'] for pizza in client.get('/api/menu').get_json()['menu']}
+
+@pytest.mark.parametrize('body', [{'stock': -1}, {'add': -5}, {'stock': 2.5}, {'add': '3'}, {'stock': True}])
+def test_rejects_negative_or_non_integer_stock(client, body):
+    _, ingredient_id, _, stock = pizza_ingredient()
+    
+    response = client.put(f'/api/admin/ingredients/{ingredient_id}/stock', json=body)
+    
+    assert response.status_code == 400
+    assert pizza_ingredient()[3] == stock
+
+def test_lowering_stock_disables_and_restock_reenables(client):
+    pizza_id, ingredient_id, min_stock, stock = pizza_ingredient()
+    assert pizza_id in menu_ids(client)
+    
+    lowered = client.put(f'/api/admin/ingredients/{ingredient_id}/stock', json={'stock': min_stock - 1})
+    assert lowered.status_code == 200
+    assert lowered.get_json()['pizzas_disabled'] >= 1
+    assert pizza_id not in menu_ids(client)
+    
+    restocked = client.put(f'/api/admin/ingredients/{ingredient_id}/stock', json={'stock': stock})
+    assert restocked.get_json()['pizzas_reenabled'] >= 1
+    assert pizza_id in menu_ids(client)
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""Archivo mensual: mover órdenes antiguas, repetir sin efecto y leer desde el archivo"""
+
+import os
+import sqlite3
+
+import app as backend
+
+MONTH = '2020-01'
+
+def insert_old_orders(count):
+    """Órdenes terminadas de MONTH con un item cada una; devuelve sus ids"""
+    ids = []
+    with backend.db.connection() as conn:
+        for day in range(1, count + 1):
+            order_id = conn.execute('''
+                INSERT INTO orders (order_data, total_price, estimated_time, status, created_at, completed_at)
+                VALUES ('[]', 189, 15, 'completed', ?, ?)
+            ''', (f'{MONTH}-{day:02d} 12:00:00', f'{MONTH}-{day:02d} 12:20:00')).lastrowid
+            conn.execute('''
+                INSERT INTO order_items (order_id, line_no, pizza_id, name, size, quantity, unit_price)
+                VALUES (?, 0, 1, 'Margherita', 'mediana', 1, 189)
+            ''', (order_id,))
+            ids.append(order_id)
+    return ids
+
+def main_counts(ids):
+    marks = ', '.join('?' * len(ids))
+    with backend.db.connection() as conn:
+        return (
+            conn.execute(f'SELECT COUNT(*) FROM orders WHERE id IN ({marks})', ids).fetchone()[0],
+            conn.execute(f'SELECT COUNT(*) FROM order_items WHERE order_id IN ({marks})', ids).fetchone()[0]
+        )
+
+def archive_counts(ids):
+    marks = ', '.join('?' * len(ids))
+    path = os.path.join(backend.order_archive.directory, f"orders_{MONTH.replace('-', '_')}.db")
+    with sqlite3.connect(path) as conn:
+        return (
+            conn.execute(f'SELECT COUNT(*) FROM orders WHERE id IN ({marks})', ids).fetchone()[0],
+            conn.execute(f'SELECT COUNT(*) FROM order_items WHERE order_id IN ({marks})', ids).fetchone()[0]
+        )
+
+def archived_month():
+    return {month: count for month, _, count, *_ in backend.order_archive.months()}.get(MONTH)
+
+def test_archive_moves_month_and_is_idempotent(client):
+    before = archived_month() or 0
+    ids = insert_old_orders(3)
+    # Una orden antigua sin terminar no se archiva
+    with backend.db.connection() as conn:
+        pending_id = conn.execute('''
+            INSERT INTO orders (order_data, total_price, status, created_at)
+            VALUES ('[]', 189, 'cooking', ?)
+        ''', (f'{MONTH}-15 12:00:00',)).lastrowid
+    
+    assert backend.order_archive.archive_old_orders() >= 3
+    
+    assert main_counts(ids) == (0, 0)
+    assert archive_counts(ids) == (3, 3)
+    assert archived_month() == before + 3
+    assert main_counts([pending_id]) == (1, 0)
+    
+    # Repetir no mueve ni cuenta nada de nuevo
+    assert backend.order_archive.archive_old_orders() == 0
+    assert archive_counts(ids) == (3, 3)
+    assert archived_month() == before + 3
+
+def test_copied_but_not_deleted_order_is_moved_once(client, monkeypatch):
+    ids = insert_old_orders(1)
+    before = archived_month() or 0
+    begin_immediate = backend.db.begin_immediate
+    
+    # Cortar entre la copia y el borrado: la orden queda en los dos lados
+    def fail_delete(conn, site):
+        if site == 'archive':
+            raise sqlite3.OperationalError('corte simulado')
+        return begin_immediate(conn, site)
+    
+    monkeypatch.setattr(backend.db, 'begin_immediate', fail_delete)
+    try:
+        backend.order_archive.archive_old_orders()
+    except sqlite3.OperationalError:
+        pass
+    assert main_counts(ids) == (1, 1)
+    assert archive_counts(ids) == (1, 1)
+    assert archived_month() == before
+    
+    monkeypatch.setattr(backend.db, 'begin_immediate', begin_immediate)
+    backend.order_archive.archive_old_orders()
+    
+    assert main_counts(ids) == (0, 0)
+    assert archive_counts(ids) == (1, 1)
+    assert archived_month() == before + 1
+
+def test_reads_fall_through_to_archive(client):
+    ids = insert_old_orders(2)
+    backend.order_archive.archive_old_orders()
+    
+    status = client.get(f'/api/orders/{ids[0]}/status')
+    assert status.status_code == 200
+    assert status.get_json()['status'] == 'completed'
+    
+    live = client.get('/api/admin/orders?status=completed&to=2020-01-31&limit=100').get_json()['orders']
+    archived = client.get('/api/admin/orders?status=completed&to=2020-01-31&limit=100&archived=1').get_json()['orders']
+    assert not {order['id'] for order in live} & set(ids)
+    assert set(ids) <= {order['id'] for order in archived}
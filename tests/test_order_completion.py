@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""Completar órdenes vencidas sin retroceder las que ya están cerradas"""
+
+import app as backend
+
+ORDER = {
+    'items': [{'id': 1, 'name': 'Margherita', 'size': 'mediana', 'quantity': 1, 'price': 189}],
+    'total': 189
+}
+
+def completed_count():
+    with backend.db.connection() as conn:
+        return conn.execute('''
+            SELECT COALESCE(SUM(completed_count), 0) FROM sales_rollups WHERE granularity = 'day'
+        ''').fetchone()[0]
+
+def set_status(order_id, status):
+    """Cambiar el estado directamente en la base, como lo haría otro worker"""
+    with backend.db.connection() as conn:
+        conn.execute('UPDATE orders SET status = ? WHERE id = ?', (status, order_id))
+
+def stored_status(order_id):
+    with backend.db.connection() as conn:
+        return conn.execute('SELECT status, completed_at FROM orders WHERE id = ?', (order_id,)).fetchone()
+
+def test_due_completion_keeps_delivered_order(client):
+    manager = backend.order_manager
+    order_id = client.post('/api/orders', json=ORDER).get_json()['order_id']
+    set_status(order_id, 'delivered')
+    before = completed_count()
+    
+    manager.apply_transitions([(order_id, 'completed')])
+    
+    assert stored_status(order_id) == ('delivered', None)
+    assert completed_count() == before
+    assert manager.active_orders.get(order_id) is None
+
+def test_due_completion_closes_active_order(client):
+    manager = backend.order_manager
+    order_id = client.post('/api/orders', json=ORDER).get_json()['order_id']
+    before = completed_count()
+    
+    manager.apply_transitions([(order_id, 'completed')])
+    
+    status, completed_at = stored_status(order_id)
+    assert status == 'completed' and completed_at is not None
+    assert completed_count() == before + 1
+    assert manager.active_orders.get(order_id) is None
+
+def test_rehydrated_order_delivered_elsewhere_is_not_completed(client):
+    with backend.db.connection() as conn:
+        order_id = conn.execute('''
+            INSERT INTO orders (order_data, total_price, estimated_time, status, created_at)
+            VALUES ('[]', 189, 30, 'cooking', CURRENT_TIMESTAMP)
+        ''').lastrowid
+    
+    # Un reinicio en caliente recupera la orden desde la base
+    manager = backend.OrderManager(backend.db, backend.OrderEventBus(), backend.sales_analytics,
+                                   backend.recipe_index, backend.menu_cache)
+    assert manager.active_orders.get(order_id).status == 'cooking'
+    
+    set_status(order_id, 'delivered')
+    before = completed_count()
+    manager.apply_transitions([(order_id, 'completed')])
+    
+    assert stored_status(order_id) == ('delivered', None)
+    assert completed_count() == before
+    assert manager.active_orders.get(order_id) is None
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""Seguimiento de órdenes: ETag/304, espera larga y cache de órdenes terminadas"""
+
+import threading
+import time
+
+import app as backend
+
+ORDER = {
+    'items': [{'id': 1, 'name': 'Margherita', 'size': 'mediana', 'quantity': 1, 'price': 189}],
+    'total': 189
+}
+
+def new_order(client):
+    return client.post('/api/orders', json=ORDER).get_json()['order_id']
+
+def test_matching_etag_returns_304(client):
+    order_id = new_order(client)
+    first = client.get(f'/api/orders/{order_id}/status')
+    
+    second = client.get(f'/api/orders/{order_id}/status', headers={'If-None-Match': first.headers['ETag']})
+    
+    assert first.status_code == 200
+    assert second.status_code == 304
+    assert second.headers['ETag'] == first.headers['ETag']
+    assert second.data == b''
+
+def test_etag_changes_with_payload(client):
+    order_id = new_order(client)
+    etag = client.get(f'/api/orders/{order_id}/status').headers['ETag']
+    
+    # Cambia el tiempo estimado sin cambiar el estado
+    backend.order_manager.active_orders.get(order_id).set_estimated_time(90)
+    response = client.get(f'/api/orders/{order_id}/status', headers={'If-None-Match': etag})
+    
+    assert response.status_code == 200
+    assert response.get_json()['estimated_time'] == 90
+    assert response.headers['ETag'] != etag
+
+def test_wait_returns_early_on_status_change(client):
+    order_id = new_order(client)
+    etag = client.get(f'/api/orders/{order_id}/status').headers['ETag']
+    lane = backend.admission.lanes['read']
+    in_flight = []
+    
+    def advance():
+        time.sleep(0.2)
+        # La petición en espera no ocupa un cupo del carril de lectura
+        in_flight.append(lane.active)
+        backend.app.test_client().put(f'/api/orders/{order_id}/status', json={'status': 'ready'})
+    
+    thread = threading.Thread(target=advance)
+    thread.start()
+    started = time.monotonic()
+    response = client.get(f'/api/orders/{order_id}/status?wait=5', headers={'If-None-Match': etag})
+    thread.join()
+    
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'ready'
+    assert time.monotonic() - started < 2
+    assert in_flight == [0]
+    assert lane.active == 0
+
+def test_wait_times_out_with_304(client):
+    order_id = new_order(client)
+    backend.app.test_client().put(f'/api/orders/{order_id}/status', json={'status': 'cooking'})
+    etag = client.get(f'/api/orders/{order_id}/status').headers['ETag']
+    
+    started = time.monotonic()
+    response = client.get(f'/api/orders/{order_id}/status?wait=0.3', headers={'If-None-Match': etag})
+    
+    assert response.status_code == 304
+    assert 0.3 <= time.monotonic() - started < 2
+    assert backend.admission.lanes['read'].active == 0
+    assert not backend.order_manager.tracker._watchers
+
+def test_terminal_order_served_from_cache(client, monkeypatch):
+    order_id = new_order(client)
+    client.put(f'/api/orders/{order_id}/status', json={'status': 'completed'})
+    assert client.get(f'/api/orders/{order_id}/status').get_json()['status'] == 'completed'
+    
+    def no_database(*args, **kwargs):
+        raise AssertionError('la orden terminada no debe consultar la base')
+    
+    monkeypatch.setattr(backend.db, 'execute_with_retry', no_database)
+    response = client.get(f'/api/orders/{order_id}/status')
+    
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'completed'
+
+def test_status_change_invalidates_terminal_cache(client):
+    order_id = new_order(client)
+    client.put(f'/api/orders/{order_id}/status', json={'status': 'completed'})
+    etag = client.get(f'/api/orders/{order_id}/status').headers['ETag']
+    
+    client.put(f'/api/orders/{order_id}/status', json={'status': 'delivered'})
+    response = client.get(f'/api/orders/{order_id}/status', headers={'If-None-Match': etag})
+    
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'delivered'
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""Escritor de órdenes: una espera agotada no pierde ni duplica la orden"""
+
+import threading
+import time
+
+import app as backend
+
+ORDER = {
+    'items': [{'id': 1, 'name': 'Margherita', 'size': 'mediana', 'quantity': 1, 'price': 189}],
+    'total': 189
+}
+
+def order_count():
+    with backend.db.connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM orders').fetchone()[0]
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'condición no cumplida a tiempo'
+        time.sleep(0.01)
+
+def test_stalled_writer_returns_503_and_finishes_order_later(client, monkeypatch):
+    writer = backend.order_manager.writer
+    commit = writer._commit
+    release = threading.Event()
+    
+    def stalled_commit(batch):
+        release.wait(5)
+        return commit(batch)
+    
+    monkeypatch.setattr(writer, '_commit', stalled_commit)
+    monkeypatch.setattr(backend, 'ORDER_WRITE_TIMEOUT', 0.1)
+    before = order_count()
+    cursor = backend.order_events.last_id
+    
+    response = client.post('/api/orders', json=ORDER)
+    
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert response.get_json()['status'] == 'pending'
+    
+    release.set()
+    # finish_order corre al confirmarse la escritura y anuncia la orden
+    wait_until(lambda: any(event_type == 'order_created'
+                           for _, event_type, _ in backend.order_events.wait_for_events(cursor, 0)))
+    assert order_count() == before + 1
+    assert writer._thread.is_alive()
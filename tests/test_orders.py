@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""Validación de órdenes antes de reservar stock"""
+
+import pytest
+
+import app as backend
+
+def ingredient_stock():
+    with backend.db.connection() as conn:
+        return dict(conn.execute('SELECT id, stock FROM ingredients').fetchall())
+
+def order_with_quantity(quantity):
+    return {
+        'items': [{'id': 1, 'name': 'Margherita', 'size': 'mediana', 'quantity': quantity, 'price': 189}],
+        'total': 189
+    }
+
+@pytest.mark.parametrize('quantity', [-3, 0, 1.5, '2', True])
+def test_create_order_rejects_invalid_quantity(client, quantity):
+    before = ingredient_stock()
+    
+    response = client.post('/api/orders', json=order_with_quantity(quantity))
+    
+    assert response.status_code == 400
+    assert 'cantidad' in response.get_json()['error']
+    assert ingredient_stock() == before
+
+def test_batch_rejects_invalid_quantity_per_order(client):
+    before = ingredient_stock()
+    
+    response = client.post('/api/orders/batch', json={'orders': [order_with_quantity(-2), order_with_quantity(0)]})
+    
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert [result['status'] for result in results] == ['error', 'error']
+    assert ingredient_stock() == before
+
+def test_valid_quantity_reserves_stock(client):
+    before = ingredient_stock()
+    
+    response = client.post('/api/orders', json=order_with_quantity(2))
+    
+    assert response.status_code == 200
+    after = ingredient_stock()
+    assert all(after[ingredient_id] <= stock for ingredient_id, stock in before.items())
+    assert after != before
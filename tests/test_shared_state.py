@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""Varios workers sobre la misma base: concesión del líder y registro order_changes"""
+
+import pytest
+
+import app as backend
+
+ORDER = {
+    'items': [{'id': 1, 'name': 'Margherita', 'size': 'mediana', 'quantity': 1, 'price': 189}],
+    'total': 189
+}
+
+@pytest.fixture
+def workers(tmp_path):
+    """Dos OrderManager en modo compartido, como dos procesos de serve.py"""
+    db = backend.PizzaDePrizzaDB(str(tmp_path / 'shared.db'))
+    
+    def worker():
+        return backend.OrderManager(db, backend.OrderEventBus(), backend.SalesAnalytics(db),
+                                    backend.RecipeIndex(db), backend.MenuCache(db), shared_state=True)
+    
+    yield worker(), worker()
+    db.close()
+
+def expire_lease(manager):
+    """Simular un líder que dejó de renovar su concesión"""
+    with manager.db.connection() as conn:
+        conn.execute("UPDATE worker_leases SET expires_at = 0 WHERE name = 'order_processor'")
+
+def test_lease_acquire_expire_and_takeover(workers):
+    first, second = workers
+    
+    assert first.renew_leadership() is True
+    assert second.renew_leadership() is False
+    # Renovar la propia concesión vigente
+    assert first.renew_leadership() is True
+    
+    expire_lease(first)
+    assert second.renew_leadership() is True
+    assert first.renew_leadership() is False
+    assert (first.is_leader, second.is_leader) == (False, True)
+
+def test_released_lease_is_taken_immediately(workers):
+    first, second = workers
+    first.renew_leadership()
+    
+    first.release_leadership()
+    
+    assert second.renew_leadership() is True
+
+def test_changes_reach_other_worker_through_order_changes(workers):
+    first, second = workers
+    cursor = second.events.last_id
+    
+    order = first.add_order(ORDER)
+    assert second.active_orders.get(order.id) is None
+    assert second.sync_shared_state() >= 1
+    assert second.active_orders.get(order.id) is not None
+    
+    first.update_order_status(order.id, 'cooking')
+    second.sync_shared_state()
+    assert second.active_orders.get(order.id).status == 'cooking'
+    
+    first.update_order_status(order.id, 'completed')
+    second.sync_shared_state()
+    assert second.active_orders.get(order.id) is None
+    
+    events = [event_type for _, event_type, _ in second.events.wait_for_events(cursor, 0)]
+    assert events == ['order_created', 'order_status', 'order_completed']
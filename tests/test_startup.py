@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""Arranque en frío: create_app(start_background=False) no arranca hilos ni escribe"""
+
+import os
+import sqlite3
+import subprocess
+import sys
+
+import benchmark
+
+def test_cold_start_has_no_side_effects():
+    # El objetivo de tiempo lo verifica `python benchmark.py --cold-start`, no esta suite
+    fresh, warm = benchmark.measure_cold_start(runs=1)
+    
+    assert not fresh['db_on_import']
+    assert all(sample['threads'] == 1 for sample in [fresh] + warm)
+
+def test_startup_without_background_leaves_overdue_orders(tmp_path):
+    env = dict(os.environ, PIZZA_DB=str(tmp_path / 'startup.db'), PIZZA_ARCHIVE_DIR=str(tmp_path / 'archive'))
+    probe = 'import app; app.create_app(start_background=False); print(len(app.order_manager.active_orders))'
+    
+    def start():
+        output = subprocess.check_output([sys.executable, '-c', probe], cwd=benchmark.ROOT, env=env)
+        return int(output.decode().strip().splitlines()[-1])
+    
+    start()
+    with sqlite3.connect(env['PIZZA_DB']) as conn:
+        conn.execute('''
+            INSERT INTO orders (id, order_data, total_price, estimated_time, status, created_at)
+            VALUES (1, '[]', 189, 15, 'received', datetime('now', '-2 hours'))
+        ''')
+    
+    assert start() == 0
+    with sqlite3.connect(env['PIZZA_DB']) as conn:
+        assert conn.execute('SELECT status, completed_at FROM orders WHERE id = 1').fetchone() == ('received', None)